@@ -0,0 +1,127 @@
+# backend/audit_log_writer.py
+"""
+Buffered writer for activity_log rows.
+
+log_activity enqueues fully built rows (id and created_at assigned at enqueue time)
+into a bounded in-process buffer; a daemon thread drains it in batches with a
+multi-row INSERT on its own connection, so requests no longer pay for a second
+transaction. When the buffer is full, enqueue() refuses the row and the caller
+falls back to a synchronous write (back-pressure instead of silent loss). Whatever
+is still buffered is flushed at interpreter exit.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import insert
+
+from config import config
+from database import get_engine
+from models import ActivityLog
+
+logger = structlog.get_logger(__name__)
+
+AUDIT_LOG_QUEUE_DEPTH = Gauge("audit_log_queue_depth", "Activity log entries waiting to be written.")
+AUDIT_LOG_WRITTEN = Counter("audit_log_written_total", "Activity log entries written by the buffered writer.")
+AUDIT_LOG_DROPPED = Counter("audit_log_dropped_total", "Activity log entries dropped after repeated write failures.")
+AUDIT_LOG_SYNC_FALLBACK = Counter("audit_log_sync_fallback_total",
+                                  "Activity log entries written synchronously because the buffer was full.")
+
+_WRITE_ATTEMPTS = 3
+_RETRY_DELAY_SECONDS = 0.5
+
+
+class AuditLogWriter:
+    """Bounded buffer plus background flusher for activity_log rows."""
+
+    def __init__(self, max_entries: int, batch_size: int, flush_interval: float):
+        self._max_entries = max_entries
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = False
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Queues a row; returns False if the buffer is full and the caller must write it itself."""
+        with self._cond:
+            if len(self._buffer) >= self._max_entries:
+                AUDIT_LOG_SYNC_FALLBACK.inc()
+                return False
+            self._buffer.append(row)
+            AUDIT_LOG_QUEUE_DEPTH.set(len(self._buffer))
+            self._ensure_thread()
+            if len(self._buffer) >= self._batch_size:
+                self._cond.notify()
+        return True
+
+    def flush(self) -> None:
+        """Writes everything currently buffered on the calling thread."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write_batch(batch)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        # Called with the condition held. Threads do not survive fork, so restart per process.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            batch = [self._buffer.popleft() for _ in range(min(self._batch_size, len(self._buffer)))]
+            AUDIT_LOG_QUEUE_DEPTH.set(len(self._buffer))
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._buffer and not self._stopping:
+                    self._cond.wait(self._flush_interval)
+                if self._stopping:
+                    return # shutdown() flushes the remainder
+            batch = self._take_batch()
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for attempt in range(1, _WRITE_ATTEMPTS + 1):
+            try:
+                with get_engine().begin() as conn:
+                    conn.execute(insert(ActivityLog.__table__), batch)
+                AUDIT_LOG_WRITTEN.inc(len(batch))
+                logger.debug("Flushed activity log batch.", entries=len(batch))
+                return
+            except Exception as e:
+                logger.error("Failed to write activity log batch.", entries=len(batch), attempt=attempt,
+                             error=str(e), exc_info=False)
+                if attempt < _WRITE_ATTEMPTS and not self._stopping:
+                    time.sleep(_RETRY_DELAY_SECONDS * attempt)
+                else:
+                    break
+        AUDIT_LOG_DROPPED.inc(len(batch))
+
+
+audit_log_writer = AuditLogWriter(config.AUDIT_LOG_BUFFER_SIZE, config.AUDIT_LOG_BATCH_SIZE,
+                                  config.AUDIT_LOG_FLUSH_INTERVAL)
+atexit.register(audit_log_writer.shutdown)
@@ -0,0 +1,62 @@
+# backend/blueprints/batch.py
+import uuid
+import structlog
+from flask import Blueprint, request, jsonify, g, session, abort
+from werkzeug.exceptions import HTTPException
+
+from decorators import require_tree_access
+from services.batch_service import create_people_batch_db, create_relationships_batch_db, create_events_batch_db
+
+logger = structlog.get_logger(__name__)
+# No url_prefix: the ":batch" routes sit beside their collections (/api/people:batch, ...)
+batch_bp = Blueprint('batch_api', __name__)
+
+def _batch_items():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'items' not in data:
+        abort(400, "Request body must be an object with an 'items' list.")
+    return data['items']
+
+def _batch_response(result):
+    # 201 when every item was created, 207 Multi-Status when some items were rejected
+    return jsonify(result), 207 if result.get("errors") else 201
+
+@batch_bp.route('/api/people:batch', methods=['POST'])
+@require_tree_access('edit')
+def create_people_batch_endpoint():
+    items = _batch_items(); user_id = uuid.UUID(session['user_id'])
+    db = g.db; tree_id = g.active_tree_id
+    logger.info("Batch create people", tree_id=tree_id, user_id=user_id, count=len(items) if isinstance(items, list) else None)
+    try:
+        return _batch_response(create_people_batch_db(db, user_id, tree_id, items, ip_address=request.remote_addr,
+                                                      user_agent=request.user_agent.string))
+    except Exception as e:
+        logger.error("Error in create_people_batch.", tree_id=tree_id, user_id=user_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error batch creating people.")
+        raise
+
+@batch_bp.route('/api/relationships:batch', methods=['POST'])
+@require_tree_access('edit')
+def create_relationships_batch_endpoint():
+    items = _batch_items(); user_id = uuid.UUID(session['user_id'])
+    db = g.db
+    logger.info("Batch create relationships", active_tree_id=g.active_tree_id, user_id=user_id)
+    try:
+        return _batch_response(create_relationships_batch_db(db, user_id, items))
+    except Exception as e:
+        logger.error("Error in create_relationships_batch.", user_id=user_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error batch creating relationships.")
+        raise
+
+@batch_bp.route('/api/events:batch', methods=['POST'])
+@require_tree_access('edit')
+def create_events_batch_endpoint():
+    items = _batch_items(); user_id = uuid.UUID(session['user_id'])
+    db = g.db
+    logger.info("Batch create events", active_tree_id=g.active_tree_id, user_id=user_id)
+    try:
+        return _batch_response(create_events_batch_db(db, user_id, items))
+    except Exception as e:
+        logger.error("Error in create_events_batch.", user_id=user_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error batch creating events.")
+        raise
@@ -0,0 +1,30 @@
+# backend/blueprints/diagnostics.py
+import structlog
+from flask import Blueprint, request, jsonify, abort
+from werkzeug.exceptions import HTTPException
+
+from decorators import require_admin
+from slow_query_log import slow_query_log
+
+logger = structlog.get_logger(__name__)
+diagnostics_bp = Blueprint('diagnostics_api', __name__, url_prefix='/api/admin')
+
+@diagnostics_bp.route('/slow-queries', methods=['GET'])
+@require_admin
+def get_slow_queries_endpoint():
+    limit = request.args.get('limit', type=int)
+    logger.info("Admin: Get slow queries", limit=limit)
+    try:
+        entries = slow_query_log.entries(limit)
+        return jsonify({"threshold_ms": slow_query_log.threshold_seconds * 1000, "items": entries}), 200
+    except Exception as e:
+        logger.error("Admin: Error fetching slow queries.", exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error fetching slow queries.")
+        raise
+
+@diagnostics_bp.route('/slow-queries', methods=['DELETE'])
+@require_admin
+def clear_slow_queries_endpoint():
+    logger.info("Admin: Clear slow queries")
+    slow_query_log.clear()
+    return '', 204
@@ -9,7 +9,7 @@ from services.event_service import (
     create_event_db, get_event_db, update_event_db, delete_event_db,
     get_events_for_person_db, get_events_for_tree_db # Ensure these are available if routes are added
 )
-from utils import get_pagination_params
+from utils import get_pagination_params, get_fields_param
 
 logger = structlog.get_logger(__name__)
 events_bp = Blueprint('events_api', __name__, url_prefix='/api/events')
@@ -64,7 +64,7 @@ def get_event_endpoint(event_id_param: uuid.UUID):
     # Actual authorization: can user view this specific event? (Phase 4)
     # For now, service get_event_db fetches globally.
     try:
-        event_dict = get_event_db(db_session, event_id_param)
+        event_dict = get_event_db(db_session, event_id_param, fields=get_fields_param())
         return jsonify(event_dict), 200
     except HTTPException as e:
         raise
@@ -9,7 +9,7 @@ from werkzeug.exceptions import HTTPException # Added for abort context
 
 from extensions import limiter
 # Import get_db_session from the database module
-from database import get_db_session, get_session_factory # get_session_factory for remove()
+from database import get_db_session, get_session_factory, pool_status # get_session_factory for remove()
 
 logger = structlog.get_logger(__name__)
 health_bp = Blueprint('health_api', __name__)
@@ -53,7 +53,8 @@ def health_check_endpoint():
         end_time_db_check = time.monotonic()
         db_latency_ms = (end_time_db_check - start_time_db_check) * 1000
 
-    dependencies["database"] = {"status": db_status, "latency_ms": round(db_latency_ms, 2) if db_latency_ms is not None else None}
+    dependencies["database"] = {"status": db_status, "latency_ms": round(db_latency_ms, 2) if db_latency_ms is not None else None,
+                                "pool": pool_status()}
     
     response_data = {"status": service_status, "timestamp": datetime.utcnow().isoformat() + "Z", "dependencies": dependencies}
     http_status_code = 200 if service_status == "healthy" else 503
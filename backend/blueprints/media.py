@@ -13,7 +13,7 @@ from services.media_service import (
     get_media_for_entity_db
 )
 from models import MediaTypeEnum # For parsing optional file_type from form
-from utils import get_pagination_params
+from utils import get_pagination_params, get_fields_param
 
 logger = structlog.get_logger(__name__)
 media_bp = Blueprint('media_api', __name__, url_prefix='/api/media')
@@ -35,7 +35,7 @@ def get_media_item_endpoint(media_id_param: uuid.UUID):
     logger.info("Get media item endpoint", media_id=media_id_param, active_tree_id_context=active_tree_id)
     # Service get_media_item_db fetches globally. active_tree_id is for auth context if needed by decorator.
     try:
-        media_item_dict = get_media_item_db(db_session, media_id_param) # Removed active_tree_id
+        media_item_dict = get_media_item_db(db_session, media_id_param, fields=get_fields_param()) # Removed active_tree_id
         return jsonify(media_item_dict), 200
     except HTTPException as e: # Propagate HTTP exceptions (like 404 from _get_or_404)
         raise
@@ -151,7 +151,7 @@ def get_media_for_entity_endpoint(entity_type: str, entity_id_param: uuid.UUID):
             entity_id=entity_id_param,
             page=page, per_page=per_page, 
             sort_by=sort_by, sort_order=sort_order,
-            tree_id_context=active_tree_id
+            tree_id_context=active_tree_id, fields=get_fields_param()
         )
         return jsonify(media_list_dict), 200
     except HTTPException as e:
@@ -4,15 +4,16 @@ import structlog
 from flask import Blueprint, request, jsonify, g, session, abort
 from werkzeug.exceptions import HTTPException
 
-from decorators import require_tree_access, require_auth # require_auth might be implicitly handled by require_tree_access depending on its impl.
+from decorators import require_tree_access, require_auth, tree_etag # require_auth might be implicitly handled by require_tree_access depending on its impl.
 from services.person_service import (
     get_all_people_db, get_person_db, create_person_db,
-    update_person_db, delete_person_db,
+    update_person_db, delete_person_db, merge_people_db,
     upload_profile_picture_db
 )
 from services.media_service import get_media_for_entity_db # Added for person media
 from services.event_service import get_events_for_person_db # Added for person events
-from utils import get_pagination_params
+from services.sibling_service import get_inferred_siblings_db
+from utils import get_pagination_params, get_fields_param, get_include_param
 # werkzeug.utils.secure_filename is imported in service now
 
 logger = structlog.get_logger(__name__)
@@ -20,6 +21,7 @@ people_bp = Blueprint('people_api', __name__, url_prefix='/api/people')
 
 @people_bp.route('', methods=['GET'])
 @require_tree_access('view')
+@tree_etag
 def get_all_people_endpoint():
     db = g.db; tree_id = g.active_tree_id
     page, per_page, sort_by, sort_order = get_pagination_params()
@@ -59,9 +61,13 @@ def get_all_people_endpoint():
                      key_present=custom_fields_key is not None, value_present=custom_fields_value is not None)
 
 
-    logger.info("Get all people", tree_id=tree_id, page=page, per_page=per_page, filters=filters)
+    fields = get_fields_param()
+    include = get_include_param()
+
+    logger.info("Get all people", tree_id=tree_id, page=page, per_page=per_page, filters=filters, fields=fields, include=include)
     try:
-        return jsonify(get_all_people_db(db, tree_id, page, per_page, sort_by, sort_order, filters=filters)), 200
+        return jsonify(get_all_people_db(db, tree_id, page, per_page, sort_by, sort_order, filters=filters,
+                                         fields=fields, include=include)), 200
     except Exception as e:
         logger.error("Error in get_all_people.", tree_id=tree_id, exc_info=True)
         if not isinstance(e, HTTPException): abort(500, "Error fetching people.")
@@ -69,11 +75,14 @@ def get_all_people_endpoint():
 
 @people_bp.route('/<uuid:person_id_param>', methods=['GET'])
 @require_tree_access('view')
+@tree_etag
 def get_person_endpoint(person_id_param: uuid.UUID):
     db = g.db; tree_id = g.active_tree_id
-    logger.info("Get person", person_id=person_id_param, tree_id=tree_id)
+    fields = get_fields_param()
+    include = get_include_param()
+    logger.info("Get person", person_id=person_id_param, tree_id=tree_id, fields=fields, include=include)
     try:
-        return jsonify(get_person_db(db, person_id_param, tree_id)), 200
+        return jsonify(get_person_db(db, person_id_param, tree_id, fields=fields, include=include)), 200
     except Exception as e:
         logger.error("Error in get_person.", person_id=person_id_param, tree_id=tree_id, exc_info=True)
         if not isinstance(e, HTTPException): abort(500, "Error fetching person details.")
@@ -120,6 +129,24 @@ def delete_person_endpoint(person_id_param: uuid.UUID):
         if not isinstance(e, HTTPException): abort(500, "Error deleting person.")
         raise
 
+@people_bp.route('/<uuid:person_id_param>/merge', methods=['POST'])
+@require_tree_access('edit')
+def merge_person_endpoint(person_id_param: uuid.UUID):
+    data = request.get_json(silent=True) or {}
+    try:
+        merge_id = uuid.UUID(str(data.get('merge_person_id')))
+    except ValueError:
+        abort(400, description={"message": "Validation failed", "details": {"merge_person_id": "A valid person UUID is required."}})
+    db = g.db; tree_id = uuid.UUID(str(g.active_tree_id)); user_id = uuid.UUID(session['user_id'])
+    logger.info("Merge person", keep_id=person_id_param, merge_id=merge_id, tree_id=tree_id, user_id=user_id)
+    try:
+        return jsonify(merge_people_db(db, person_id_param, merge_id, tree_id, actor_user_id=user_id,
+                                       ip_address=request.remote_addr, user_agent=request.user_agent.string)), 200
+    except Exception as e:
+        logger.error("Error in merge_person.", keep_id=person_id_param, merge_id=merge_id, tree_id=tree_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error merging people.")
+        raise
+
 @people_bp.route('/<uuid:person_id_param>/profile_picture', methods=['POST'])
 @require_auth # Ensure user is logged in
 @require_tree_access('edit') # Ensures user has edit rights for the tree this person belongs to
@@ -184,7 +211,7 @@ def get_person_media_endpoint(person_id_param: uuid.UUID):
         media_list_dict = get_media_for_entity_db(
             db=db_session, entity_type="Person", entity_id=person_id_param,
             page=page, per_page=per_page, sort_by=sort_by, sort_order=sort_order,
-            tree_id_context=active_tree_id 
+            tree_id_context=active_tree_id, fields=get_fields_param()
         )
         return jsonify(media_list_dict), 200
     except HTTPException as e:
@@ -212,7 +239,8 @@ def get_person_events_endpoint(person_id_param: uuid.UUID):
     try:
         events_list_dict = get_events_for_person_db(
             db=db_session, person_id=person_id_param,
-            page=page, per_page=per_page, sort_by=sort_by, sort_order=sort_order
+            page=page, per_page=per_page, sort_by=sort_by, sort_order=sort_order,
+            fields=get_fields_param()
             # tree_id_context=active_tree_id if needed by service for auth, but not for query logic
         )
         return jsonify(events_list_dict), 200
@@ -222,3 +250,18 @@ def get_person_events_endpoint(person_id_param: uuid.UUID):
         logger.error("Error in get_person_events_endpoint", exc_info=True)
         abort(500, description="Error fetching events for person.")
     return {}
+
+@people_bp.route('/<uuid:person_id_param>/siblings', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+def get_person_siblings_endpoint(person_id_param: uuid.UUID):
+    tree_id = g.active_tree_id
+    logger.info("Get inferred siblings for person endpoint", person_id=person_id_param, tree_id=tree_id)
+    try:
+        return jsonify(get_inferred_siblings_db(g.db, person_id_param, tree_id)), 200
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error("Error in get_person_siblings_endpoint", exc_info=True)
+        abort(500, description="Error fetching siblings for person.")
+    return {}
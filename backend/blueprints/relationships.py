@@ -4,18 +4,19 @@ import structlog
 from flask import Blueprint, request, jsonify, g, session, abort
 from werkzeug.exceptions import HTTPException
 
-from decorators import require_tree_access
+from decorators import require_tree_access, tree_etag
 from services.relationship_service import (
     get_all_relationships_db, get_relationship_db, create_relationship_db,
     update_relationship_db, delete_relationship_db
 )
-from utils import get_pagination_params
+from utils import get_pagination_params, get_fields_param
 
 logger = structlog.get_logger(__name__)
 relationships_bp = Blueprint('relationships_api', __name__, url_prefix='/api/relationships')
 
 @relationships_bp.route('', methods=['GET'])
 @require_tree_access('view')
+@tree_etag
 def get_all_relationships_endpoint():
     db = g.db; tree_id = g.active_tree_id
     page, per_page, sort_by, sort_order = get_pagination_params()
@@ -23,9 +24,12 @@ def get_all_relationships_endpoint():
     filters = {}
     if request.args.get('person_id'): filters['person_id'] = request.args.get('person_id', type=str)
     if request.args.get('relationship_type'): filters['relationship_type'] = request.args.get('relationship_type', type=str)
-    logger.info("Get all relationships", tree_id=tree_id, page=page, per_page=per_page, filters=filters)
+    fields = get_fields_param()
+    after = request.args.get('after', type=str) # Keyset pagination cursor; empty for the first page
+    logger.info("Get all relationships", tree_id=tree_id, page=page, per_page=per_page, filters=filters, fields=fields)
     try:
-        return jsonify(get_all_relationships_db(db, tree_id, page, per_page, sort_by, sort_order, filters=filters)), 200
+        return jsonify(get_all_relationships_db(db, tree_id, page, per_page, sort_by, sort_order, filters=filters,
+                                                fields=fields, after=after)), 200
     except Exception as e:
         logger.error("Error in get_all_relationships.", tree_id=tree_id, exc_info=True)
         if not isinstance(e, HTTPException): abort(500, "Error fetching relationships.")
@@ -39,7 +43,7 @@ def get_relationship_endpoint(relationship_id_param: uuid.UUID):
     logger.info("Get relationship", relationship_id=relationship_id_param, active_tree_id_context=active_tree_id)
     # Relationship is global, service fetches by ID. Tree context is for auth.
     try:
-        return jsonify(get_relationship_db(db, relationship_id_param)), 200
+        return jsonify(get_relationship_db(db, relationship_id_param, fields=get_fields_param())), 200
     except Exception as e:
         logger.error("Error in get_relationship.", relationship_id=relationship_id_param, active_tree_id_context=active_tree_id, exc_info=True)
         if not isinstance(e, HTTPException): abort(500, "Error fetching relationship details.")
@@ -1,19 +1,24 @@
 # backend/blueprints/trees.py
 import uuid
 import structlog
-from flask import Blueprint, request, jsonify, g, session, abort
+from flask import Blueprint, request, jsonify, g, session, abort, Response, stream_with_context
 from werkzeug.exceptions import HTTPException
 
-from decorators import require_auth, require_tree_access
+from decorators import require_auth, require_tree_access, tree_etag
 from services.tree_service import (
     create_tree_db, get_user_trees_db,
     get_tree_data_for_visualization_db,
     upload_tree_cover_image_db,
-    add_person_to_tree_db, remove_person_from_tree_db # Added new services
+    add_person_to_tree_db, remove_person_from_tree_db, # Added new services
+    export_tree_ndjson_db
 )
 from services.media_service import get_media_for_entity_db # Added for tree media
 from services.event_service import get_events_for_tree_db # Added for tree events
-from utils import get_pagination_params
+from services.tree_version_service import get_tree_changes_db
+from services.family_service import get_tree_families_db
+from services.gedcom_export_service import export_tree_gedcom_db, GEDCOM_MIMETYPE
+from services.gedcom_import_service import create_gedcom_import_db, get_gedcom_import_db, resume_gedcom_import_db
+from utils import get_pagination_params, get_fields_param
 # werkzeug.utils.secure_filename is imported in service now
 from extensions import limiter
 from models import Tree, TreeAccess, TreePrivacySettingEnum # For direct query in set_active_tree, added TreePrivacySettingEnum explicitly
@@ -77,6 +82,7 @@ def set_active_tree_endpoint():
 @trees_bp.route('/tree_data', methods=['GET'])
 @require_tree_access('view')
 @limiter.limit("1200 per minute")  # Increased to 1200 per minute to prevent rate limiting
+@tree_etag
 def get_tree_data_endpoint():
     db = g.db; tree_id = g.active_tree_id
     page, per_page, sort_by, sort_order = get_pagination_params()
@@ -109,6 +115,115 @@ def get_tree_data_endpoint():
         if not isinstance(e, HTTPException): abort(500, "Error fetching tree data for visualization.")
         raise
 
+@trees_bp.route('/trees/<uuid:tree_id_param>/export.ndjson', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+@limiter.limit("10 per minute")
+@tree_etag
+def export_tree_ndjson_endpoint(tree_id_param: uuid.UUID):
+    db = g.db
+    logger.info("Export tree as NDJSON", tree_id=tree_id_param)
+    try:
+        lines = export_tree_ndjson_db(db, tree_id_param)
+        response = Response(stream_with_context(lines), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = f'attachment; filename="tree-{tree_id_param}.ndjson"'
+        return response
+    except Exception as e:
+        logger.error("Error starting NDJSON export.", tree_id=tree_id_param, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error exporting tree.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/export.ged', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+@limiter.limit("10 per minute")
+@tree_etag
+def export_tree_gedcom_endpoint(tree_id_param: uuid.UUID):
+    db = g.db
+    logger.info("Export tree as GEDCOM", tree_id=tree_id_param)
+    try:
+        chunks = export_tree_gedcom_db(db, tree_id_param)
+        response = Response(stream_with_context(chunks), mimetype=GEDCOM_MIMETYPE)
+        response.headers['Content-Disposition'] = f'attachment; filename="tree-{tree_id_param}.ged"'
+        return response
+    except Exception as e:
+        logger.error("Error starting GEDCOM export.", tree_id=tree_id_param, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error exporting tree.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/changes', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+def get_tree_changes_endpoint(tree_id_param: uuid.UUID):
+    db = g.db
+    since = request.args.get('since', type=int)
+    if since is None:
+        abort(400, description={"message": "Validation failed", "details": {"since": "An integer tree version is required."}})
+    logger.info("Get tree changes", tree_id=tree_id_param, since=since)
+    try:
+        return jsonify(get_tree_changes_db(db, tree_id_param, since)), 200
+    except Exception as e:
+        logger.error("Error fetching tree changes.", tree_id=tree_id_param, since=since, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error fetching tree changes.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/families', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+@tree_etag
+def get_tree_families_endpoint(tree_id_param: uuid.UUID):
+    db = g.db
+    page, per_page, _, _ = get_pagination_params()
+    logger.info("Get family units for tree", tree_id=tree_id_param, page=page, per_page=per_page)
+    try:
+        return jsonify(get_tree_families_db(db, tree_id_param, page, per_page)), 200
+    except Exception as e:
+        logger.error("Error fetching family units.", tree_id=tree_id_param, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error fetching families.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/imports', methods=['POST'])
+@require_auth
+@require_tree_access('edit')
+@limiter.limit("10 per hour")
+def create_gedcom_import_endpoint(tree_id_param: uuid.UUID):
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        abort(400, description={"message": "Validation failed", "details": {"file": "A GEDCOM file is required."}})
+    user_id = uuid.UUID(session['user_id']); db = g.db
+    logger.info("Create GEDCOM import", tree_id=tree_id_param, user_id=user_id, filename=file.filename)
+    try:
+        return jsonify(create_gedcom_import_db(db, user_id, tree_id_param, file.stream, file.filename)), 202
+    except Exception as e:
+        logger.error("Error creating GEDCOM import.", tree_id=tree_id_param, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error starting GEDCOM import.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/imports/<uuid:job_id>', methods=['GET'])
+@require_auth
+@require_tree_access('view')
+def get_gedcom_import_endpoint(tree_id_param: uuid.UUID, job_id: uuid.UUID):
+    db = g.db
+    try:
+        return jsonify(get_gedcom_import_db(db, tree_id_param, job_id)), 200
+    except Exception as e:
+        logger.error("Error fetching GEDCOM import.", tree_id=tree_id_param, job_id=job_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error fetching GEDCOM import.")
+        raise
+
+@trees_bp.route('/trees/<uuid:tree_id_param>/imports/<uuid:job_id>/resume', methods=['POST'])
+@require_auth
+@require_tree_access('edit')
+def resume_gedcom_import_endpoint(tree_id_param: uuid.UUID, job_id: uuid.UUID):
+    db = g.db
+    logger.info("Resume GEDCOM import", tree_id=tree_id_param, job_id=job_id)
+    try:
+        return jsonify(resume_gedcom_import_db(db, tree_id_param, job_id)), 202
+    except Exception as e:
+        logger.error("Error resuming GEDCOM import.", tree_id=tree_id_param, job_id=job_id, exc_info=True)
+        if not isinstance(e, HTTPException): abort(500, "Error resuming GEDCOM import.")
+        raise
+
 @trees_bp.route('/trees/<uuid:tree_id_param>/cover_image', methods=['POST'])
 @require_auth 
 # The service layer currently checks if user_id == tree.created_by.
@@ -155,6 +270,7 @@ def upload_tree_cover_image_endpoint(tree_id_param: uuid.UUID):
 @trees_bp.route('/trees/<uuid:tree_id_param>/media', methods=['GET'])
 @require_auth
 @require_tree_access('view')
+@tree_etag
 def get_tree_media_endpoint(tree_id_param: uuid.UUID):
     db_session = g.db
     # active_tree_id from g should match tree_id_param due to @require_tree_access
@@ -179,7 +295,8 @@ def get_tree_media_endpoint(tree_id_param: uuid.UUID):
             entity_id=tree_id_param, 
             page=page, per_page=per_page, 
             sort_by=sort_by, sort_order=sort_order,
-            tree_id_context=tree_id_param # Pass tree_id_param as tree_id_context
+            tree_id_context=tree_id_param, # Pass tree_id_param as tree_id_context
+            fields=get_fields_param()
         )
         return jsonify(media_list_dict), 200
     except HTTPException as e:
@@ -192,6 +309,7 @@ def get_tree_media_endpoint(tree_id_param: uuid.UUID):
 @trees_bp.route('/trees/<uuid:tree_id_param>/events', methods=['GET'])
 @require_auth
 @require_tree_access('view')
+@tree_etag
 def get_tree_events_endpoint(tree_id_param: uuid.UUID):
     db_session = g.db
     active_tree_id = uuid.UUID(g.active_tree_id) # Ensure it's UUID
@@ -215,7 +333,8 @@ def get_tree_events_endpoint(tree_id_param: uuid.UUID):
     try:
         events_list_dict = get_events_for_tree_db(
             db_session, tree_id_param,
-            page, per_page, sort_by, sort_order, filters=filters
+            page, per_page, sort_by, sort_order, filters=filters,
+            fields=get_fields_param()
         )
         return jsonify(events_list_dict), 200
     except HTTPException as e:
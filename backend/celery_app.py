@@ -1,5 +1,6 @@
 from celery import Celery
-from backend.config import config as app_config # Import the application's config instance
+from celery.schedules import crontab
+from config import config as app_config # Same import root as the tasks below (the worker runs from backend/)
 
 # Use the configuration from app_config
 # These should be set in your environment or .env file for production
@@ -10,10 +11,10 @@ RESULT_BACKEND = app_config.CELERY_RESULT_BACKEND
 # Initialize Celery
 # The first argument is the traditional name of the current module.
 # It's used for auto-generating task names.
-celery_app = Celery('backend.celery_app',
+celery_app = Celery('celery_app',
                     broker=BROKER_URL,
                     backend=RESULT_BACKEND,
-                    include=['backend.celery_app']) # Add module itself to include list for tasks
+                    include=['celery_app']) # Add module itself to include list for tasks
 
 # Optional: Update Celery configuration with other settings from app_config if needed
 # celery_app.conf.update(
@@ -47,6 +48,93 @@ celery_app = Celery('backend.celery_app',
 
 # celery_app.Task = ContextTask
 
+celery_app.conf.beat_schedule = {
+    'ensure-activity-log-partitions': {
+        'task': 'celery_app.ensure_activity_log_partitions_task',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'archive-activity-log-partitions': {
+        'task': 'celery_app.archive_activity_log_partitions_task',
+        'schedule': crontab(hour=2, minute=0, day_of_month=1),
+    },
+    'prune-tree-changes': {
+        'task': 'celery_app.prune_tree_changes_task',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+
+@celery_app.task
+def ensure_activity_log_partitions_task():
+    """Pre-creates upcoming monthly activity_log partitions."""
+    from database import get_engine
+    from services.activity_retention_service import ensure_activity_log_partitions
+    return ensure_activity_log_partitions(get_engine())
+
+
+@celery_app.task
+def archive_activity_log_partitions_task():
+    """Archives activity_log partitions past the retention window to object storage and drops them."""
+    from database import get_engine
+    from services.activity_retention_service import archive_activity_log_partitions
+    return archive_activity_log_partitions(get_engine())
+
+
+@celery_app.task
+def prune_tree_changes_task():
+    """Drops tree change journal rows past TREE_CHANGES_RETENTION_DAYS, advancing each tree's low-water mark."""
+    from database import get_db_session
+    from services.tree_version_service import prune_tree_changes_db
+    db = get_db_session()
+    try:
+        return prune_tree_changes_db(db)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def materialize_inverse_relationships_task(tree_id=None):
+    """Backfills missing inverse relationship edges, for one tree or (tree_id=None) all of them."""
+    import uuid
+    from database import get_db_session
+    from services.relationship_service import materialize_inverse_relationships_db
+    db = get_db_session()
+    try:
+        return materialize_inverse_relationships_db(db, uuid.UUID(tree_id) if tree_id else None)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def rebuild_inferred_siblings_task(tree_id=None):
+    """Re-derives inferred siblings for one tree or (tree_id=None) everyone."""
+    import uuid
+    from database import get_db_session
+    from services.sibling_service import rebuild_inferred_siblings_db
+    db = get_db_session()
+    try:
+        return rebuild_inferred_siblings_db(db, uuid.UUID(tree_id) if tree_id else None)
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, acks_late=True)
+def import_gedcom_task(self, job_id):
+    """Runs a queued GEDCOM import job, reporting progress after each committed chunk."""
+    import uuid
+    import extensions
+    from config import config
+    from database import get_db_session
+    from services.gedcom_import_service import run_gedcom_import
+    if extensions.get_fernet() is None:
+        extensions.init_fernet(config)
+    db = get_db_session()
+    try:
+        return run_gedcom_import(db, uuid.UUID(job_id),
+                                 progress=lambda job: self.update_state(state='PROGRESS', meta=job))
+    finally:
+        db.close()
+
 
 @celery_app.task
 def example_task(x, y):
@@ -57,6 +145,6 @@ def example_task(x, y):
 
 if __name__ == '__main__':
     # This allows running the Celery worker directly using:
-    # python -m backend.celery_app worker -l info
+    # celery -A celery_app worker -l info (from the backend/ directory)
     # (Though typically you'd use the `celery` CLI command)
     celery_app.start()
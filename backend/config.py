@@ -38,7 +38,21 @@ class Config:
     DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
     DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
     DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_WAIT_WARN_MS = float(os.getenv("DB_POOL_WAIT_WARN_MS", 250)) # Checkout waits above this are logged with the longest holder
+    QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 50)) # SQL statements per request before a warning
+    QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 10)) # Same statement this often in one request looks like N+1
+    QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ['true', '1', 't'] # Raise instead of warn (always on when app.testing)
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 500))
+    SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", 1.0)) # Fraction of slow statements recorded
+    SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", 200)) # Ring buffer entries kept per process
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ['true', '1', 't'] # Capture EXPLAIN plans on a side connection
+    SLOW_QUERY_EXPLAIN_ANALYZE = os.getenv("SLOW_QUERY_EXPLAIN_ANALYZE", "false").lower() in ['true', '1', 't'] # Re-run slow SELECTs under EXPLAIN ANALYZE (executes them again)
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", 2000)) # statement_timeout on the EXPLAIN connection
     SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO", "False").lower() == "true"
+    # Optional read replicas (comma-separated URLs); GET/HEAD requests read from them
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", DB_POOL_SIZE))
+    REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", 60)) # How long a user's reads must see their last write
 
     # Redis
     REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -115,6 +129,54 @@ class Config:
     # Pagination Defaults
     PAGINATION_DEFAULTS = PAGINATION_DEFAULTS
 
+    # Streaming exports: rows fetched per server-side cursor batch
+    EXPORT_STREAM_BATCH_SIZE = int(os.getenv("EXPORT_STREAM_BATCH_SIZE", 500))
+
+    # Delta sync: above this many changed entities the client is told to reload the tree
+    DELTA_SYNC_MAX_CHANGES = int(os.getenv("DELTA_SYNC_MAX_CHANGES", 5000))
+    TREE_CHANGES_RETENTION_DAYS = int(os.getenv("TREE_CHANGES_RETENTION_DAYS", 30)) # Older journal rows are pruned; clients further behind reload
+    TREE_CHANGES_PRUNE_BATCH_SIZE = int(os.getenv("TREE_CHANGES_PRUNE_BATCH_SIZE", 5000)) # Journal rows deleted per committed batch
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000)) # Items accepted per :batch request
+    GEDCOM_IMPORT_BATCH_SIZE = int(os.getenv("GEDCOM_IMPORT_BATCH_SIZE", 2000)) # Level-0 records per committed import chunk
+    GEDCOM_IMPORT_PREFIX = os.getenv("GEDCOM_IMPORT_PREFIX", "gedcom_imports/") # Object-storage prefix for uploaded files
+    GEDCOM_EXPORT_PREFIX = os.getenv("GEDCOM_EXPORT_PREFIX", "gedcom_exports/") # Object-storage prefix for per-version export caches
+
+    # Inverse relationships: when enabled, writing an edge also upserts/updates/deletes its inverse
+    # (person2 -> person1 with the INVERSE_RELATIONSHIP_MAP type), so traversals can follow person1_id only.
+    RELATIONSHIP_MATERIALIZE_INVERSE = os.getenv("RELATIONSHIP_MATERIALIZE_INVERSE", "False").lower() == "true"
+    RELATIONSHIP_BACKFILL_BATCH_SIZE = int(os.getenv("RELATIONSHIP_BACKFILL_BATCH_SIZE", 5000)) # Source edges per backfill transaction
+
+    # Inferred siblings (full/half/step, derived from shared biological/step parents into inferred_siblings)
+    INFERRED_SIBLINGS_ENABLED = os.getenv("INFERRED_SIBLINGS_ENABLED", "True").lower() == "true" # Refresh on relationship writes
+    INFERRED_SIBLINGS_BATCH_SIZE = int(os.getenv("INFERRED_SIBLINGS_BATCH_SIZE", 2000)) # People per rebuild transaction
+
+    # Tree permission cache used by @require_tree_access (in-process LRU in front of Redis)
+    PERMISSION_CACHE_ENABLED = os.getenv("PERMISSION_CACHE_ENABLED", "True").lower() == "true"
+    PERMISSION_CACHE_LOCAL_TTL = float(os.getenv("PERMISSION_CACHE_LOCAL_TTL", 5))
+    PERMISSION_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("PERMISSION_CACHE_LOCAL_MAX_ENTRIES", 10000))
+    PERMISSION_CACHE_REDIS_TTL = int(os.getenv("PERMISSION_CACHE_REDIS_TTL", 300))
+
+    # Password hashing: bcrypt cost and the process pool that runs it off the request thread.
+    # PASSWORD_HASH_WORKERS=0 hashes inline (CLI scripts, tests).
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 5))
+
+    # Audit log: "sync" writes each entry in the request's transaction (durable),
+    # "buffered" (opt-in) queues entries for a background batch writer (a crash loses the queue).
+    AUDIT_LOG_MODE = os.getenv("AUDIT_LOG_MODE", "sync").lower()
+    AUDIT_LOG_BUFFER_SIZE = int(os.getenv("AUDIT_LOG_BUFFER_SIZE", 10000))
+    AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", 500))
+    AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", 1.0))
+    # Diff-only audit entries: every Nth entry per entity also stores a full snapshot
+    AUDIT_SNAPSHOT_INTERVAL = int(os.getenv("AUDIT_SNAPSHOT_INTERVAL", 20))
+    # activity_log monthly partitions: how many future months to pre-create, and how many
+    # past months to keep before a partition is archived to object storage and dropped
+    ACTIVITY_LOG_PARTITIONS_AHEAD = int(os.getenv("ACTIVITY_LOG_PARTITIONS_AHEAD", 3))
+    ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv("ACTIVITY_LOG_RETENTION_MONTHS", 12))
+    ACTIVITY_LOG_ARCHIVE_PREFIX = os.getenv("ACTIVITY_LOG_ARCHIVE_PREFIX", "archives/activity_log/")
+
 
 # Instantiate config
 config = Config()
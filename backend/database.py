@@ -1,59 +1,112 @@
 # backend/database.py
 from collections.abc import Callable
+import itertools
+import re
 import threading
-from typing import Any, Optional
+import time
+from functools import wraps
+from typing import Any, List, MutableMapping, Optional
 
 import structlog
 from sqlalchemy import create_engine, inspect, func, text, Enum as SQLAlchemyEnum
 from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.orm import sessionmaker, scoped_session, Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, ProgrammingError
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 
 import config as app_config_module
 # Import the consolidated UserRole and other enums
 from models import Base, User, UserRole, PrivacyLevelEnum, MediaTypeEnum, RelationshipTypeEnum
 from utils import _hash_password, _validate_password_complexity
+from pool_monitor import InstrumentedQueuePool, PoolMonitor
+import query_tracker
+from slow_query_log import slow_query_log
+from services.activity_retention_service import ensure_activity_log_partitions
 
 logger = structlog.get_logger(__name__)
 
 # --- Thread-Safe Singleton Engine and Session Factory ---
 # These locks are for ensuring singletons WITHIN a single process.
 _engine: Optional[Engine] = None
+_replica_engines: Optional[List[Engine]] = None
 _session_factory: Optional[scoped_session] = None 
 _engine_lock = threading.Lock()
+_replica_engines_lock = threading.Lock()
 _session_factory_lock = threading.Lock()
+_replica_round_robin = itertools.count()
 
 # --- Database Initialization Global Advisory Lock ID ---
 # This ID must be unique across your application for this specific locking purpose.
 DB_OVERALL_INIT_ADVISORY_LOCK_ID = 12345 
 
 
-def _create_actual_engine() -> Engine:
-    """
-    Actually creates and configures the SQLAlchemy engine.
-    This function should only be called once per process.
-    """
+class PoolMetricsCollector:
+    """Prometheus collector reporting pool occupancy for every engine of this process, labelled by role."""
+
+    def collect(self):
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size.", labels=["engine"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections currently checked out.", labels=["engine"])
+        checked_in = GaugeMetricFamily("db_pool_checked_in", "Idle connections in the pool.", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections open beyond pool_size.", labels=["engine"])
+        for label, status in pool_status().items():
+            if "size" not in status:
+                continue # e.g. NullPool
+            size.add_metric([label], status["size"])
+            checked_out.add_metric([label], status["checked_out"])
+            checked_in.add_metric([label], status["checked_in"])
+            overflow.add_metric([label], status["overflow"])
+        yield from (size, checked_out, checked_in, overflow)
+
+def _labelled_engines():
+    engines = [("primary", _engine)] if _engine is not None else []
+    engines += [(f"replica-{i}", replica) for i, replica in enumerate(_replica_engines or [])]
+    return engines
+
+def pool_status() -> dict:
+    """Occupancy, invalidations and longest connection holder of each engine's pool, keyed by role."""
+    statuses = {}
+    for label, engine_instance in _labelled_engines():
+        monitor = getattr(engine_instance.pool, "monitor", None) or PoolMonitor(label)
+        statuses[label] = monitor.status(engine_instance.pool)
+    return statuses
+
+REGISTRY.register(PoolMetricsCollector())
+
+def _build_engine(url: str, pool_size: int, role: str) -> Engine:
     current_config = app_config_module.config
-    if not current_config.DATABASE_URL:
-        logger.critical("DATABASE_URL environment variable is not set.")
-        raise RuntimeError("DATABASE_URL is not set.")
-    
     try:
         engine_instance = create_engine(
-            current_config.DATABASE_URL,
-            pool_size=current_config.DB_POOL_SIZE,
+            url,
+            pool_size=pool_size,
             max_overflow=current_config.DB_MAX_OVERFLOW,
             pool_recycle=current_config.DB_POOL_RECYCLE,
+            poolclass=InstrumentedQueuePool,
             echo=False,  # Explicitly disable SQLAlchemy echo
         )
+        PoolMonitor(role).attach(engine_instance)
+        query_tracker.attach(engine_instance)
+        slow_query_log.attach(engine_instance)
         SQLAlchemyInstrumentor().instrument(engine=engine_instance)
-        logger.info("SQLAlchemy engine created and instrumented for this process.")
+        logger.info("SQLAlchemy engine created and instrumented for this process.", role=role)
         return engine_instance
     except Exception as e:
-        logger.critical(f"Failed to create SQLAlchemy engine: {e}", exc_info=True)
+        logger.critical(f"Failed to create SQLAlchemy {role} engine: {e}", exc_info=True)
         raise RuntimeError(f"Database engine initialization failed: {e}") from e
 
+def _create_actual_engine() -> Engine:
+    """
+    Actually creates and configures the SQLAlchemy engine.
+    This function should only be called once per process.
+    """
+    current_config = app_config_module.config
+    if not current_config.DATABASE_URL:
+        logger.critical("DATABASE_URL environment variable is not set.")
+        raise RuntimeError("DATABASE_URL is not set.")
+    return _build_engine(current_config.DATABASE_URL, current_config.DB_POOL_SIZE, "primary")
+
 def get_engine() -> Engine:
     """
     Get the singleton SQLAlchemy engine instance for this process, initializing it if necessary.
@@ -69,6 +122,118 @@ def get_engine() -> Engine:
                 _engine = _create_actual_engine()
     return _engine
 
+def get_replica_engines() -> List[Engine]:
+    """The read-replica engines for this process (empty when DATABASE_REPLICA_URLS is unset)."""
+    global _replica_engines
+    if _replica_engines is None:
+        with _replica_engines_lock:
+            if _replica_engines is None:
+                current_config = app_config_module.config
+                _replica_engines = [
+                    _build_engine(url, current_config.DB_REPLICA_POOL_SIZE, f"replica-{i}")
+                    for i, url in enumerate(current_config.DATABASE_REPLICA_URLS)
+                ]
+    return _replica_engines
+
+def _choose_replica(min_lsn: Optional[str]) -> Optional[Engine]:
+    """
+    Round-robins over the replicas, returning the first one that has replayed WAL up to
+    `min_lsn` (the user's last write), or None to read from the primary.
+    """
+    replicas = get_replica_engines()
+    if not replicas:
+        return None
+    start = next(_replica_round_robin)
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        if min_lsn is None:
+            return replica
+        try:
+            with replica.connect() as conn:
+                caught_up = conn.execute(
+                    text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"), {"lsn": min_lsn}
+                ).scalar()
+            if caught_up:
+                return replica
+        except SQLAlchemyError as e:
+            logger.warning("Replica lag check failed, skipping replica.", replica_index=(start + offset) % len(replicas), error=str(e))
+    return None
+
+def current_primary_lsn() -> Optional[str]:
+    """Current WAL position of the primary, recorded after a user's write for read-your-writes."""
+    try:
+        with get_engine().connect() as conn:
+            return str(conn.execute(text("SELECT pg_current_wal_lsn()")).scalar())
+    except SQLAlchemyError as e:
+        logger.warning("Could not read primary WAL position.", error=str(e))
+        return None
+
+def remember_write_lsn(user_session: MutableMapping[str, Any], lsn: str) -> None:
+    """Records the primary's WAL position after a user's write in their (Flask) session."""
+    user_session["last_write_lsn"] = lsn
+    user_session["last_write_lsn_at"] = time.time()
+
+def pending_write_lsn(user_session: MutableMapping[str, Any]) -> Optional[str]:
+    """
+    The LSN the user's reads must see, kept for REPLICA_READ_YOUR_WRITES_SECONDS after the
+    write. Replicas are picked per session, so one caught-up replica says nothing about the
+    next one; only the timer retires the requirement.
+    """
+    lsn = user_session.get("last_write_lsn")
+    if lsn is None:
+        return None
+    if time.time() - user_session.get("last_write_lsn_at", 0) > app_config_module.config.REPLICA_READ_YOUR_WRITES_SECONDS:
+        user_session.pop("last_write_lsn", None)
+        user_session.pop("last_write_lsn_at", None)
+        return None
+    return lsn
+
+# Raw SQL is sent to a replica only when it is recognisably a plain read
+_READ_TEXT_RE = re.compile(r"^\s*(SELECT|SHOW|VALUES)\b", re.IGNORECASE)
+_WRITE_IN_TEXT_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|nextval|setval|pg_advisory\w*)\b|\bFOR\s+(KEY\s+)?SHARE\b",
+    re.IGNORECASE)
+
+def _is_write(clause) -> bool:
+    if clause is None:
+        return False
+    if getattr(clause, "is_dml", False):
+        return True
+    if isinstance(clause, TextClause):
+        return not _READ_TEXT_RE.match(clause.text) or bool(_WRITE_IN_TEXT_RE.search(clause.text))
+    return False
+
+class RoutingSession(Session):
+    """
+    Session that reads from a replica when `info["use_replica"]` is set (GET/HEAD requests,
+    @read_only services) and sends everything else, and everything after the first write, to
+    the primary. The replica is picked once per session, honouring `info["min_replica_lsn"]`.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or _is_write(clause):
+            self.info["wrote"] = True
+        if self.info.get("use_replica") and not self.info.get("wrote"):
+            if "replica" not in self.info:
+                min_lsn = self.info.get("min_replica_lsn")
+                self.info["replica"] = _choose_replica(min_lsn)
+                self.info["replica_lsn_confirmed"] = min_lsn is not None and self.info["replica"] is not None
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+def read_only(func: Callable) -> Callable:
+    """Marks a service function (taking `db` first) as safe to serve from a read replica."""
+    @wraps(func)
+    def wrapper(db, *args, **kwargs):
+        previous = db.info.get("use_replica")
+        db.info["use_replica"] = bool(app_config_module.config.DATABASE_REPLICA_URLS)
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.info["use_replica"] = previous
+    return wrapper
+
 def _create_actual_session_factory(engine_instance: Engine) -> scoped_session:
     """
     Actually creates and configures the SQLAlchemy scoped session factory.
@@ -82,7 +247,7 @@ def _create_actual_session_factory(engine_instance: Engine) -> scoped_session:
     """
     try:
         session_factory_instance = scoped_session(
-            sessionmaker(autocommit=False, autoflush=False, bind=engine_instance)
+            sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine_instance)
         )
         logger.info("SQLAlchemy scoped session factory created for this process.")
         return session_factory_instance
@@ -120,6 +285,41 @@ def get_db_session() -> Session:
         raise RuntimeError("Session factory not initialized.")
     return factory() 
 
+class LazySession:
+    """
+    Request-scoped stand-in for a Session (g.db). The scoped session, and with it a pool
+    connection once a statement runs, is only obtained on first attribute access, so
+    requests that never touch the database (health, metrics, session info, preflight)
+    never check anything out. Attribute access is forwarded to the real session.
+    """
+    __slots__ = ("_session", "_read_only", "_min_replica_lsn")
+
+    def __init__(self, read_only: bool = False, min_replica_lsn: Optional[str] = None) -> None:
+        self._session: Optional[Session] = None
+        self._read_only = read_only
+        self._min_replica_lsn = min_replica_lsn
+
+    @property
+    def session_created(self) -> bool:
+        return self._session is not None
+
+    def _get_session(self) -> Session:
+        if self._session is None:
+            self._session = get_db_session()
+            if self._read_only and app_config_module.config.DATABASE_REPLICA_URLS:
+                self._session.info["use_replica"] = True
+                self._session.info["min_replica_lsn"] = self._min_replica_lsn
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_session(), name)
+
+    def __bool__(self) -> bool:
+        return True # Existence checks (`if not db`) must not force the session into being
+
+    def __repr__(self) -> str:
+        return f"<LazySession created={self.session_created}>"
+
 def _create_enum_types_if_not_exist(engine_to_use: Engine) -> None:
     """
     Explicitly creates all ENUM types if they don't already exist in the database.
@@ -351,6 +551,10 @@ def initialize_database() -> None:
                 logger.error(f"Unexpected error during Base.metadata.create_all: {e_create_all}", exc_info=True)
                 raise
 
+            # Step 2b: activity_log is range-partitioned; rows need a partition to land in.
+            logger.info("Creating activity_log partitions...")
+            ensure_activity_log_partitions(engine)
+
             # Step 3: Populate initial data.
             # populate_initial_data_db uses its own advisory lock for data population idempotency.
             logger.info("Populating initial data if database is empty...")
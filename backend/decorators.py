@@ -1,10 +1,14 @@
 # backend/decorators.py
 import uuid
+import time
+import hashlib
 from functools import wraps
-from flask import session, g, abort # current_app not used directly here
+from urllib.parse import urlencode
+from flask import session, g, abort, request, make_response # current_app not used directly here
 import structlog
 
 import models # Absolute import for models module
+import permission_cache
 
 logger = structlog.get_logger(__name__)
 
@@ -75,31 +79,44 @@ def require_tree_access(level: str = 'view'):
                 logger.error("Database session not found in g for @require_tree_access.")
                 abort(500, "Internal server error during access check.")
 
-            # Use models.Tree and models.TreeAccess from the imported models module
-            tree = db.query(models.Tree).filter(models.Tree.id == tree_id).one_or_none()
-            if not tree:
-                logger.warning("Tree access check failed: Tree not found in DB.", user_id=user_id, tree_id=tree_id)
-                if tree_id_to_check_str == session.get('active_tree_id'): session.pop('active_tree_id', None)
-                abort(404, description=f"Tree with ID {tree_id} not found.")
+            cached, cache_generation = permission_cache.get_permission(user_id, tree_id)
+            tree = None
+            if cached is not None:
+                resolved_access_level = cached["access_level"]
+                privacy_setting = models.TreePrivacySettingEnum(cached["privacy_setting"])
+            else:
+                resolve_started = time.perf_counter()
+                # Use models.Tree and models.TreeAccess from the imported models module
+                tree = db.query(models.Tree).filter(models.Tree.id == tree_id).one_or_none()
+                if not tree:
+                    logger.warning("Tree access check failed: Tree not found in DB.", user_id=user_id, tree_id=tree_id)
+                    if tree_id_to_check_str == session.get('active_tree_id'): session.pop('active_tree_id', None)
+                    abort(404, description=f"Tree with ID {tree_id} not found.")
+
+                resolved_access_level = None # The user's own level, independent of the public setting
+                if tree.created_by == user_id:
+                    resolved_access_level = 'admin' # Owner is always admin
+                else:
+                    tree_access_entry = db.query(models.TreeAccess).filter(
+                        models.TreeAccess.tree_id == tree_id, models.TreeAccess.user_id == user_id
+                    ).one_or_none()
+                    if tree_access_entry:
+                        resolved_access_level = tree_access_entry.access_level
+                privacy_setting = tree.privacy_setting
+                permission_cache.set_permission(user_id, tree_id, resolved_access_level, privacy_setting.value,
+                                                cache_generation, resolve_seconds=time.perf_counter() - resolve_started)
 
             has_permission = False
             actual_access_level = None # This will store the determined access level as string ('view', 'edit', 'admin')
 
             # 1. Check for public tree access (only for 'view' level)
-            if tree.privacy_setting == models.TreePrivacySettingEnum.PUBLIC and level == 'view':
+            if privacy_setting == models.TreePrivacySettingEnum.PUBLIC and level == 'view':
                 has_permission = True
                 actual_access_level = 'view' # Granted 'view' due to public setting
             
-            # 2. If not granted by public setting, check ownership or TreeAccess table
+            # 2. If not granted by public setting, use ownership or the TreeAccess level
             if not has_permission:
-                if tree.created_by == user_id:
-                    actual_access_level = 'admin' # Owner is always admin
-                else:
-                    tree_access_entry = db.query(models.TreeAccess).filter(
-                        models.TreeAccess.tree_id == tree_id, models.TreeAccess.user_id == user_id
-                    ).one_or_none()
-                    if tree_access_entry:
-                        actual_access_level = tree_access_entry.access_level
+                actual_access_level = resolved_access_level
             
             # if not actual_access_level and tree.is_public: # Old logic using is_public, now handled by privacy_setting
             #     actual_access_level = 'view'
@@ -114,16 +131,56 @@ def require_tree_access(level: str = 'view'):
             if not has_permission: # This check now correctly uses the potentially updated has_permission
                 logger.warning("Tree access denied.", user_id=user_id, tree_id=tree_id,
                                required_level=level, granted_level=actual_access_level or "none",
-                               tree_privacy=tree.privacy_setting.value)
+                               tree_privacy=privacy_setting.value)
                 abort(403, description={
                     "message": f"You do not have sufficient permissions ('{level}' required) for this tree.",
                     "code": "ACCESS_DENIED_TREE"
                 })
             
-            g.active_tree = tree
+            g.active_tree = tree # None when the permission came from the cache
             g.active_tree_id = tree_id 
             g.tree_access_level = actual_access_level # Store the determined access level
             
             return f(*args, **kwargs)
         return decorated_function
     return decorator
+
+def tree_etag(f):
+    """
+    Conditional GET for tree-scoped reads. Must be applied below @require_tree_access.
+    The ETag is derived from the active tree's version counter, the path, the query
+    parameters and the user, so a matching If-None-Match is answered with 304 without
+    running the view (and without touching the people/relationship/event tables).
+    When the access check was served from the permission cache only the version
+    column is read.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return f(*args, **kwargs)
+        tree = g.get('active_tree')
+        if tree is not None:
+            tree_id, tree_version = tree.id, tree.version
+        else:
+            tree_id, db = g.get('active_tree_id'), g.get('db')
+            if tree_id is None or db is None:
+                return f(*args, **kwargs)
+            tree_version = db.query(models.Tree.version).filter(models.Tree.id == tree_id).scalar()
+            if tree_version is None:
+                return f(*args, **kwargs)
+
+        query_string = urlencode(sorted(request.args.items(multi=True)))
+        etag_source = f"{tree_id}:{tree_version}:{session.get('user_id')}:{request.path}?{query_string}"
+        etag = hashlib.sha1(etag_source.encode('utf-8')).hexdigest()
+
+        if request.if_none_match.contains(etag):
+            logger.debug("ETag matched, returning 304.", tree_id=tree_id, tree_version=tree_version, path=request.path)
+            response = make_response('', 304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
@@ -1,6 +1,8 @@
 # backend/extensions.py
 import logging
+import os
 import structlog
+from cryptography.fernet import Fernet
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -40,6 +42,8 @@ user_registration_counter = None
 db_operation_duration_histogram = None
 auth_failure_counter = None
 role_change_counter = None
+db_pool_checkout_wait_histogram = None
+db_pool_invalidation_counter = None
 
 # Global Fernet instance, to be initialized by app factory
 fernet_suite = None
@@ -53,9 +57,47 @@ def get_fernet():
     return fernet_suite
 
 
+def init_fernet(config_obj) -> bool:
+    """Loads the encryption key and initializes the global Fernet instance (app factory and Celery workers)."""
+    global fernet_suite
+    from utils import load_encryption_key # Deferred: utils pulls in modules that import this one
+    try:
+        base_app_dir = os.path.dirname(os.path.abspath(__file__))
+        key_file_path = os.path.join(base_app_dir, config_obj.ENCRYPTION_KEY_FILE_PATH_RELATIVE)
+
+        logger.info("Attempting to load encryption key for Fernet.",
+                    env_var=config_obj.ENCRYPTION_KEY_ENV_VAR,
+                    file_path=key_file_path)
+
+        encryption_key_bytes = load_encryption_key(
+            env_var_name=config_obj.ENCRYPTION_KEY_ENV_VAR,
+            file_path=key_file_path
+        )
+
+        if encryption_key_bytes:
+            fernet_suite = Fernet(encryption_key_bytes)
+            logger.info("Fernet initialized successfully for the application.")
+        else:
+            logger.critical("Encryption key is missing or load_encryption_key failed. Fernet NOT initialized. ENCRYPTION DISABLED.")
+            fernet_suite = None
+    except Exception as e:
+        logger.critical(f"Failed to initialize Fernet for the app: {e}", exc_info=True)
+        fernet_suite = None
+    return fernet_suite is not None
+
+
+def _observe_pool(key):
+    def callback(options):
+        from database import pool_status # Deferred: database imports this module indirectly
+        return [metrics.Observation(status[key], {"engine": label})
+                for label, status in pool_status().items() if key in status]
+    return callback
+
+
 def init_opentelemetry(app):
     global tracer_provider, meter_provider
     global user_registration_counter, db_operation_duration_histogram, auth_failure_counter, role_change_counter
+    global db_pool_checkout_wait_histogram, db_pool_invalidation_counter
 
     current_config = app_config_module.config # Use the imported config object
     otel_service_name = current_config.OTEL_SERVICE_NAME
@@ -92,6 +134,16 @@ def init_opentelemetry(app):
         "app.auth.failures", description="Authentication failures", unit="1")
     role_change_counter = meter.create_counter(
         "app.auth.role_changes", description="User role changes", unit="1")
+    db_pool_checkout_wait_histogram = meter.create_histogram(
+        "db.pool.checkout_wait", description="Time spent waiting for a pooled DB connection", unit="ms")
+    db_pool_invalidation_counter = meter.create_counter(
+        "db.pool.invalidations", description="Invalidated pooled DB connections", unit="1")
+    meter.create_observable_gauge(
+        "db.pool.checked_out", callbacks=[_observe_pool("checked_out")],
+        description="Pooled DB connections currently checked out", unit="1")
+    meter.create_observable_gauge(
+        "db.pool.overflow", callbacks=[_observe_pool("overflow")],
+        description="Pooled DB connections open beyond pool_size", unit="1")
     logger.info("Custom OpenTelemetry metrics initialized.")
 
 
@@ -0,0 +1,149 @@
+# backend/gedcom.py
+"""
+Streaming GEDCOM (5.5.1 and 7.0) reader helpers.
+
+`iter_gedcom_records` turns an iterable of lines into one tree of GedcomNode per
+level-0 record. Only the current record is held in memory, so it works on an
+object-storage body or an open file of any size. CONT/CONC continuation lines are
+folded into their parent's value. Only UTF-8 input is supported; ANSEL files must
+be converted first.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+_LINE_RE = re.compile(r"^\s*(\d+)\s+(?:(@[^@]+@)\s+)?(\S+)(?: (.*))?$")
+
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+_MONTH_NUMBERS = {name: number for number, name in enumerate(MONTHS, start=1)}
+_APPROXIMATE_PREFIXES = {"ABT", "CAL", "EST", "BEF", "AFT", "BET", "FROM", "TO", "INT"}
+
+# GEDCOM event/attribute tags and the Event.event_type they map to. EVEN carries its type in a TYPE substructure.
+INDIVIDUAL_EVENT_TYPES = {
+    "BAPM": "baptism", "CHR": "christening", "CREM": "cremation", "ADOP": "adoption",
+    "BARM": "bar_mitzvah", "BASM": "bat_mitzvah", "CONF": "confirmation", "FCOM": "first_communion",
+    "ORDN": "ordination", "NATU": "naturalization", "EMIG": "emigration", "IMMI": "immigration",
+    "CENS": "census", "PROB": "probate", "WILL": "will", "GRAD": "graduation", "RETI": "retirement",
+    "OCCU": "occupation", "EDUC": "education", "RESI": "residence", "RELI": "religion", "EVEN": "other",
+}
+FAMILY_EVENT_TYPES = {"MARR": "marriage", "ENGA": "engagement", "DIV": "divorce", "EVEN": "other"}
+ATTRIBUTE_TAGS = {"OCCU", "EDUC", "RESI", "RELI"} # Their description is the line value rather than a NOTE
+
+
+@dataclass
+class GedcomNode:
+    level: int
+    tag: str
+    value: Optional[str] = None
+    xref: Optional[str] = None
+    children: List["GedcomNode"] = field(default_factory=list)
+
+    def first(self, tag: str) -> Optional["GedcomNode"]:
+        return next((child for child in self.children if child.tag == tag), None)
+
+    def all(self, tag: str) -> List["GedcomNode"]:
+        return [child for child in self.children if child.tag == tag]
+
+    def value_of(self, tag: str) -> Optional[str]:
+        child = self.first(tag)
+        return child.value if child is not None else None
+
+
+def iter_gedcom_records(lines: Iterable[str]) -> Iterator[GedcomNode]:
+    """Yields each level-0 record (HEAD, INDI, FAM, ...) with its nested structure."""
+    stack: List[GedcomNode] = []
+    for line_number, raw_line in enumerate(lines, start=1):
+        line = raw_line.rstrip("\r\n").lstrip("\ufeff")
+        if not line.strip():
+            continue
+        match = _LINE_RE.match(line)
+        if not match:
+            logger.debug("Skipping malformed GEDCOM line.", line_number=line_number)
+            continue
+        level, xref, tag, value = int(match.group(1)), match.group(2), match.group(3).upper(), match.group(4)
+        if value and value.startswith("@@"): # Escaped leading "@" in a text payload
+            value = value[1:]
+        if level == 0:
+            if stack:
+                yield stack[0]
+            stack = [GedcomNode(0, tag, value, xref)]
+            continue
+        del stack[level:]
+        if len(stack) != level:
+            logger.debug("Skipping GEDCOM line with a level gap.", line_number=line_number)
+            continue
+        if tag in ("CONT", "CONC"):
+            parent = stack[-1]
+            separator = "\n" if tag == "CONT" else ""
+            parent.value = (parent.value or "") + separator + (value or "")
+            continue
+        node = GedcomNode(level, tag, value, xref)
+        stack[-1].children.append(node)
+        stack.append(node)
+    if stack:
+        yield stack[0]
+
+
+def parse_gedcom_date(value: Optional[str]) -> Tuple[Optional[date], bool]:
+    """
+    Parses a GEDCOM date phrase into (date, is_approximate). Qualified or partial dates
+    ("ABT 1900", "BET 1900 AND 1910", "JAN 1900") map to their first known day and are approximate.
+    """
+    if not value:
+        return None, False
+    tokens = [t for t in value.upper().split() if not t.startswith("@#")] # Drop calendar escapes
+    approximate = False
+    if tokens and tokens[0] in _APPROXIMATE_PREFIXES:
+        approximate = True
+        tokens = tokens[1:]
+    for separator in ("AND", "TO"):
+        if separator in tokens:
+            tokens = tokens[:tokens.index(separator)]
+    tokens = [t for t in tokens if not t.startswith("(")]
+    if not tokens or not tokens[-1].isdigit():
+        return None, False
+    year = int(tokens[-1])
+    month = _MONTH_NUMBERS.get(tokens[-2]) if len(tokens) >= 2 else None
+    day = int(tokens[-3]) if len(tokens) >= 3 and tokens[-3].isdigit() else None
+    try:
+        return date(year, month or 1, day or 1), approximate or month is None or day is None
+    except ValueError:
+        return None, False
+
+
+def format_gedcom_date(value: Optional[date], approximate: bool = False) -> Optional[str]:
+    if value is None:
+        return None
+    formatted = f"{value.day} {MONTHS[value.month - 1]} {value.year}"
+    return f"ABT {formatted}" if approximate else formatted
+
+
+def parse_gedcom_name(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Splits a NAME value such as "John Henry /Smith/" into (given names, surname)."""
+    if not value:
+        return None, None
+    if "/" not in value:
+        return value.strip() or None, None
+    given, _, rest = value.partition("/")
+    surname, _, suffix = rest.partition("/")
+    given = " ".join(part for part in (given.strip(), suffix.strip()) if part)
+    return given or None, surname.strip() or None
+
+
+def gedcom_line(level: int, tag: str, value: Optional[str] = None, xref: Optional[str] = None) -> str:
+    """
+    Formats one GEDCOM 7 structure, newline-terminated. Multi-line values continue on CONT
+    lines and a leading "@" in a value is doubled as the specification requires.
+    """
+    prefix = f"{level} {xref} {tag}" if xref else f"{level} {tag}"
+    if value is None or value == "":
+        return prefix + "\n"
+    first, *rest = str(value).replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    lines = [f"{prefix} {'@' + first if first.startswith('@') else first}".rstrip()]
+    lines += [f"{level + 1} CONT {'@' + part if part.startswith('@') else part}".rstrip() for part in rest]
+    return "\n".join(lines) + "\n"
@@ -1,16 +1,14 @@
 # backend/main.py
-import os
 import uuid
 import structlog
-from flask import Flask, g, jsonify, request
+from flask import Flask, g, jsonify, request, session
 from werkzeug.exceptions import HTTPException
-from cryptography.fernet import Fernet
 
 import config as app_config_module
 # Import the database module itself to access its members directly after init
 import database as db_module 
 import extensions as app_extensions_module
-from utils import load_encryption_key
+import query_tracker
 
 from blueprints.auth import auth_bp
 from blueprints.trees import trees_bp
@@ -20,6 +18,8 @@ from blueprints.admin import admin_bp
 from blueprints.health import health_bp
 from blueprints.media import media_bp 
 from blueprints.events import events_bp # Added import for events_bp
+from blueprints.diagnostics import diagnostics_bp
+from blueprints.batch import batch_bp
 
 logger = structlog.get_logger(__name__)
 
@@ -28,29 +28,7 @@ def create_app(app_config_obj=app_config_module.config):
     app = Flask(__name__)
     app.config.from_object(app_config_obj)
 
-    try:
-        base_app_dir = os.path.dirname(os.path.abspath(__file__))
-        key_file_path = os.path.join(base_app_dir, app_config_obj.ENCRYPTION_KEY_FILE_PATH_RELATIVE)
-        
-        logger.info("Attempting to load encryption key for Fernet.",
-                    env_var=app_config_obj.ENCRYPTION_KEY_ENV_VAR,
-                    file_path=key_file_path)
-        
-        encryption_key_bytes = load_encryption_key(
-            env_var_name=app_config_obj.ENCRYPTION_KEY_ENV_VAR,
-            file_path=key_file_path
-        )
-
-        if encryption_key_bytes:
-            app_extensions_module.fernet_suite = Fernet(encryption_key_bytes)
-            logger.info("Fernet initialized successfully for the application.")
-        else:
-            logger.critical("Encryption key is missing or load_encryption_key failed. Fernet NOT initialized. ENCRYPTION DISABLED.")
-            app_extensions_module.fernet_suite = None
-    except Exception as e:
-        logger.critical(f"Failed to initialize Fernet for the app: {e}", exc_info=True)
-        app_extensions_module.fernet_suite = None
-
+    app_extensions_module.init_fernet(app_config_obj)
 
     # Initialize database: engine, session factory, tables, initial data
     # This will populate _thread_local.engine and _thread_local.session_factory for the main thread.
@@ -81,29 +59,49 @@ def create_app(app_config_obj=app_config_module.config):
     app.register_blueprint(health_bp)
     app.register_blueprint(media_bp) 
     app.register_blueprint(events_bp) # Registered events_bp
+    app.register_blueprint(diagnostics_bp)
+    app.register_blueprint(batch_bp)
 
     @app.before_request
     def before_request_hook():
-        # Get a thread-local session using the new get_db_session function
-        g.db = db_module.get_db_session()
+        # Lazy: the thread-local session is only created if the request actually uses g.db
+        # Reads of GET/HEAD requests may go to a replica that has caught up with the user's last write
+        g.db = db_module.LazySession(read_only=request.method in ('GET', 'HEAD'),
+                                     min_replica_lsn=db_module.pending_write_lsn(session))
         structlog.contextvars.bind_contextvars(
             request_id=str(uuid.uuid4()), path=request.path, method=request.method,
             remote_addr=request.remote_addr
         )
 
+    @app.after_request
+    def record_write_lsn_hook(response):
+        # Read-your-writes: remember where the primary's WAL was after this user's write,
+        # so their next reads only use replicas that have replayed past it.
+        db = g.get('db')
+        if not (app_config_module.config.DATABASE_REPLICA_URLS
+                and isinstance(db, db_module.LazySession) and db.session_created):
+            return response
+        if db.info.get('wrote'):
+            lsn = db_module.current_primary_lsn()
+            if lsn:
+                db_module.remember_write_lsn(session, lsn) # Kept for a while, see pending_write_lsn
+        return response
+
+    @app.after_request
+    def query_budget_hook(response):
+        return query_tracker.finish_request(response)
+
     @app.teardown_appcontext
     def teardown_db_hook(exception=None):
-        # g.db is the session instance from get_db_session()
+        # g.db is a LazySession; only if the request used it is there a scoped session to remove.
         # For scoped_session, remove() is the standard way to return the session to the pool
         # and clear it from the current thread's scope.
-        # The session itself (g.db) will be closed by scoped_session's management.
-        session_factory = db_module.get_session_factory()
-        if session_factory: # Ensure factory is available
-            session_factory.remove()
-            # logger.debug("DB session removed by scoped_session factory at teardown.") # Optional log
-        
-        # Clean up g.db to avoid potential leaks if remove() didn't clear it from g
-        g.pop('db', None) 
+        db = g.pop('db', None)
+        if isinstance(db, db_module.LazySession) and db.session_created:
+            session_factory = db_module.get_session_factory()
+            if session_factory: # Ensure factory is available
+                session_factory.remove()
+                # logger.debug("DB session removed by scoped_session factory at teardown.") # Optional log 
         structlog.contextvars.clear_contextvars()
 
 
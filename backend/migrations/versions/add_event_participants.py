@@ -0,0 +1,54 @@
+"""add_event_participants
+
+Revision ID: add_event_participants
+Revises: partition_activity_log
+Create Date: 2026-10-18 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_participants'
+down_revision = 'partition_activity_log'
+branch_labels = None
+depends_on = None
+
+_UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+
+def upgrade():
+    # Indexed replacement for LIKE scans over events.related_person_ids.
+    op.create_table(
+        'event_participants',
+        sa.Column('event_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('person_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['person_id'], ['people.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('event_id', 'person_id', 'role')
+    )
+    op.create_index('ix_event_participants_person_id_event_id', 'event_participants', ['person_id', 'event_id'], unique=False)
+
+    # Backfill from the existing columns; related IDs that are malformed or point at deleted people are skipped.
+    op.execute("""
+        INSERT INTO event_participants (event_id, person_id, role)
+        SELECT id, person_id, 'principal' FROM events WHERE person_id IS NOT NULL
+    """)
+    op.execute(f"""
+        INSERT INTO event_participants (event_id, person_id, role)
+        SELECT DISTINCT e.id, (related.value #>> '{{}}')::uuid, 'related'
+        FROM events e
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(e.related_person_ids) = 'array' THEN e.related_person_ids ELSE '[]'::jsonb END
+        ) AS related
+        WHERE (related.value #>> '{{}}') ~ '{_UUID_PATTERN}'
+          AND EXISTS (SELECT 1 FROM people p WHERE p.id = (related.value #>> '{{}}')::uuid)
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_event_participants_person_id_event_id', table_name='event_participants')
+    op.drop_table('event_participants')
@@ -0,0 +1,47 @@
+"""add_import_jobs
+
+Revision ID: add_import_jobs
+Revises: add_tree_relationship_indexes
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_import_jobs'
+down_revision = 'add_tree_relationship_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Checkpointed GEDCOM import jobs.
+    op.create_table(
+        'import_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tree_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('source_key', sa.String(length=512), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('phase', sa.String(length=20), nullable=False, server_default='individuals'),
+        sa.Column('records_done', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('people_imported', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('relationships_imported', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('events_imported', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tree_id'], ['trees.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_import_jobs_tree_id', 'import_jobs', ['tree_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_import_jobs_tree_id', table_name='import_jobs')
+    op.drop_table('import_jobs')
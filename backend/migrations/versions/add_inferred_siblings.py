@@ -0,0 +1,38 @@
+"""add_inferred_siblings
+
+Revision ID: add_inferred_siblings
+Revises: add_import_jobs
+Create Date: 2026-10-18 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_inferred_siblings'
+down_revision = 'add_import_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sibling pairs derived from shared parents, one row per direction so a person's siblings
+    # are a primary-key range scan.
+    op.create_table(
+        'inferred_siblings',
+        sa.Column('person_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('sibling_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('sibling_type', postgresql.ENUM(name='relationshiptypeenum', create_type=False), nullable=False),
+        sa.Column('shared_parent_ids', postgresql.JSONB(astext_type=sa.Text()), nullable=False, server_default='[]'),
+        sa.Column('computed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['person_id'], ['people.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['sibling_id'], ['people.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('person_id', 'sibling_id')
+    )
+    op.create_index('ix_inferred_siblings_sibling_id', 'inferred_siblings', ['sibling_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_inferred_siblings_sibling_id', table_name='inferred_siblings')
+    op.drop_table('inferred_siblings')
@@ -0,0 +1,25 @@
+"""add_person_audit_snapshot_counter
+
+Revision ID: add_person_audit_snapshot_counter
+Revises: add_inferred_siblings
+Create Date: 2026-10-18 22:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_person_audit_snapshot_counter'
+down_revision = 'add_inferred_siblings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Diff-only audit entries since the person's last full snapshot, so deciding when to
+    # snapshot is a row update instead of a scan of activity_log.
+    op.add_column('people', sa.Column('audit_entries_since_snapshot', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('people', 'audit_entries_since_snapshot')
@@ -0,0 +1,38 @@
+"""add_tree_change_journal
+
+Revision ID: add_tree_change_journal
+Revises: add_tree_version_counter
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'add_tree_change_journal'
+down_revision = 'add_tree_version_counter'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Per-tree change journal read by the delta-sync endpoint.
+    op.create_table(
+        'tree_changes',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tree_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('entity_type', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('operation', sa.String(length=10), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['tree_id'], ['trees.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tree_changes_tree_id_version', 'tree_changes', ['tree_id', 'version'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tree_changes_tree_id_version', table_name='tree_changes')
+    op.drop_table('tree_changes')
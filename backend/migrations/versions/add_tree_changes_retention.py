@@ -0,0 +1,26 @@
+"""add_tree_changes_retention
+
+Revision ID: add_tree_changes_retention
+Revises: add_person_audit_snapshot_counter
+Create Date: 2026-10-19 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tree_changes_retention'
+down_revision = 'add_person_audit_snapshot_counter'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Newest journal version pruned per tree; delta sync from before it requires a reload.
+    op.add_column('trees', sa.Column('journal_min_version', sa.BigInteger(), nullable=False, server_default='0'))
+    op.create_index('ix_tree_changes_created_at', 'tree_changes', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tree_changes_created_at', table_name='tree_changes')
+    op.drop_column('trees', 'journal_min_version')
@@ -0,0 +1,27 @@
+"""add_tree_relationship_indexes
+
+Revision ID: add_tree_relationship_indexes
+Revises: add_event_participants
+Create Date: 2026-10-18 17:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_tree_relationship_indexes'
+down_revision = 'add_event_participants'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tree-scoped semi-joins probe person_tree_association by (tree_id, person_id); the PK leads with person_id.
+    # relationships(person1_id, person2_id) is already covered by uq_relationship_key_fields.
+    op.create_index('ix_person_tree_association_tree_id_person_id', 'person_tree_association',
+                    ['tree_id', 'person_id'], unique=False)
+    op.create_index('ix_relationships_created_at_id', 'relationships', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_relationships_created_at_id', table_name='relationships')
+    op.drop_index('ix_person_tree_association_tree_id_person_id', table_name='person_tree_association')
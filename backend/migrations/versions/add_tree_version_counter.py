@@ -0,0 +1,24 @@
+"""add_tree_version_counter
+
+Revision ID: add_tree_version_counter
+Revises: globalize_person_models
+Create Date: 2026-10-18 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_tree_version_counter'
+down_revision = 'globalize_person_models'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Per-tree change counter used for ETags and delta sync.
+    op.add_column('trees', sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('trees', 'version')
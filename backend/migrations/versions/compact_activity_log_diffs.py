@@ -0,0 +1,66 @@
+"""compact_activity_log_diffs
+
+Revision ID: compact_activity_log_diffs
+Revises: add_tree_change_journal
+Create Date: 2026-10-18 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'compact_activity_log_diffs'
+down_revision = 'add_tree_change_journal'
+branch_labels = None
+depends_on = None
+
+# Mirrors Config.AUDIT_SNAPSHOT_INTERVAL's default; fixed here so the migration is reproducible.
+SNAPSHOT_INTERVAL = 20
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    op.add_column('activity_log', sa.Column('changes', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('activity_log', sa.Column('is_snapshot', sa.Boolean(), nullable=False, server_default=sa.text('false')))
+
+    conn = op.get_bind()
+    # Creation entries already hold the full state.
+    conn.execute(sa.text(
+        "UPDATE activity_log SET is_snapshot = true WHERE action_type = 'CREATE_PERSON' AND new_state IS NOT NULL"
+    ))
+
+    # Rewrite full before/after UPDATE_PERSON pairs as diffs, keeping every Nth entry per
+    # person as a snapshot. Snapshot positions are fixed once up front, then rows are
+    # rewritten in batches so no single statement touches the whole table.
+    conn.execute(sa.text(
+        "CREATE TEMP TABLE activity_log_compaction ON COMMIT DROP AS "
+        "SELECT id, (row_number() OVER (PARTITION BY entity_type, entity_id ORDER BY created_at, id) "
+        "            % :interval = 0) AS keep_snapshot "
+        "FROM activity_log "
+        "WHERE action_type = 'UPDATE_PERSON' AND previous_state IS NOT NULL AND new_state IS NOT NULL"
+    ), {"interval": SNAPSHOT_INTERVAL})
+    while True:
+        result = conn.execute(sa.text(
+            "WITH batch AS ("
+            "    DELETE FROM activity_log_compaction WHERE id IN "
+            "        (SELECT id FROM activity_log_compaction LIMIT :batch_size) "
+            "    RETURNING id, keep_snapshot) "
+            "UPDATE activity_log a SET "
+            "    changes = (SELECT jsonb_object_agg(n.key, jsonb_build_object('old', a.previous_state -> n.key, 'new', n.value)) "
+            "               FROM jsonb_each(a.new_state) n "
+            "               WHERE n.key NOT IN ('id', 'created_at', 'updated_at') "
+            "                 AND (a.previous_state -> n.key) IS DISTINCT FROM n.value), "
+            "    is_snapshot = batch.keep_snapshot, "
+            "    new_state = CASE WHEN batch.keep_snapshot THEN a.new_state ELSE NULL END, "
+            "    previous_state = NULL "
+            "FROM batch WHERE a.id = batch.id"
+        ), {"batch_size": BATCH_SIZE})
+        if result.rowcount == 0:
+            break
+
+
+def downgrade():
+    # The dropped before/after payloads cannot be restored; only the schema is reverted.
+    op.drop_column('activity_log', 'is_snapshot')
+    op.drop_column('activity_log', 'changes')
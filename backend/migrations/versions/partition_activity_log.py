@@ -0,0 +1,92 @@
+"""partition_activity_log
+
+Revision ID: partition_activity_log
+Revises: compact_activity_log_diffs
+Create Date: 2026-10-18 12:00:00
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'partition_activity_log'
+down_revision = 'compact_activity_log_diffs'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+_COLUMNS = ("id, tree_id, user_id, entity_type, entity_id, action_type, previous_state, new_state, "
+            "changes, is_snapshot, ip_address, user_agent, created_at")
+_SINGLE_COLUMN_INDEXES = ('tree_id', 'user_id', 'entity_type', 'entity_id', 'action_type', 'created_at')
+
+
+def _add_months(month, months):
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _activity_log_columns():
+    return [
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tree_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('trees.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('entity_type', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action_type', sa.String(length=50), nullable=False),
+        sa.Column('previous_state', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('new_state', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('changes', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('is_snapshot', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+        sa.Column('ip_address', sa.String(length=50), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    ]
+
+
+def upgrade():
+    conn = op.get_bind()
+    op.rename_table('activity_log', 'activity_log_legacy')
+    op.execute('ALTER INDEX activity_log_pkey RENAME TO activity_log_legacy_pkey')
+
+    op.create_table(
+        'activity_log', *_activity_log_columns(),
+        sa.PrimaryKeyConstraint('id', 'created_at', name='activity_log_pkey'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+
+    # One partition per month from the oldest existing row through MONTHS_AHEAD months from now.
+    oldest = conn.execute(sa.text('SELECT min(created_at) FROM activity_log_legacy')).scalar()
+    this_month = date.today().replace(day=1)
+    month = (oldest.date().replace(day=1) if oldest else this_month)
+    while month <= _add_months(this_month, MONTHS_AHEAD):
+        op.execute(
+            f"CREATE TABLE activity_log_y{month.year:04d}m{month.month:02d} PARTITION OF activity_log "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    op.execute('CREATE TABLE activity_log_default PARTITION OF activity_log DEFAULT')
+
+    op.execute(
+        f"INSERT INTO activity_log ({_COLUMNS}) "
+        f"SELECT {_COLUMNS.replace('created_at', 'COALESCE(created_at, now())')} FROM activity_log_legacy"
+    )
+    op.drop_table('activity_log_legacy')
+
+    # Composite indexes matching the (tree|user|entity, created_at) access paths; created on
+    # the parent so every partition, current and future, gets them.
+    op.create_index('ix_activity_log_tree_id_created_at', 'activity_log', ['tree_id', 'created_at'])
+    op.create_index('ix_activity_log_user_id_created_at', 'activity_log', ['user_id', 'created_at'])
+    op.create_index('ix_activity_log_entity_created_at', 'activity_log', ['entity_type', 'entity_id', 'created_at'])
+
+
+def downgrade():
+    op.rename_table('activity_log', 'activity_log_partitioned')
+    op.execute('ALTER INDEX activity_log_pkey RENAME TO activity_log_partitioned_pkey')
+    op.create_table('activity_log', *_activity_log_columns(), sa.PrimaryKeyConstraint('id', name='activity_log_pkey'))
+    op.execute(f"INSERT INTO activity_log ({_COLUMNS}) SELECT {_COLUMNS} FROM activity_log_partitioned")
+    op.execute('DROP TABLE activity_log_partitioned CASCADE')
+    for column in _SINGLE_COLUMN_INDEXES:
+        op.create_index(f'ix_activity_log_{column}', 'activity_log', [column])
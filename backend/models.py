@@ -3,8 +3,8 @@ import enum
 import uuid
 from datetime import datetime, date
 from sqlalchemy import (
-    Column, Integer, Boolean, DateTime, Date, ForeignKey, String, Text,
-    Enum as SQLAlchemyEnum, UniqueConstraint
+    Column, Integer, BigInteger, Boolean, DateTime, Date, ForeignKey, String, Text,
+    Enum as SQLAlchemyEnum, UniqueConstraint, Index
 )
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -16,6 +16,35 @@ import structlog
 Base = declarative_base()
 logger = structlog.get_logger(__name__)
 
+
+class SparseFieldsMixin:
+    """Serializes a caller-chosen subset of columns (sparse fieldsets, ``?fields=``).
+
+    Only the requested attributes are touched, so rows loaded with ``load_only``
+    never trigger deferred-column loads while being serialized.
+    """
+
+    _sparse_excluded_fields = () # Bookkeeping columns to_dict() does not expose either
+
+    @classmethod
+    def sparse_field_names(cls):
+        return [column.key for column in cls.__table__.columns if column.key not in cls._sparse_excluded_fields]
+
+    @staticmethod
+    def _serialize_value(value):
+        if isinstance(value, (datetime, date)): return value.isoformat()
+        if isinstance(value, enum.Enum): return value.value
+        if isinstance(value, uuid.UUID): return str(value)
+        if isinstance(value, list): return [str(v) if isinstance(v, uuid.UUID) else v for v in value]
+        return value
+
+    def to_sparse_dict(self, fields):
+        data = {"id": str(self.id)}
+        for field in fields:
+            if field != "id":
+                data[field] = self._serialize_value(getattr(self, field))
+        return data
+
 # Custom EncryptedString Type
 class EncryptedString(TypeDecorator):
     impl = Text 
@@ -144,6 +173,10 @@ class Tree(Base):
     privacy_setting = Column(SQLAlchemyEnum(TreePrivacySettingEnum, name="treeprivacysettingenum", create_type=False), 
                              nullable=False, default=TreePrivacySettingEnum.PRIVATE, 
                              server_default=TreePrivacySettingEnum.PRIVATE.value) # New field
+    # Monotonic change counter, bumped in the same transaction as every write touching the tree
+    version = Column(BigInteger, nullable=False, default=0, server_default='0')
+    # Low-water mark of the change journal: rows up to this version have been pruned
+    journal_min_version = Column(BigInteger, nullable=False, default=0, server_default='0')
 
     def to_dict(self):
         return {"id": str(self.id), "name": self.name, "description": self.description,
@@ -152,6 +185,7 @@ class Tree(Base):
             "privacy_setting": self.privacy_setting.value, # Added privacy_setting
             "default_privacy_level": self.default_privacy_level.value,
             "cover_image_url": self.cover_image_url, 
+            "version": self.version,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None}
 
@@ -175,6 +209,8 @@ class PersonTreeAssociation(Base):
     __tablename__ = "person_tree_association"
     person_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), primary_key=True)
     tree_id = Column(PG_UUID(as_uuid=True), ForeignKey("trees.id", ondelete="CASCADE"), primary_key=True)
+    # The primary key leads with person_id; tree-scoped lookups ("is this person in tree X") need the reverse order
+    __table_args__ = (Index("ix_person_tree_association_tree_id_person_id", "tree_id", "person_id"),)
     # Add any other relevant fields if needed, like 'date_added_to_tree', 'role_in_tree' (if a person can have different roles in different trees)
     # For now, keeping it simple as per the plan.
     # Consider adding a __table_args__ for a UniqueConstraint on (person_id, tree_id) if not already covered by composite primary key.
@@ -187,8 +223,57 @@ class PersonTreeAssociation(Base):
     #         "tree_id": str(self.tree_id),
     #     }
 
-class Person(Base):
+class TreeChange(Base):
+    """Change journal entry: one row per entity touched by a write, per affected tree version."""
+    __tablename__ = "tree_changes"
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tree_id = Column(PG_UUID(as_uuid=True), ForeignKey("trees.id", ondelete="CASCADE"), nullable=False)
+    version = Column(BigInteger, nullable=False)
+    entity_type = Column(String(50), nullable=False) # person, relationship, event, media, association, tree
+    entity_id = Column(PG_UUID(as_uuid=True), nullable=False)
+    operation = Column(String(10), nullable=False) # upsert or delete
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_tree_changes_tree_id_version", "tree_id", "version"),
+                      Index("ix_tree_changes_created_at", "created_at"),) # Retention pruning
+
+    def to_dict(self):
+        return {"id": str(self.id), "tree_id": str(self.tree_id), "version": self.version,
+            "entity_type": self.entity_type, "entity_id": str(self.entity_id),
+            "operation": self.operation,
+            "created_at": self.created_at.isoformat() if self.created_at else None}
+
+class ImportJob(Base):
+    """A GEDCOM import into a tree; progress is checkpointed per committed chunk so a failed job can resume."""
+    __tablename__ = "import_jobs"
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tree_id = Column(PG_UUID(as_uuid=True), ForeignKey("trees.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    filename = Column(String(255))
+    source_key = Column(String(512), nullable=False) # Object-storage key of the uploaded file
+    status = Column(String(20), nullable=False, default="pending") # pending, running, completed, failed
+    phase = Column(String(20), nullable=False, default="individuals") # individuals, then families
+    records_done = Column(Integer, nullable=False, default=0) # Level-0 records committed in the current phase
+    people_imported = Column(Integer, nullable=False, default=0)
+    relationships_imported = Column(Integer, nullable=False, default=0)
+    events_imported = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+    def to_dict(self):
+        return {"id": str(self.id), "tree_id": str(self.tree_id), "user_id": str(self.user_id),
+            "filename": self.filename, "status": self.status, "phase": self.phase,
+            "records_done": self.records_done, "people_imported": self.people_imported,
+            "relationships_imported": self.relationships_imported, "events_imported": self.events_imported,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None}
+
+class Person(SparseFieldsMixin, Base):
     __tablename__ = "people"
+    _sparse_excluded_fields = ("audit_entries_since_snapshot",)
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     first_name = Column(EncryptedString, index=True) 
     middle_names = Column(EncryptedString)
@@ -215,8 +300,10 @@ class Person(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     profile_picture_url = Column(String(512))  # Added profile_picture_url field
     custom_fields = Column(JSONB, nullable=True, default=dict)  # Added custom_fields
+    audit_entries_since_snapshot = Column(Integer, nullable=False, default=0, server_default='0') # Diff-only audit entries since the last full snapshot
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        if fields: return self.to_sparse_dict(fields)
         return {"id": str(self.id), "first_name": self.first_name,
             "middle_names": self.middle_names, "last_name": self.last_name, "maiden_name": self.maiden_name,
             "nickname": self.nickname, "gender": self.gender,
@@ -234,7 +321,7 @@ class Person(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None}
 
-class Relationship(Base):
+class Relationship(SparseFieldsMixin, Base):
     __tablename__ = "relationships"
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     person1_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -248,9 +335,11 @@ class Relationship(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     location = Column(String(255), nullable=True) # Added location field
-    __table_args__ = (UniqueConstraint("person1_id", "person2_id", "relationship_type", name="uq_relationship_key_fields"),)
+    __table_args__ = (UniqueConstraint("person1_id", "person2_id", "relationship_type", name="uq_relationship_key_fields"),
+                      Index("ix_relationships_created_at_id", "created_at", "id"),) # Keyset pagination order
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        if fields: return self.to_sparse_dict(fields)
         return {"id": str(self.id),
             "person1_id": str(self.person1_id), "person2_id": str(self.person2_id),
             "relationship_type": self.relationship_type.value,
@@ -262,7 +351,22 @@ class Relationship(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None}
 
-class Event(Base):
+class InferredSibling(Base):
+    """Sibling pair derived from shared biological/step parent edges; stored in both directions."""
+    __tablename__ = "inferred_siblings"
+    person_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), primary_key=True)
+    sibling_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), primary_key=True)
+    sibling_type = Column(SQLAlchemyEnum(RelationshipTypeEnum, name="relationshiptypeenum", create_type=False), nullable=False) # sibling_full, sibling_half or sibling_step
+    shared_parent_ids = Column(JSONB, nullable=False, default=list)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_inferred_siblings_sibling_id", "sibling_id"),)
+
+    def to_dict(self):
+        return {"person_id": str(self.person_id), "sibling_id": str(self.sibling_id),
+            "sibling_type": self.sibling_type.value, "shared_parent_ids": self.shared_parent_ids,
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None}
+
+class Event(SparseFieldsMixin, Base):
     __tablename__ = "events"
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     person_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), nullable=True, index=True) # Changed to nullable=True
@@ -278,7 +382,8 @@ class Event(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        if fields: return self.to_sparse_dict(fields)
         return {
             "id": str(self.id),
             "person_id": str(self.person_id) if self.person_id else None, # Handle nullable person_id
@@ -297,7 +402,15 @@ class Event(Base):
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
-class MediaItem(Base): # Renamed Media to MediaItem
+class EventParticipant(Base):
+    """Normalized copy of Event.person_id ("principal") and Event.related_person_ids ("related") for indexed lookups."""
+    __tablename__ = "event_participants"
+    event_id = Column(PG_UUID(as_uuid=True), ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    person_id = Column(PG_UUID(as_uuid=True), ForeignKey("people.id", ondelete="CASCADE"), primary_key=True)
+    role = Column(String(20), primary_key=True) # principal or related
+    __table_args__ = (Index("ix_event_participants_person_id_event_id", "person_id", "event_id"),)
+
+class MediaItem(SparseFieldsMixin, Base): # Renamed Media to MediaItem
     __tablename__ = "media" # Table name remains "media"
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     uploader_user_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True) # Renamed created_by
@@ -319,7 +432,8 @@ class MediaItem(Base): # Renamed Media to MediaItem
     created_at = Column(DateTime, default=datetime.utcnow, index=True) # Renamed uploaded_at
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Existed
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        if fields: return self.to_sparse_dict(fields)
         return {
             "id": str(self.id),
             "uploader_user_id": str(self.uploader_user_id),
@@ -350,16 +464,25 @@ class Citation(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class ActivityLog(Base):
+    """Audit trail, range-partitioned by month on created_at (see services/activity_retention_service.py)."""
     __tablename__ = "activity_log"
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tree_id = Column(PG_UUID(as_uuid=True), ForeignKey("trees.id", ondelete="SET NULL"), index=True)
-    user_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), index=True)
-    entity_type = Column(String(50), nullable=False, index=True)
-    entity_id = Column(PG_UUID(as_uuid=True), nullable=False, index=True)
-    action_type = Column(String(50), nullable=False, index=True)
+    tree_id = Column(PG_UUID(as_uuid=True), ForeignKey("trees.id", ondelete="SET NULL"))
+    user_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
+    entity_type = Column(String(50), nullable=False)
+    entity_id = Column(PG_UUID(as_uuid=True), nullable=False)
+    action_type = Column(String(50), nullable=False)
     previous_state = Column(JSONB); new_state = Column(JSONB)
+    changes = Column(JSONB) # Field-level diff: {field: {"old": ..., "new": ...}}
+    is_snapshot = Column(Boolean, nullable=False, default=False, server_default='false') # new_state is the full entity state
     ip_address = Column(String(50)); user_agent = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow) # Partition key, so part of the PK
+    __table_args__ = (
+        Index("ix_activity_log_tree_id_created_at", "tree_id", "created_at"),
+        Index("ix_activity_log_user_id_created_at", "user_id", "created_at"),
+        Index("ix_activity_log_entity_created_at", "entity_type", "entity_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     def to_dict(self):
         return {"id": str(self.id),
@@ -367,6 +490,7 @@ class ActivityLog(Base):
             "user_id": str(self.user_id) if self.user_id else None,
             "entity_type": self.entity_type, "entity_id": str(self.entity_id),
             "action_type": self.action_type, "previous_state": self.previous_state,
-            "new_state": self.new_state, "ip_address": self.ip_address,
+            "new_state": self.new_state, "changes": self.changes,
+            "is_snapshot": self.is_snapshot, "ip_address": self.ip_address,
             "user_agent": self.user_agent,
             "created_at": self.created_at.isoformat() if self.created_at else None}
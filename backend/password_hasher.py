@@ -0,0 +1,152 @@
+# backend/password_hasher.py
+"""
+bcrypt hashing and verification on a bounded process pool.
+
+bcrypt holds the calling thread for the whole cost computation (~250 ms at cost 12),
+so running it on the request thread stalls sync workers during login/register bursts.
+Work is submitted to a ProcessPoolExecutor created lazily per process (i.e. after the
+gunicorn fork). A semaphore caps workers + queued jobs; when it is exhausted callers
+get PasswordHasherBusy immediately instead of queueing behind a burst. A slot is held
+until its job actually finishes, not until the caller stops waiting, so timed-out jobs
+still count against the cap. A broken pool (a worker died) is discarded and rebuilt on
+the next call.
+"""
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import bcrypt
+import structlog
+from prometheus_client import Counter, Gauge, Histogram
+
+from config import config
+
+logger = structlog.get_logger(__name__)
+
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight", "Password hash/verify jobs running or queued in the pool.")
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total", "Password hash/verify jobs rejected because the pool was saturated.",
+    ["operation"])
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "Wall time of password hash/verify jobs, including queueing.",
+    ["operation"])
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the pool is saturated or a job exceeds PASSWORD_HASH_TIMEOUT."""
+
+
+# --- Work functions: module-level so they can be pickled into worker processes ---
+def _bcrypt_hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+def _bcrypt_check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, config.PASSWORD_HASH_WORKERS + config.PASSWORD_HASH_MAX_PENDING))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: workers must not inherit the parent's threads, locks or DB connections
+                _executor = ProcessPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+                logger.info("Password hashing pool started.", workers=config.PASSWORD_HASH_WORKERS,
+                            max_pending=config.PASSWORD_HASH_MAX_PENDING)
+    return _executor
+
+
+def _discard_executor(broken: Optional[ProcessPoolExecutor]) -> None:
+    """Drops a broken pool so the next call starts a fresh one."""
+    global _executor
+    if broken is None:
+        return
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _release_slot(future: Optional[Future] = None) -> None:
+    PASSWORD_HASH_IN_FLIGHT.dec()
+    _slots.release()
+
+
+def _run(operation: str, fn, *args):
+    if config.PASSWORD_HASH_WORKERS <= 0:
+        with PASSWORD_HASH_DURATION.labels(operation=operation).time():
+            return fn(*args)
+
+    if not _slots.acquire(blocking=False):
+        PASSWORD_HASH_REJECTED.labels(operation=operation).inc()
+        logger.warning("Password hashing pool saturated, rejecting job.", operation=operation)
+        raise PasswordHasherBusy(f"Password {operation} pool is saturated.")
+    PASSWORD_HASH_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    executor = None
+    try:
+        executor = _get_executor()
+        future = executor.submit(fn, *args)
+    except BrokenExecutor:
+        _release_slot()
+        _discard_executor(executor)
+        PASSWORD_HASH_REJECTED.labels(operation=operation).inc()
+        logger.error("Password hashing pool is broken, restarting it.", operation=operation, exc_info=True)
+        raise PasswordHasherBusy(f"Password {operation} pool is unavailable.")
+    except BaseException:
+        _release_slot()
+        raise
+    future.add_done_callback(_release_slot) # The slot stays taken until the worker is really done
+    try:
+        return future.result(timeout=config.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        PASSWORD_HASH_REJECTED.labels(operation=operation).inc()
+        logger.warning("Password hashing job timed out.", operation=operation, timeout=config.PASSWORD_HASH_TIMEOUT)
+        raise PasswordHasherBusy(f"Password {operation} timed out.")
+    except BrokenExecutor:
+        _discard_executor(executor)
+        PASSWORD_HASH_REJECTED.labels(operation=operation).inc()
+        logger.error("Password hashing pool broke mid-job, restarting it.", operation=operation, exc_info=True)
+        raise PasswordHasherBusy(f"Password {operation} pool is unavailable.")
+    finally:
+        PASSWORD_HASH_DURATION.labels(operation=operation).observe(time.perf_counter() - started)
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """Hashes with BCRYPT_ROUNDS (or `rounds`). Raises PasswordHasherBusy."""
+    return _run("hash", _bcrypt_hash, password.encode('utf-8'), rounds or config.BCRYPT_ROUNDS).decode('utf-8')
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Checks a password against a bcrypt hash. Raises PasswordHasherBusy."""
+    return _run("verify", _bcrypt_check, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Returns the cost factor encoded in a bcrypt hash ("$2b$12$..."), or None if unparseable."""
+    try:
+        return int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when a stored hash was produced with a cost other than BCRYPT_ROUNDS."""
+    rounds = hash_rounds(hashed_password)
+    return rounds is not None and rounds != config.BCRYPT_ROUNDS
+
+
+@atexit.register
+def _shutdown_executor() -> None:
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,269 @@
+# backend/permission_cache.py
+"""
+Two-tier cache of resolved tree permissions for @require_tree_access.
+
+Entries are keyed by (user_id, tree_id) and hold the user's resolved access level
+(owner -> 'admin', else the TreeAccess level, else None) plus the tree's privacy
+setting, which is everything the decorator needs to decide a request without
+querying `trees` and `tree_access`.
+
+Tier 1 is an in-process LRU with a short TTL, tier 2 is one Redis key per (tree, user)
+with its own PERMISSION_CACHE_REDIS_TTL. Each tree has a generation counter (per process
+and in Redis) that every invalidation increments. A lookup returns the generation it saw,
+and set_permission writes only if it is unchanged (a Lua compare-and-set in Redis), so a
+request that read the DB before an invalidation can never store the old level after it.
+Redis entries also carry their generation and are ignored once it moves on, so an
+invalidation is a single INCR. The local TTL bounds how long another worker can serve a
+stale entry after an invalidation. Redis errors are logged and treated as misses; the DB
+stays the source of truth.
+
+Invalidations are always attempted, even while backing off after an error. One that
+cannot reach Redis stays queued, and this worker neither reads nor writes Redis until
+the queue has been flushed, so a stale grant it failed to invalidate is never served again.
+"""
+import json
+import time
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+import redis
+import structlog
+from prometheus_client import Counter
+
+from config import config
+
+logger = structlog.get_logger(__name__)
+
+PERMISSION_CACHE_LOOKUPS = Counter(
+    "tree_permission_cache_lookups_total",
+    "Tree permission cache lookups by result (local_hit, redis_hit, miss).",
+    ["result"],
+)
+PERMISSION_CACHE_TIME_SAVED = Counter(
+    "tree_permission_cache_time_saved_seconds_total",
+    "Estimated DB time avoided by tree permission cache hits.",
+)
+
+_REDIS_KEY_PREFIX = "treeperm:"
+_REDIS_RETRY_AFTER_SECONDS = 30.0 # Back-off after a Redis error before trying again
+
+CacheKey = Tuple[str, str] # (user_id, tree_id)
+Generation = Tuple[int, Optional[int]] # (local generation, Redis generation or None if Redis was not consulted)
+
+# KEYS: generation key, entry key. ARGV: generation seen by the lookup, entry JSON, TTL.
+_SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def _generation_key(tree_id: str) -> str:
+    return f"{_REDIS_KEY_PREFIX}{{{tree_id}}}:gen" # Hash tag keeps a tree's keys in one cluster slot
+
+
+def _entry_key(tree_id: str, user_id: str) -> str:
+    return f"{_REDIS_KEY_PREFIX}{{{tree_id}}}:{user_id}"
+
+
+class _LocalTTLCache:
+    """Thread-safe LRU with a per-entry expiry and a per-tree generation that discards bump."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, tree_id: str) -> int:
+        with self._lock:
+            return self._generations.get(tree_id, 0)
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: CacheKey, value: Dict[str, Any], generation: Optional[int] = None) -> None:
+        """Stores `value`, unless `generation` is given and the tree was invalidated since."""
+        with self._lock:
+            if generation is not None and self._generations.get(key[1], 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: CacheKey) -> None:
+        with self._lock:
+            self._generations[key[1]] = self._generations.get(key[1], 0) + 1
+            self._entries.pop(key, None)
+
+    def discard_tree(self, tree_id: str) -> None:
+        with self._lock:
+            self._generations[tree_id] = self._generations.get(tree_id, 0) + 1
+            for key in [k for k in self._entries if k[1] == tree_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_local_cache = _LocalTTLCache(config.PERMISSION_CACHE_LOCAL_MAX_ENTRIES, config.PERMISSION_CACHE_LOCAL_TTL)
+_redis_client = None
+_redis_retry_at = 0.0
+_pending_invalidations: Set[str] = set() # Tree ids whose Redis generation has not been incremented yet
+_pending_lock = threading.Lock()
+_avg_db_resolve_seconds: Optional[float] = None # EWMA of uncached resolution time, for the time-saved metric
+
+
+def _get_redis(ignore_backoff: bool = False):
+    """Returns the Redis client, or None while backing off after an error (unless `ignore_backoff`)."""
+    global _redis_client
+    if not config.REDIS_URL or (not ignore_backoff and time.monotonic() < _redis_retry_at):
+        return None
+    if _redis_client is None:
+        _redis_client = redis.from_url(config.REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _redis_client
+
+
+def _redis_failed(action: str) -> None:
+    global _redis_retry_at
+    _redis_retry_at = time.monotonic() + _REDIS_RETRY_AFTER_SECONDS
+    logger.warning("Permission cache Redis error, falling back to DB.", action=action, exc_info=True)
+
+
+def _flush_invalidations(client) -> bool:
+    """Applies queued invalidations; True when none are left, i.e. Redis may be used again."""
+    with _pending_lock:
+        pending = list(_pending_invalidations)
+    if not pending:
+        return True
+    try:
+        pipe = client.pipeline()
+        for tree_id in pending:
+            pipe.incr(_generation_key(tree_id))
+        pipe.execute()
+    except redis.RedisError:
+        _redis_failed("invalidate")
+        return False
+    with _pending_lock:
+        _pending_invalidations.difference_update(pending)
+        return not _pending_invalidations
+
+
+def _usable_redis():
+    """The Redis client if it is reachable and no invalidation is outstanding, else None."""
+    client = _get_redis()
+    if client is None or not _flush_invalidations(client):
+        return None
+    return client
+
+
+def get_permission(user_id: uuid.UUID, tree_id: uuid.UUID) -> Tuple[Optional[Dict[str, Any]], Generation]:
+    """
+    Returns the cached {"access_level", "privacy_setting"} entry (None on a miss) and the
+    tree generation observed, which must be passed to set_permission after a DB resolve.
+    """
+    key = (str(user_id), str(tree_id))
+    generation: Generation = (_local_cache.generation(key[1]), None)
+    if not config.PERMISSION_CACHE_ENABLED:
+        return None, generation
+    started = time.perf_counter()
+
+    entry = _local_cache.get(key)
+    if entry is not None:
+        _record_hit("local_hit", started)
+        return entry, generation
+
+    client = _usable_redis()
+    if client is not None:
+        try:
+            raw_generation, raw = client.mget(_generation_key(key[1]), _entry_key(key[1], key[0]))
+            generation = (generation[0], int(raw_generation or 0))
+        except redis.RedisError:
+            _redis_failed("get")
+            raw = None
+        if raw is not None:
+            stored = json.loads(raw)
+            if stored.get("generation") == generation[1]: # Written before the last invalidation otherwise
+                entry = stored["entry"]
+                _local_cache.set(key, entry, generation[0])
+                _record_hit("redis_hit", started)
+                return entry, generation
+
+    PERMISSION_CACHE_LOOKUPS.labels(result="miss").inc()
+    return None, generation
+
+
+def set_permission(user_id: uuid.UUID, tree_id: uuid.UUID, access_level: Optional[str],
+                   privacy_setting: str, generation: Generation, resolve_seconds: Optional[float] = None) -> None:
+    """
+    Stores a permission resolved from the DB, in each tier only if that tier's generation
+    still equals the one get_permission returned. `resolve_seconds` feeds the time-saved estimate.
+    """
+    global _avg_db_resolve_seconds
+    if not config.PERMISSION_CACHE_ENABLED:
+        return
+    if resolve_seconds is not None:
+        _avg_db_resolve_seconds = (resolve_seconds if _avg_db_resolve_seconds is None
+                                   else 0.9 * _avg_db_resolve_seconds + 0.1 * resolve_seconds)
+    key = (str(user_id), str(tree_id))
+    entry = {"access_level": access_level, "privacy_setting": privacy_setting}
+    local_generation, redis_generation = generation
+    _local_cache.set(key, entry, local_generation)
+
+    if redis_generation is None: # The lookup could not read the generation, so the write cannot be fenced
+        return
+    client = _usable_redis()
+    if client is not None:
+        try:
+            client.eval(_SET_IF_GENERATION_SCRIPT, 2, _generation_key(key[1]), _entry_key(key[1], key[0]),
+                        str(redis_generation), json.dumps({"entry": entry, "generation": redis_generation}),
+                        config.PERMISSION_CACHE_REDIS_TTL)
+        except redis.RedisError:
+            _redis_failed("set")
+
+
+def _invalidate(tree_id: str) -> None:
+    with _pending_lock:
+        _pending_invalidations.add(tree_id)
+    client = _get_redis(ignore_backoff=True) # A skipped INCR would leave a stale grant readable by other workers
+    if client is not None:
+        _flush_invalidations(client)
+
+
+def invalidate_tree(tree_id: uuid.UUID) -> None:
+    """Drops every user's entry for a tree (privacy change, deletion)."""
+    _local_cache.discard_tree(str(tree_id))
+    _invalidate(str(tree_id))
+
+
+def invalidate_tree_access(tree_id: uuid.UUID, user_id: uuid.UUID) -> None:
+    """
+    Drops one user's entry for a tree (TreeAccess grant, change or revocation). In Redis
+    this bumps the tree's generation, so the tree's other entries are re-resolved too.
+    """
+    _local_cache.discard((str(user_id), str(tree_id)))
+    _invalidate(str(tree_id))
+
+
+def _record_hit(result: str, started: float) -> None:
+    PERMISSION_CACHE_LOOKUPS.labels(result=result).inc()
+    if _avg_db_resolve_seconds is not None:
+        saved = _avg_db_resolve_seconds - (time.perf_counter() - started)
+        if saved > 0:
+            PERMISSION_CACHE_TIME_SAVED.inc(saved)
@@ -0,0 +1,133 @@
+# backend/pool_monitor.py
+"""
+Connection-pool telemetry for the SQLAlchemy engines.
+
+InstrumentedQueuePool times how long each checkout waits for a connection, and a
+PoolMonitor attached to the engine tracks which endpoint holds every checked-out
+connection, invalidations and connection lifetimes. Metrics go to Prometheus and,
+when configured, OpenTelemetry. Waits above DB_POOL_WAIT_WARN_MS are logged with
+the endpoint that has held a connection the longest, which is usually the culprit.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import structlog
+from flask import has_request_context, request
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+import config as app_config_module
+import extensions as app_extensions_module
+
+logger = structlog.get_logger(__name__)
+
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+POOL_INVALIDATIONS = Counter(
+    "db_pool_invalidations_total", "Pooled connections invalidated (e.g. after a disconnect).", ["engine"])
+POOL_CONNECTION_LIFETIME = Histogram(
+    "db_pool_connection_lifetime_seconds", "Age of DBAPI connections when they are closed.", ["engine"],
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports how long every checkout waited to its PoolMonitor."""
+
+    monitor: Optional["PoolMonitor"] = None
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            if self.monitor is not None:
+                self.monitor.record_wait(time.monotonic() - started, self)
+
+    def recreate(self):
+        new_pool = super().recreate() # Called by engine.dispose(); keep reporting to the same monitor
+        new_pool.monitor = self.monitor
+        return new_pool
+
+
+def _holder_name() -> str:
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name # Celery tasks, startup code
+
+
+class PoolMonitor:
+    """Pool event listeners for one engine, labelled by its role ("primary", "replica-0", ...)."""
+
+    def __init__(self, label: str, wait_warn_seconds: Optional[float] = None):
+        self.label = label
+        if wait_warn_seconds is None:
+            wait_warn_seconds = app_config_module.config.DB_POOL_WAIT_WARN_MS / 1000.0
+        self.wait_warn_seconds = wait_warn_seconds
+        self.invalidations = 0
+        self._holders: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine: Engine) -> "PoolMonitor":
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.monitor = self
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "close", self._on_close)
+        return self
+
+    def record_wait(self, seconds: float, pool: QueuePool) -> None:
+        POOL_CHECKOUT_WAIT.labels(engine=self.label).observe(seconds)
+        if app_extensions_module.db_pool_checkout_wait_histogram is not None:
+            app_extensions_module.db_pool_checkout_wait_histogram.record(seconds * 1000, {"engine": self.label})
+        if seconds < self.wait_warn_seconds:
+            return
+        holder = self.longest_holder()
+        logger.warning("Slow database connection checkout.", engine=self.label,
+                       wait_ms=round(seconds * 1000, 2), pool=self.status(pool),
+                       longest_holder=holder["endpoint"] if holder else None,
+                       longest_held_ms=holder["held_ms"] if holder else None)
+
+    def longest_holder(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._holders:
+                return None
+            endpoint, since = min(self._holders.values(), key=lambda holder: holder[1])
+        return {"endpoint": endpoint, "held_ms": round((time.monotonic() - since) * 1000, 2)}
+
+    def status(self, pool) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"invalidations": self.invalidations, "longest_holder": self.longest_holder()}
+        if isinstance(pool, QueuePool):
+            status.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                          overflow=max(pool.overflow(), 0), max_overflow=pool._max_overflow)
+            status["saturated"] = status["checked_out"] >= pool.size() + max(pool._max_overflow, 0)
+        return status
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        connection_record.info["connected_at"] = time.monotonic()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self._holders[id(connection_record)] = (_holder_name(), time.monotonic())
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self._holders.pop(id(connection_record), None)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self.invalidations += 1
+        POOL_INVALIDATIONS.labels(engine=self.label).inc()
+        if app_extensions_module.db_pool_invalidation_counter is not None:
+            app_extensions_module.db_pool_invalidation_counter.add(1, {"engine": self.label})
+        logger.warning("Database connection invalidated.", engine=self.label,
+                       error=str(exception) if exception else None)
+
+    def _on_close(self, dbapi_connection, connection_record) -> None:
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            POOL_CONNECTION_LIFETIME.labels(engine=self.label).observe(time.monotonic() - connected_at)
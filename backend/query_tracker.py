@@ -0,0 +1,111 @@
+# backend/query_tracker.py
+"""
+Per-request SQL statement accounting and N+1 detection.
+
+Cursor-execute hooks on every engine count the statements a request runs, their total
+DB time and how often each statement shape (fingerprint) repeats. At the end of the
+request the totals are exposed as a `Server-Timing` header and span attributes, and a
+request that exceeds QUERY_BUDGET, or repeats one statement QUERY_REPEAT_THRESHOLD
+times (the classic N+1), is logged. With QUERY_BUDGET_STRICT (or app.testing) the
+budget is enforced by raising QueryBudgetExceeded instead.
+"""
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from flask import current_app, g, has_request_context, request
+from opentelemetry import trace
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config as app_config_module
+
+logger = structlog.get_logger(__name__)
+
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*%\([^)]*\)s\s*,?)+\)", re.IGNORECASE)
+_POSTCOMPILE_RE = re.compile(r"__\[POSTCOMPILE_\w+\]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request runs more statements than its budget allows."""
+
+
+@dataclass
+class RequestQueryStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+
+def fingerprint(statement: str) -> str:
+    """Statement shape with bound-parameter lists collapsed, so `IN (...)` of any length matches."""
+    statement = _POSTCOMPILE_RE.sub("?", statement)
+    statement = _IN_LIST_RE.sub("IN (?)", statement)
+    return _WHITESPACE_RE.sub(" ", statement).strip()
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    if not has_request_context():
+        return None
+    stats = g.get("query_stats")
+    if stats is None:
+        stats = g.query_stats = RequestQueryStats()
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_tracker_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    started = getattr(context, "_query_tracker_started", None)
+    if stats is None or started is None:
+        return
+    stats.count += 1
+    stats.total_seconds += time.perf_counter() - started
+    stats.fingerprints[fingerprint(statement)] += 1
+
+
+def attach(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def finish_request(response):
+    """after_request hook: reports the request's statement totals and enforces the query budget."""
+    stats = g.pop("query_stats", None)
+    if stats is None:
+        return response
+    current_config = app_config_module.config
+    db_ms = round(stats.total_seconds * 1000, 2)
+    response.headers.add("Server-Timing", f'db;dur={db_ms};desc="{stats.count} queries"')
+
+    span = trace.get_current_span()
+    span.set_attribute("db.query_count", stats.count)
+    span.set_attribute("db.query_time_ms", db_ms)
+
+    repeated = stats.repeated(current_config.QUERY_REPEAT_THRESHOLD)
+    over_budget = stats.count > current_config.QUERY_BUDGET
+    if repeated:
+        span.set_attribute("db.repeated_statements", len(repeated))
+    if not (over_budget or repeated):
+        return response
+
+    details: Dict[str, object] = {
+        "endpoint": request.endpoint, "method": request.method, "query_count": stats.count,
+        "query_budget": current_config.QUERY_BUDGET, "db_time_ms": db_ms,
+        "repeated_statements": [{"statement": fp[:200], "count": n} for fp, n in repeated[:5]],
+    }
+    if over_budget and (current_config.QUERY_BUDGET_STRICT or current_app.testing):
+        raise QueryBudgetExceeded(f"{request.endpoint} ran {stats.count} queries (budget {current_config.QUERY_BUDGET}).")
+    logger.warning("Request exceeded query budget." if over_budget else "Possible N+1 query pattern.", **details)
+    return response
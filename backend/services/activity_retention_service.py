@@ -0,0 +1,183 @@
+# backend/services/activity_retention_service.py
+"""
+Partition maintenance and archival for the month-partitioned activity_log table.
+
+Partitions are named activity_log_yYYYYmMM and cover [first of month, first of next
+month). ensure_activity_log_partitions() pre-creates upcoming months, one transaction
+each, plus a DEFAULT partition as a safety net. Rows that landed in DEFAULT because a
+month was missing are moved into that month's partition when it is created, so they are
+archived like any other; archive_activity_log_partitions() detaches partitions
+older than the retention window, streams them to gzip-compressed NDJSON in object
+storage and drops them. Both are idempotent and safe to rerun after a failure: a
+partition that was detached but not yet archived is picked up again by name.
+"""
+import gzip
+import re
+import tempfile
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import config
+from storage_client import get_storage_client, create_bucket_if_not_exists
+
+logger = structlog.get_logger(__name__)
+
+_PARENT_TABLE = "activity_log"
+_DEFAULT_PARTITION = "activity_log_default"
+_PARTITION_NAME_RE = re.compile(r"^activity_log_y(\d{4})m(\d{2})$")
+_ARCHIVE_FETCH_SIZE = 5000
+
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{_PARENT_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def _partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def partitions_to_archive(partition_names: List[str], today: date, retention_months: int) -> List[str]:
+    """Names of monthly partitions that end on or before the retention cutoff, oldest first."""
+    cutoff = _add_months(_month_start(today), -retention_months)
+    expired = [(month, name) for name in partition_names
+               if (month := _partition_month(name)) is not None and _add_months(month, 1) <= cutoff]
+    return [name for _, name in sorted(expired)]
+
+
+def _create_month_partition(engine: Engine, month: date) -> None:
+    """
+    Creates one monthly partition in its own transaction. A DEFAULT partition holding rows in
+    the month's range would make a plain CREATE fail, so in that case the default is detached,
+    the month created, its rows moved across and the default re-attached, all atomically.
+    """
+    name = _partition_name(month)
+    bounds = {"start": month, "end": _add_months(month, 1)}
+    for_values = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    in_range = "created_at >= :start AND created_at < :end"
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+            return
+        stranded = conn.execute(text(f"SELECT count(*) FROM {_DEFAULT_PARTITION} WHERE {in_range}"), bounds).scalar()
+        if not stranded:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {_PARENT_TABLE} {for_values}"))
+            return
+        logger.warning("activity_log rows found in the DEFAULT partition; moving them to their month.",
+                       partition=name, rows=stranded)
+        conn.execute(text(f"ALTER TABLE {_PARENT_TABLE} DETACH PARTITION {_DEFAULT_PARTITION}"))
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {_PARENT_TABLE} {for_values}"))
+        conn.execute(text(f"INSERT INTO {_PARENT_TABLE} SELECT * FROM {_DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+        conn.execute(text(f"DELETE FROM {_DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+        conn.execute(text(f"ALTER TABLE {_PARENT_TABLE} ATTACH PARTITION {_DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_activity_log_partitions(engine: Engine, months_ahead: Optional[int] = None,
+                                   start: Optional[date] = None) -> List[str]:
+    """
+    Creates the monthly partitions from `start` (default: this month) through `months_ahead`
+    months ahead, plus any month whose rows are sitting in the DEFAULT partition. A month that
+    fails does not stop the others; the run raises afterwards so the failure is noticed.
+    """
+    months_ahead = config.ACTIVITY_LOG_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    first_month = _month_start(start or datetime.utcnow().date())
+    last_month = _add_months(_month_start(datetime.utcnow().date()), months_ahead)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {_DEFAULT_PARTITION} PARTITION OF {_PARENT_TABLE} DEFAULT"))
+        months = {value.date() if isinstance(value, datetime) else value for value in conn.execute(
+            text(f"SELECT DISTINCT date_trunc('month', created_at) FROM {_DEFAULT_PARTITION}")).scalars()}
+    month = first_month
+    while month <= last_month:
+        months.add(month)
+        month = _add_months(month, 1)
+
+    created, failed = [], []
+    for month in sorted(months):
+        try:
+            _create_month_partition(engine, month)
+            created.append(_partition_name(month))
+        except SQLAlchemyError:
+            logger.error("Could not create activity_log partition.", partition=_partition_name(month), exc_info=True)
+            failed.append(_partition_name(month))
+    logger.info("activity_log partitions ensured.", first=created[0] if created else None,
+                last=created[-1] if created else None, failed=failed)
+    if failed:
+        raise RuntimeError(f"Could not create activity_log partitions: {', '.join(failed)}")
+    return created
+
+
+def _list_partitions(engine: Engine) -> Dict[str, bool]:
+    """{partition_name: is_attached} for every monthly activity_log table, attached or not."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname, i.inhparent IS NOT NULL AS attached "
+            "FROM pg_class c LEFT JOIN pg_inherits i ON i.inhrelid = c.oid "
+            "WHERE c.relkind = 'r' AND c.relname ~ '^activity_log_y[0-9]{4}m[0-9]{2}$'"
+        )).all()
+    return {name: attached for name, attached in rows}
+
+
+def _archive_key(partition_name: str) -> str:
+    return f"{config.ACTIVITY_LOG_ARCHIVE_PREFIX}{partition_name}.ndjson.gz"
+
+
+def _archive_partition(engine: Engine, partition_name: str) -> Tuple[str, int]:
+    """Streams a (detached) partition to gzip NDJSON in object storage. Returns (object key, row count)."""
+    rows_written = 0
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, max_row_buffer=_ARCHIVE_FETCH_SIZE).execute(
+                    text(f"SELECT row_to_json(t)::text FROM {partition_name} t ORDER BY t.created_at, t.id")
+                )
+                for partition in result.partitions(_ARCHIVE_FETCH_SIZE):
+                    gz.write("".join(f"{line}\n" for (line,) in partition).encode("utf-8"))
+                    rows_written += len(partition)
+        spool.seek(0)
+        s3_client = get_storage_client()
+        bucket = config.OBJECT_STORAGE_BUCKET_NAME
+        if not create_bucket_if_not_exists(s3_client, bucket):
+            raise RuntimeError(f"Object storage bucket '{bucket}' is not available.")
+        key = _archive_key(partition_name)
+        s3_client.upload_fileobj(spool, bucket, key,
+                                 ExtraArgs={"ContentType": "application/x-ndjson", "ContentEncoding": "gzip"})
+    return key, rows_written
+
+
+def archive_activity_log_partitions(engine: Engine, retention_months: Optional[int] = None,
+                                    today: Optional[date] = None) -> List[Dict[str, object]]:
+    """
+    Detaches, archives and drops every monthly partition older than the retention window.
+    A partition is only dropped after its archive upload succeeded.
+    """
+    retention_months = config.ACTIVITY_LOG_RETENTION_MONTHS if retention_months is None else retention_months
+    partitions = _list_partitions(engine)
+    archived = []
+    for name in partitions_to_archive(list(partitions), today or datetime.utcnow().date(), retention_months):
+        try:
+            if partitions[name]:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {_PARENT_TABLE} DETACH PARTITION {name}"))
+                logger.info("Detached activity_log partition.", partition=name)
+            key, row_count = _archive_partition(engine, name)
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE {name}"))
+            logger.info("Archived and dropped activity_log partition.", partition=name, key=key, rows=row_count)
+            archived.append({"partition": name, "key": key, "rows": row_count})
+        except Exception:
+            # Leave the (possibly detached) table in place; the next run retries it.
+            logger.error("Failed to archive activity_log partition.", partition=name, exc_info=True)
+    return archived
@@ -1,27 +1,157 @@
 # backend/services/activity_service.py
 import uuid
 import structlog
-from typing import Optional, Dict, Any
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import inspect as sa_inspect, case, func, update
 from flask import abort
+from werkzeug.exceptions import HTTPException
 
 # Absolute imports for modules at the app root (/app)
-from models import ActivityLog
+from models import ActivityLog, SparseFieldsMixin
 from utils import paginate_query, _handle_sqlalchemy_error
 import config as app_config_module # To access PAGINATION_DEFAULTS
+from audit_log_writer import audit_log_writer
+from database import read_only
 
 logger = structlog.get_logger(__name__)
 
+# Columns maintained by the database/ORM that would otherwise show up in every diff
+_DIFF_IGNORED_FIELDS = {"id", "created_at", "updated_at"}
+
+
+def attribute_diff(obj: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Field-level {field: {"old": ..., "new": ...}} diff of an ORM object's pending
+    changes, read from SQLAlchemy attribute history. Must be called before the
+    session flushes, since a flush resets the history.
+    """
+    state = sa_inspect(obj)
+    diff: Dict[str, Dict[str, Any]] = {}
+    for attr in state.mapper.column_attrs:
+        if attr.key in _DIFF_IGNORED_FIELDS:
+            continue
+        history = state.attrs[attr.key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old == new:
+            continue
+        diff[attr.key] = {"old": SparseFieldsMixin._serialize_value(old),
+                          "new": SparseFieldsMixin._serialize_value(new)}
+    return diff
+
+
+def should_snapshot(db: DBSession, model: Any, entity_id: uuid.UUID) -> bool:
+    """
+    Advances the entity's audit_entries_since_snapshot counter for the entry about to be
+    logged and returns True (resetting it) on every AUDIT_SNAPSHOT_INTERVAL-th entry. One
+    row update inside the caller's transaction, so buffered entries that have not reached
+    activity_log yet are counted too.
+    """
+    counter = model.audit_entries_since_snapshot
+    advanced = db.execute(
+        update(model).where(model.id == entity_id)
+        .values(audit_entries_since_snapshot=case(
+            (counter + 1 >= app_config_module.config.AUDIT_SNAPSHOT_INTERVAL, 0), else_=counter + 1),
+                updated_at=model.updated_at) # Bookkeeping, not an edit of the entity
+        .returning(counter).execution_options(synchronize_session=False)
+    ).scalar()
+    return advanced == 0
+
+
+def _replay(entries: List[ActivityLog], state: Optional[Dict[str, Any]] = None
+            ) -> List[Tuple[ActivityLog, Optional[Dict[str, Any]]]]:
+    """Applies entries oldest-first, returning (entry, state after entry) pairs."""
+    replayed = []
+    for entry in entries:
+        if entry.is_snapshot and entry.new_state is not None:
+            state = dict(entry.new_state)
+        elif entry.action_type.startswith("DELETE"):
+            state = None
+        elif entry.changes and state is not None:
+            state = {**state, **{field: change.get("new") for field, change in entry.changes.items()}}
+        replayed.append((entry, state))
+    return replayed
+
+
+def _entity_history(db: DBSession, entity_type: str, entity_id: uuid.UUID,
+                    start: datetime, end: datetime) -> List[ActivityLog]:
+    """Entries of one entity from its last snapshot at or before `start` up to `end`, oldest first."""
+    base_snapshot_at = db.query(func.max(ActivityLog.created_at)).filter(
+        ActivityLog.entity_type == entity_type, ActivityLog.entity_id == entity_id,
+        ActivityLog.is_snapshot.is_(True), ActivityLog.created_at <= start
+    ).scalar()
+    query = db.query(ActivityLog).filter(
+        ActivityLog.entity_type == entity_type, ActivityLog.entity_id == entity_id,
+        ActivityLog.created_at <= end
+    )
+    if base_snapshot_at is not None:
+        query = query.filter(ActivityLog.created_at >= base_snapshot_at)
+    return query.order_by(ActivityLog.created_at.asc(), ActivityLog.id.asc()).all()
+
+
+def _attach_materialized_states(db: DBSession, items: List[Dict[str, Any]]) -> None:
+    """Adds "materialized_state" (the entity's full state after the entry) to each item, one history query per entity."""
+    by_entity: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for item in items:
+        by_entity[(item["entity_type"], item["entity_id"])].append(item)
+    for (entity_type, entity_id), entity_items in by_entity.items():
+        timestamps = [datetime.fromisoformat(i["created_at"]) for i in entity_items if i.get("created_at")]
+        states: Dict[str, Optional[Dict[str, Any]]] = {}
+        if timestamps:
+            history = _entity_history(db, entity_type, uuid.UUID(entity_id), min(timestamps), max(timestamps))
+            states = {str(entry.id): state for entry, state in _replay(history)}
+        for item in entity_items:
+            item["materialized_state"] = states.get(item["id"])
+
+
+@read_only
+def get_entity_state_at_db(db: DBSession, entity_type: str, entity_id: uuid.UUID, at: datetime) -> Dict[str, Any]:
+    """Reconstructs an entity's state at `at` from its latest snapshot and the diffs after it."""
+    logger.info("Materializing entity state", entity_type=entity_type, entity_id=entity_id, at=at)
+    try:
+        history = _entity_history(db, entity_type, entity_id, at, at)
+        if not history or not any(entry.is_snapshot for entry in history):
+            abort(404, description=f"No audit snapshot of {entity_type} {entity_id} at or before {at.isoformat()}.")
+        last_entry, state = _replay(history)[-1]
+        return {"entity_type": entity_type, "entity_id": str(entity_id), "at": at.isoformat(),
+                "as_of_entry_id": str(last_entry.id), "state": state}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "materializing entity state", db)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.error("Unexpected error materializing entity state.", entity_type=entity_type,
+                     entity_id=entity_id, exc_info=True)
+        abort(500, description="An unexpected error occurred while materializing entity state.")
+    return {} # Should be unreachable
+
+
+@read_only
 def get_activity_log_db(db: DBSession,
                         tree_id: Optional[uuid.UUID] = None,
                         user_id: Optional[uuid.UUID] = None,
                         page: int = -1, # Default to trigger config lookup
                         per_page: int = -1,
                         sort_by: str = "created_at",
-                        sort_order: str = "desc"
+                        sort_order: str = "desc",
+                        entity_type: Optional[str] = None,
+                        entity_id: Optional[uuid.UUID] = None,
+                        materialize: bool = False,
+                        since: Optional[datetime] = None,
+                        until: Optional[datetime] = None
                         ) -> Dict[str, Any]:
-    """Fetches a paginated list of activity logs."""
+    """
+    Fetches a paginated list of activity logs. With `materialize`, each entry also
+    carries the full entity state after it, replayed from the nearest snapshot.
+    `since`/`until` bound created_at, which lets PostgreSQL prune whole monthly
+    partitions instead of probing every one.
+    """
     cfg_pagination = app_config_module.config.PAGINATION_DEFAULTS
     if page == -1: page = cfg_pagination["page"]
     if per_page == -1: per_page = cfg_pagination["per_page"]
@@ -31,15 +161,24 @@ def get_activity_log_db(db: DBSession,
         query = db.query(ActivityLog)
         if tree_id: query = query.filter(ActivityLog.tree_id == tree_id)
         if user_id: query = query.filter(ActivityLog.user_id == user_id)
+        if entity_type: query = query.filter(ActivityLog.entity_type == entity_type)
+        if entity_id: query = query.filter(ActivityLog.entity_id == entity_id)
+        if since: query = query.filter(ActivityLog.created_at >= since)
+        if until: query = query.filter(ActivityLog.created_at < until)
         
         if not hasattr(ActivityLog, sort_by):
             logger.warning(f"Invalid sort_by column '{sort_by}' for ActivityLog. Defaulting to 'created_at'.")
             sort_by = "created_at"
 
-        return paginate_query(query, ActivityLog, page, per_page, cfg_pagination["max_per_page"], sort_by, sort_order)
+        result = paginate_query(query, ActivityLog, page, per_page, cfg_pagination["max_per_page"], sort_by, sort_order)
+        if materialize:
+            _attach_materialized_states(db, result["items"])
+        return result
     except SQLAlchemyError as e:
         logger.error("Database error fetching activity logs.", exc_info=True)
         _handle_sqlalchemy_error(e, "fetching activity logs", db)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Unexpected error fetching activity logs.", exc_info=True)
         abort(500, description="An unexpected error occurred while fetching activity logs.")
@@ -56,26 +195,40 @@ def log_activity(db: DBSession,
                  new_state: Optional[Dict[str, Any]] = None,
                  ip_address: Optional[str] = None,
                  user_agent: Optional[str] = None,
-                 description: Optional[str] = None # Optional human-readable description
+                 description: Optional[str] = None, # Optional human-readable description
+                 changes: Optional[Dict[str, Dict[str, Any]]] = None, # Field-level diff, see attribute_diff()
+                 is_snapshot: bool = False # new_state holds the entity's full state
                  ) -> None:
     """
     Logs an activity to the ActivityLog.
+
+    In "buffered" AUDIT_LOG_MODE the entry is queued for the background batch writer
+    and the caller's session is not touched; if the buffer is full, or in "sync" mode,
+    the entry is added and committed on `db` as before.
     """
     logger.debug("Logging activity", action=action_type, entity_type=entity_type, entity_id=entity_id, 
                  actor_user_id=actor_user_id, tree_id=tree_id)
+    row = {
+        "id": uuid.uuid4(),
+        "user_id": actor_user_id, # This is the user performing the action
+        "action_type": action_type,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "tree_id": tree_id,
+        "previous_state": previous_state,
+        "new_state": new_state,
+        "changes": changes,
+        "is_snapshot": is_snapshot,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "created_at": datetime.utcnow(), # Time of the action, not of the flush
+        # description field is not in ActivityLog model currently, so not setting it.
+    }
+    if app_config_module.config.AUDIT_LOG_MODE == "buffered" and audit_log_writer.enqueue(row):
+        return
+
     try:
-        log_entry = ActivityLog(
-            user_id=actor_user_id, # This is the user performing the action
-            action_type=action_type,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            tree_id=tree_id,
-            previous_state=previous_state,
-            new_state=new_state,
-            ip_address=ip_address,
-            user_agent=user_agent
-            # description field is not in ActivityLog model currently, so not setting it.
-        )
+        log_entry = ActivityLog(**row)
         db.add(log_entry)
         db.commit()
         logger.info("Activity logged successfully", activity_id=log_entry.id, action=action_type, entity_type=entity_type)
@@ -0,0 +1,295 @@
+# backend/services/batch_service.py
+"""
+Bulk creation of people, relationships and events.
+
+Every item is validated up front, with one batched existence query for all referenced
+person IDs, and the valid items are written with multi-row INSERT ... RETURNING in a
+single transaction. Invalid items are reported by their index instead of failing the
+whole batch; only a batch with no valid items is rejected outright.
+"""
+import uuid
+import structlog
+from datetime import date
+from typing import Dict, Any, Optional, List, Set, Tuple
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import insert, select, tuple_
+from flask import abort
+from werkzeug.exceptions import HTTPException
+
+from models import (Person, PersonTreeAssociation, Relationship, RelationshipTypeEnum, Event, EventParticipant,
+                    PrivacyLevelEnum)
+from utils import _handle_sqlalchemy_error, ensure_exist
+from config import config
+from services.activity_service import log_activity
+from services.event_service import _participant_rows
+from services.relationship_service import inverse_rows, upsert_relationship_rows
+from services.sibling_service import affected_children, refresh_inferred_siblings
+from services.tree_version_service import bump_tree_versions
+
+logger = structlog.get_logger(__name__)
+
+_GENDERS = ['male', 'female', 'other', 'unknown', '']
+
+
+def _check_batch(items: Any) -> None:
+    if not isinstance(items, list) or not items:
+        abort(400, description={"message": "Validation failed", "details": {"items": "Must be a non-empty list."}})
+    if len(items) > config.BATCH_MAX_ITEMS:
+        abort(400, description={"message": "Validation failed",
+                                "details": {"items": f"At most {config.BATCH_MAX_ITEMS} items per batch."}})
+
+
+def _parse_uuid(value: Any, field: str, errors: Dict[str, str], required: bool = False) -> Optional[uuid.UUID]:
+    if not value:
+        if required: errors[field] = "Required."
+        return None
+    try: return uuid.UUID(str(value))
+    except ValueError:
+        errors[field] = f"Invalid UUID format: {value}"
+        return None
+
+
+def _parse_date(value: Any, field: str, errors: Dict[str, str]) -> Optional[date]:
+    if not value:
+        return None
+    try: return date.fromisoformat(str(value))
+    except ValueError:
+        errors[field] = "Invalid date format (YYYY-MM-DD)."
+        return None
+
+
+def _parse_privacy(value: Any, errors: Dict[str, str]) -> Optional[PrivacyLevelEnum]:
+    try: return PrivacyLevelEnum(value or PrivacyLevelEnum.inherit.value)
+    except ValueError:
+        errors['privacy_level'] = f"Invalid privacy level: {value}. Valid: {[p.value for p in PrivacyLevelEnum]}"
+        return None
+
+
+def _reject_if_nothing_valid(rows: List[Dict[str, Any]], errors: List[Dict[str, Any]], entity: str) -> None:
+    if not rows:
+        logger.warning(f"Batch {entity} creation rejected; no valid items.", error_count=len(errors))
+        abort(400, description={"message": "Validation failed", "details": {"items": errors}})
+
+
+def _insert_returning_ids(db: DBSession, model_cls, rows: List[Dict[str, Any]]) -> List[uuid.UUID]:
+    return list(db.execute(insert(model_cls).returning(model_cls.id, sort_by_parameter_order=True), rows).scalars())
+
+
+def _loaded_dicts(db: DBSession, model_cls, ids: List[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
+    return {obj.id: obj.to_dict() for obj in db.query(model_cls).filter(model_cls.id.in_(ids)).all()}
+
+
+def create_people_batch_db(db: DBSession, user_id: uuid.UUID, tree_id: uuid.UUID, items: List[Dict[str, Any]],
+                           ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> Dict[str, Any]:
+    """Creates people in `tree_id`. Returns {"created": [{"index", ...person}], "errors": [{"index", "details"}]}."""
+    _check_batch(items)
+    logger.info("Batch creating people", actor_user_id=user_id, tree_id=tree_id, count=len(items))
+    rows: List[Dict[str, Any]] = []; indexes: List[int] = []; errors: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "details": {"item": "Must be an object."}}); continue
+        item_errors: Dict[str, str] = {}
+        if not item.get('first_name'): item_errors['first_name'] = "First name is required."
+        birth_date = _parse_date(item.get('birth_date'), 'birth_date', item_errors)
+        death_date = _parse_date(item.get('death_date'), 'death_date', item_errors)
+        if birth_date and death_date and death_date < birth_date:
+            item_errors['date_comparison'] = "Death date cannot be before birth date."
+        gender = item.get('gender')
+        if gender and str(gender).lower() not in _GENDERS:
+            item_errors['gender'] = "Invalid gender value. Allowed: male, female, other, unknown, or empty to clear."
+        privacy_level = _parse_privacy(item.get('privacy_level'), item_errors)
+        if item_errors:
+            errors.append({"index": index, "details": item_errors}); continue
+        is_living = item.get('is_living')
+        rows.append({
+            "created_by": user_id, "first_name": item['first_name'], "middle_names": item.get('middle_names'),
+            "last_name": item.get('last_name'), "maiden_name": item.get('maiden_name'), "nickname": item.get('nickname'),
+            "gender": gender or None, "birth_date": birth_date,
+            "birth_date_approx": bool(item.get('birth_date_approx', False)), "birth_place": item.get('birth_place'),
+            "place_of_birth": item.get('place_of_birth'), "death_date": death_date,
+            "death_date_approx": bool(item.get('death_date_approx', False)), "death_place": item.get('death_place'),
+            "place_of_death": item.get('place_of_death'), "burial_place": item.get('burial_place'),
+            "privacy_level": privacy_level, "is_living": death_date is None if is_living is None else is_living,
+            "notes": item.get('notes'), "biography": item.get('biography'),
+            "custom_attributes": item.get('custom_attributes', {}),
+            "profile_picture_url": item.get('profile_picture_url'), "custom_fields": item.get('custom_fields', {}),
+        })
+        indexes.append(index)
+    _reject_if_nothing_valid(rows, errors, "person")
+
+    try:
+        ids = _insert_returning_ids(db, Person, rows)
+        db.execute(insert(PersonTreeAssociation), [{"person_id": pid, "tree_id": tree_id} for pid in ids])
+        bump_tree_versions(db, tree_ids=[tree_id], changes=[("person", pid, "upsert") for pid in ids])
+        people = _loaded_dicts(db, Person, ids)
+        db.commit()
+        for pid in ids:
+            log_activity(db=db, actor_user_id=user_id, action_type="CREATE_PERSON", entity_type="PERSON",
+                         entity_id=pid, tree_id=tree_id, new_state=people[pid], is_snapshot=True,
+                         ip_address=ip_address, user_agent=user_agent)
+        logger.info("Batch created people", tree_id=tree_id, created=len(ids), rejected=len(errors))
+        return {"created": [{"index": i, **people[pid]} for i, pid in zip(indexes, ids)], "errors": errors}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "batch creating people", db)
+    except HTTPException:
+        raise
+    except Exception:
+        db.rollback()
+        logger.error("Unexpected error during batch person creation.", tree_id=tree_id, exc_info=True)
+        abort(500, description="An unexpected error occurred during batch person creation.")
+    return {} # Should be unreachable
+
+
+def create_relationships_batch_db(db: DBSession, user_id: uuid.UUID, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Creates relationships; items duplicating each other or an existing relationship are reported as errors."""
+    _check_batch(items)
+    logger.info("Batch creating relationships", actor_user_id=user_id, count=len(items))
+    parsed: List[Tuple[int, Dict[str, Any]]] = []; errors: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "details": {"item": "Must be an object."}}); continue
+        item_errors: Dict[str, str] = {}
+        person1_id = _parse_uuid(item.get('person1_id'), 'person1_id', item_errors, required=True)
+        person2_id = _parse_uuid(item.get('person2_id'), 'person2_id', item_errors, required=True)
+        if person1_id and person1_id == person2_id:
+            item_errors['person2_id'] = "Cannot relate a person to themselves."
+        relationship_type = None
+        if not item.get('relationship_type'): item_errors['relationship_type'] = "Required."
+        else:
+            try: relationship_type = RelationshipTypeEnum(str(item['relationship_type']))
+            except ValueError: item_errors['relationship_type'] = f"Invalid relationship type: {item['relationship_type']}"
+        start_date = _parse_date(item.get('start_date'), 'start_date', item_errors)
+        end_date = _parse_date(item.get('end_date'), 'end_date', item_errors)
+        if start_date and end_date and end_date < start_date:
+            item_errors['date_comparison'] = "End date before start."
+        if item_errors:
+            errors.append({"index": index, "details": item_errors}); continue
+        parsed.append((index, {
+            "created_by": user_id, "person1_id": person1_id, "person2_id": person2_id,
+            "relationship_type": relationship_type, "start_date": start_date, "end_date": end_date,
+            "certainty_level": item.get('certainty_level'), "custom_attributes": item.get('custom_attributes', {}),
+            "notes": item.get('notes'), "location": item.get('location'),
+        }))
+
+    try:
+        known_people = ensure_exist(db, Person, {row[key] for _, row in parsed for key in ("person1_id", "person2_id")})
+        keys = {(row["person1_id"], row["person2_id"], row["relationship_type"]) for _, row in parsed}
+        existing_keys = set(db.execute(
+            select(Relationship.person1_id, Relationship.person2_id, Relationship.relationship_type)
+            .where(tuple_(Relationship.person1_id, Relationship.person2_id, Relationship.relationship_type).in_(keys))
+        ).tuples()) if keys else set()
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "validating relationship batch", db)
+
+    rows: List[Dict[str, Any]] = []; indexes: List[int] = []; seen: Set[Tuple] = set()
+    for index, row in parsed:
+        item_errors = {field: f"Person with ID {row[field]} not found."
+                       for field in ("person1_id", "person2_id") if row[field] not in known_people}
+        key = (row["person1_id"], row["person2_id"], row["relationship_type"])
+        if key in existing_keys or key in seen:
+            item_errors['relationship_type'] = "This relationship already exists."
+        if item_errors:
+            errors.append({"index": index, "details": item_errors}); continue
+        seen.add(key); rows.append(row); indexes.append(index)
+    errors.sort(key=lambda error: error["index"])
+    _reject_if_nothing_valid(rows, errors, "relationship")
+
+    try:
+        ids = _insert_returning_ids(db, Relationship, rows)
+        inverse_ids = upsert_relationship_rows(db, inverse_rows(rows)) if config.RELATIONSHIP_MATERIALIZE_INVERSE else []
+        bump_tree_versions(db, person_ids={row[key] for row in rows for key in ("person1_id", "person2_id")},
+                           changes=[("relationship", rid, "upsert") for rid in ids + inverse_ids])
+        if config.INFERRED_SIBLINGS_ENABLED:
+            refresh_inferred_siblings(db, affected_children(
+                (row["person1_id"], row["person2_id"], row["relationship_type"]) for row in rows))
+        relationships = _loaded_dicts(db, Relationship, ids)
+        db.commit()
+        logger.info("Batch created relationships", created=len(ids), rejected=len(errors))
+        return {"created": [{"index": i, **relationships[rid]} for i, rid in zip(indexes, ids)], "errors": errors}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "batch creating relationships", db)
+    except HTTPException:
+        raise
+    except Exception:
+        db.rollback()
+        logger.error("Unexpected error during batch relationship creation.", exc_info=True)
+        abort(500, description="An unexpected error occurred during batch relationship creation.")
+    return {} # Should be unreachable
+
+
+def create_events_batch_db(db: DBSession, user_id: uuid.UUID, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Creates events and their event_participants rows."""
+    _check_batch(items)
+    logger.info("Batch creating events", actor_user_id=user_id, count=len(items))
+    parsed: List[Tuple[int, Dict[str, Any], List[uuid.UUID]]] = []; errors: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "details": {"item": "Must be an object."}}); continue
+        item_errors: Dict[str, str] = {}
+        if not item.get('event_type'): item_errors['event_type'] = "Event type is required."
+        person_id = _parse_uuid(item.get('person_id'), 'person_id', item_errors)
+        related_ids: List[uuid.UUID] = []
+        related_raw = item.get('related_person_ids') or []
+        if not isinstance(related_raw, list):
+            item_errors['related_person_ids'] = "Must be a list of person IDs."
+        else:
+            for raw_id in related_raw:
+                related_id = _parse_uuid(raw_id, 'related_person_ids', item_errors)
+                if related_id: related_ids.append(related_id)
+        event_date = _parse_date(item.get('date'), 'date', item_errors)
+        date_range_start = _parse_date(item.get('date_range_start'), 'date_range_start', item_errors)
+        date_range_end = _parse_date(item.get('date_range_end'), 'date_range_end', item_errors)
+        if date_range_start and date_range_end and date_range_end < date_range_start:
+            item_errors['date_comparison'] = "date_range_end cannot be before date_range_start."
+        privacy_level = _parse_privacy(item.get('privacy_level'), item_errors)
+        if item_errors:
+            errors.append({"index": index, "details": item_errors}); continue
+        parsed.append((index, {
+            "created_by": user_id, "person_id": person_id, "event_type": item['event_type'], "date": event_date,
+            "date_approx": item.get('date_approx', False), "date_range_start": date_range_start,
+            "date_range_end": date_range_end, "place": item.get('place'), "description": item.get('description'),
+            "custom_attributes": item.get('custom_attributes', {}),
+            "related_person_ids": [str(pid) for pid in related_ids], "privacy_level": privacy_level,
+        }, related_ids))
+
+    try:
+        known_people = ensure_exist(
+            db, Person, {pid for _, row, related in parsed for pid in [row["person_id"], *related] if pid})
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "validating event batch", db)
+
+    rows: List[Dict[str, Any]] = []; indexes: List[int] = []; related_by_row: List[List[uuid.UUID]] = []
+    for index, row, related_ids in parsed:
+        item_errors: Dict[str, Any] = {}
+        if row["person_id"] and row["person_id"] not in known_people:
+            item_errors['person_id'] = f"Person with ID {row['person_id']} not found."
+        missing = [f"Person with ID {pid} not found." for pid in related_ids if pid not in known_people]
+        if missing: item_errors['related_person_ids'] = missing
+        if item_errors:
+            errors.append({"index": index, "details": item_errors}); continue
+        rows.append(row); indexes.append(index); related_by_row.append(related_ids)
+    errors.sort(key=lambda error: error["index"])
+    _reject_if_nothing_valid(rows, errors, "event")
+
+    try:
+        ids = _insert_returning_ids(db, Event, rows)
+        participants = [participant for eid, row, related_ids in zip(ids, rows, related_by_row)
+                        for participant in _participant_rows(eid, row["person_id"], related_ids)]
+        if participants:
+            db.execute(insert(EventParticipant), participants)
+        bump_tree_versions(db, person_ids={p["person_id"] for p in participants},
+                           changes=[("event", eid, "upsert") for eid in ids])
+        events = _loaded_dicts(db, Event, ids)
+        db.commit()
+        logger.info("Batch created events", created=len(ids), rejected=len(errors))
+        return {"created": [{"index": i, **events[eid]} for i, eid in zip(indexes, ids)], "errors": errors}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "batch creating events", db)
+    except HTTPException:
+        raise
+    except Exception:
+        db.rollback()
+        logger.error("Unexpected error during batch event creation.", exc_info=True)
+        abort(500, description="An unexpected error occurred during batch event creation.")
+    return {} # Should be unreachable
@@ -2,18 +2,20 @@
 import uuid
 import structlog
 from datetime import date
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import or_ # For querying related_person_ids
+from sqlalchemy import select, insert, delete
 from flask import abort
 from werkzeug.exceptions import HTTPException
 
-from models import Event, Person, PrivacyLevelEnum, PersonTreeAssociation # Assuming Event model is updated
-from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query
+from models import Event, EventParticipant, Person, PrivacyLevelEnum, PersonTreeAssociation # Assuming Event model is updated
+from utils import (_get_or_404, _handle_sqlalchemy_error, paginate_query, sparse_load_options, ensure_exist,
+                   ensure_exists_or_404, forget_existence)
 from config import config # For pagination defaults
 # Import for get_events_for_tree_db
 from services.person_service import get_all_people_db as get_persons_in_tree_db 
+from services.tree_version_service import bump_tree_versions
 
 
 logger = structlog.get_logger(__name__)
@@ -23,25 +25,61 @@ def _validate_person_ids(db: DBSession, person_ids: List[str], field_name: str)
     if not isinstance(person_ids, list):
         abort(400, description={"message": "Validation failed", "details": {field_name: "Must be a list of person IDs."}})
     
-    valid_uuids: List[uuid.UUID] = []
+    parsed: List[Tuple[str, Optional[uuid.UUID]]] = []
     errors: List[str] = []
     for pid_str in person_ids:
         try:
-            person_uuid = uuid.UUID(pid_str)
-            # Check if person exists globally
-            person = db.query(Person.id).filter(Person.id == person_uuid).one_or_none()
-            if not person:
-                errors.append(f"Person with ID {pid_str} not found.")
-            else:
-                valid_uuids.append(person_uuid)
+            parsed.append((pid_str, uuid.UUID(str(pid_str))))
         except ValueError:
             errors.append(f"Invalid UUID format for person ID: {pid_str}.")
-    
+    # One existence query for the whole list (persons exist globally)
+    existing = ensure_exist(db, Person, [person_uuid for _, person_uuid in parsed])
+    valid_uuids = [person_uuid for _, person_uuid in parsed if person_uuid in existing]
+    errors += [f"Person with ID {pid_str} not found." for pid_str, person_uuid in parsed if person_uuid not in existing]
+
     if errors:
         abort(400, description={"message": "Validation failed", "details": {field_name: errors}})
     return valid_uuids
 
 
+def _event_person_ids(event: Event) -> List[uuid.UUID]:
+    """Primary and related person IDs of an event, used to find the trees it appears in."""
+    person_ids = [event.person_id] if event.person_id else []
+    for related_id in event.related_person_ids or []:
+        try: person_ids.append(uuid.UUID(str(related_id)))
+        except ValueError: continue
+    return person_ids
+
+def _participant_rows(event_id: uuid.UUID, person_id: Optional[uuid.UUID],
+                      related_ids: List[uuid.UUID]) -> List[Dict[str, Any]]:
+    rows = [{"event_id": event_id, "person_id": person_id, "role": "principal"}] if person_id else []
+    rows += [{"event_id": event_id, "person_id": pid, "role": "related"} for pid in dict.fromkeys(related_ids)]
+    return rows
+
+def _drop_deleted_related_people(db: DBSession, event: Event) -> None:
+    """
+    Removes ids of people deleted since they were recorded from related_person_ids (their
+    participant rows went with the ON DELETE CASCADE), so a participant rebuild never
+    re-inserts them against the foreign key.
+    """
+    related_ids = _event_person_ids(event)[1 if event.person_id else 0:]
+    if not related_ids:
+        return
+    existing = ensure_exist(db, Person, related_ids)
+    if len(existing) < len(set(related_ids)):
+        logger.info("Dropping deleted people from event.", event_id=event.id,
+                    dropped=[str(pid) for pid in set(related_ids) - existing])
+        event.related_person_ids = [str(pid) for pid in dict.fromkeys(related_ids) if pid in existing]
+
+def _sync_event_participants(db: DBSession, event: Event, replace: bool = True) -> None:
+    """Rewrites the event's event_participants rows from person_id and related_person_ids."""
+    if replace:
+        db.execute(delete(EventParticipant).where(EventParticipant.event_id == event.id))
+    related_ids = _event_person_ids(event)[1 if event.person_id else 0:]
+    rows = _participant_rows(event.id, event.person_id, related_ids)
+    if rows:
+        db.execute(insert(EventParticipant), rows)
+
 def create_event_db(db: DBSession, user_id: uuid.UUID, event_data: Dict[str, Any]) -> Dict[str, Any]:
     # Removed tree_id from parameters
     logger.info("Creating event", user_id=user_id, data_keys=list(event_data.keys()))
@@ -56,10 +94,10 @@ def create_event_db(db: DBSession, user_id: uuid.UUID, event_data: Dict[str, Any
     if person_id_str:
         try:
             person_id = uuid.UUID(person_id_str)
-            _get_or_404(db, Person, person_id) # Validates global existence
+            ensure_exists_or_404(db, Person, person_id) # Validates global existence
         except ValueError:
             errors['person_id'] = f"Invalid UUID format: {person_id_str}"
-        except HTTPException as e: # Catch 404 from _get_or_404
+        except HTTPException as e: # Catch 404 from ensure_exists_or_404
              errors['person_id'] = str(e.description)
 
 
@@ -125,6 +163,9 @@ def create_event_db(db: DBSession, user_id: uuid.UUID, event_data: Dict[str, Any
             privacy_level=privacy_level_enum
         )
         db.add(new_event)
+        db.flush() # Assigns new_event.id for the change journal
+        _sync_event_participants(db, new_event, replace=False)
+        bump_tree_versions(db, person_ids=_event_person_ids(new_event), changes=[("event", new_event.id, "upsert")])
         db.commit()
         db.refresh(new_event)
         logger.info("Event created successfully", event_id=new_event.id, person_id=new_event.person_id) # Log person_id
@@ -138,17 +179,18 @@ def create_event_db(db: DBSession, user_id: uuid.UUID, event_data: Dict[str, Any
     return {}
 
 
-def get_event_db(db: DBSession, event_id: uuid.UUID) -> Dict[str, Any]:
+def get_event_db(db: DBSession, event_id: uuid.UUID, fields: Optional[List[str]] = None) -> Dict[str, Any]:
     # Removed tree_id from parameters
     logger.info("Fetching event", event_id=event_id)
-    event = _get_or_404(db, Event, event_id) # Fetch globally
-    return event.to_dict()
+    event = _get_or_404(db, Event, event_id, options=sparse_load_options(Event, fields)) # Fetch globally
+    return event.to_dict(fields=fields) if fields else event.to_dict()
 
 
 def update_event_db(db: DBSession, event_id: uuid.UUID, event_data: Dict[str, Any]) -> Dict[str, Any]:
     # Removed tree_id from parameters
     logger.info("Updating event", event_id=event_id, data_keys=list(event_data.keys()))
     event = _get_or_404(db, Event, event_id) # Fetch globally
+    previous_person_ids = _event_person_ids(event)
     
     # tree_id is no longer part of this function's direct context for fetching the event itself.
     # Authorization, if needed, would be based on user's rights to edit this event or person's events.
@@ -171,7 +213,7 @@ def update_event_db(db: DBSession, event_id: uuid.UUID, event_data: Dict[str, An
                     setattr(event, field, None)
                 else:
                     pid = uuid.UUID(str(value))
-                    _get_or_404(db, Person, pid) # Validate person exists globally
+                    ensure_exists_or_404(db, Person, pid) # Validate person exists globally
                     setattr(event, field, pid)
             elif field == 'related_person_ids':
                 if value is None: # Allowing to clear related_person_ids
@@ -197,7 +239,7 @@ def update_event_db(db: DBSession, event_id: uuid.UUID, event_data: Dict[str, An
                 setattr(event, field, value)
         except ValueError as e:
             validation_errors[field] = f"Invalid value or format for {field}: {e}"
-        except HTTPException as e_http: # Catch 404 from _get_or_404 for person_id
+        except HTTPException as e_http: # Catch 404 from ensure_exists_or_404 for person_id
             validation_errors[field] = str(e_http.description)
 
 
@@ -209,6 +251,12 @@ def update_event_db(db: DBSession, event_id: uuid.UUID, event_data: Dict[str, An
         abort(400, description={"message": "Validation failed", "details": validation_errors})
 
     try:
+        if 'person_id' in event_data or 'related_person_ids' in event_data:
+            if 'related_person_ids' not in event_data: # Kept as stored, so not validated above
+                _drop_deleted_related_people(db, event)
+            _sync_event_participants(db, event)
+        bump_tree_versions(db, person_ids=previous_person_ids + _event_person_ids(event),
+                           changes=[("event", event.id, "upsert")])
         db.commit()
         db.refresh(event)
         logger.info("Event updated successfully", event_id=event.id)
@@ -227,7 +275,9 @@ def delete_event_db(db: DBSession, event_id: uuid.UUID) -> bool:
     logger.info("Deleting event", event_id=event_id)
     event = _get_or_404(db, Event, event_id) # Fetch globally
     try:
+        bump_tree_versions(db, person_ids=_event_person_ids(event), changes=[("event", event.id, "delete")])
         db.delete(event)
+        forget_existence(Event, [event.id])
         db.commit()
         logger.info("Event deleted successfully", event_id=event_id)
         return True
@@ -242,29 +292,30 @@ def delete_event_db(db: DBSession, event_id: uuid.UUID) -> bool:
 
 def get_events_for_person_db(db: DBSession, person_id: uuid.UUID, 
                                page: int, per_page: int, 
-                               sort_by: Optional[str], sort_order: Optional[str]) -> Dict[str, Any]:
+                               sort_by: Optional[str], sort_order: Optional[str],
+                               fields: Optional[List[str]] = None) -> Dict[str, Any]:
     # Removed tree_id from parameters
     logger.info("Fetching events for person", person_id=person_id, page=page, per_page=per_page)
     # Ensure person exists globally
-    _get_or_404(db, Person, person_id) 
+    ensure_exists_or_404(db, Person, person_id)
     
     try:
-        # Query for events where person_id matches OR person_id is in related_person_ids
+        # Events where the person is the principal or a related participant, via the event_participants index
         # Event.tree_id filter is removed as Event is now global.
-        person_id_str = str(person_id)
-        query = db.query(Event).filter(
-            or_(
-                Event.person_id == person_id,
-                Event.related_person_ids.cast(sa.Text).like(f'%"{person_id_str}"%') 
-            )
-        )
+        query = db.query(Event).filter(Event.id.in_(
+            select(EventParticipant.event_id).where(EventParticipant.person_id == person_id)
+        ))
         
         sort_by_attr = sort_by if (sort_by and hasattr(Event, sort_by)) else "date" # Default sort by date
         if sort_by_attr == "date" and not hasattr(Event, "date"): sort_by_attr="created_at" # Fallback if date isn't on model (it is)
 
-        return paginate_query(query, Event, page, per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by_attr, sort_order or "asc")
+        query = query.options(*sparse_load_options(Event, fields))
+        return paginate_query(query, Event, page, per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by_attr, sort_order or "asc",
+                              fields=fields)
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching events for person {person_id}", db)
+    except HTTPException:
+        raise
     except Exception as e: # Catch any other unexpected error
         logger.error("Unexpected error fetching events for person.", exc_info=True, person_id=person_id)
         abort(500, description="An unexpected error occurred while fetching events for the person.")
@@ -274,43 +325,18 @@ def get_events_for_person_db(db: DBSession, person_id: uuid.UUID,
 def get_events_for_tree_db(db: DBSession, tree_id: uuid.UUID, 
                              page: int, per_page: int, 
                              sort_by: Optional[str], sort_order: Optional[str], 
-                             filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                             filters: Optional[Dict[str, Any]] = None,
+                             fields: Optional[List[str]] = None) -> Dict[str, Any]:
     logger.info("Fetching events for tree", tree_id=tree_id, page=page, per_page=per_page, filters=filters)
     try:
-        # 1. Get all person IDs associated with the tree_id
-        # We use the imported get_persons_in_tree_db. This function returns a dict with an 'items' list.
-        # We need to extract person IDs from these items.
-        # Assuming get_persons_in_tree_db can fetch all persons in a tree if pagination is not strictly needed here,
-        # or we fetch all pages. For simplicity, let's assume it returns all persons for the tree.
-        # The function get_persons_in_tree_db (aliased from get_all_people_db) is already refactored.
-        
-        # Fetch all Person objects associated with the tree_id directly for clarity
-        persons_in_tree = db.query(Person.id).join(PersonTreeAssociation).filter(PersonTreeAssociation.tree_id == tree_id).all()
-        person_ids_in_tree = {person.id for person in persons_in_tree}
-
-        if not person_ids_in_tree:
-            logger.info("No persons in tree, so no events to fetch for tree.", tree_id=tree_id)
-            return {"items": [], "total_items": 0, "total_pages": 0, "current_page": page, "per_page": per_page}
-
-        # 2. Query events where Event.person_id is one of the tree's persons OR
-        #    any person_id in Event.related_person_ids is one of the tree's persons.
-        
-        # Create a list of conditions for related_person_ids
-        # This checks if any of the UUIDs in the JSONB array `related_person_ids` exist in `person_ids_in_tree`
-        # This is a bit complex due to JSONB querying. A common way is to check for overlap or containment if possible,
-        # or iterate if the set of person_ids_in_tree is small.
-        # For a scalable solution, if related_person_ids can be large, a different approach might be needed
-        # (e.g., a subquery or a specific database function if available).
-        # Here, we'll use a series of LIKE clauses for each person_id_in_tree, which might not be the most performant for large sets.
-        
-        related_conditions = [Event.related_person_ids.cast(sa.Text).like(f'%"{str(pid)}"%') for pid in person_ids_in_tree]
-
-        query = db.query(Event).filter(
-            or_(
-                Event.person_id.in_(person_ids_in_tree),
-                *related_conditions # Unpack the list of OR conditions for related_person_ids
-            )
+        # Events with any participant (principal or related) in the tree: a semi-join of
+        # event_participants against the tree's person associations, both indexed on person_id.
+        tree_event_ids = (
+            select(EventParticipant.event_id)
+            .join(PersonTreeAssociation, PersonTreeAssociation.person_id == EventParticipant.person_id)
+            .where(PersonTreeAssociation.tree_id == tree_id)
         )
+        query = db.query(Event).filter(Event.id.in_(tree_event_ids))
         
         if filters:
             if 'event_type' in filters and filters['event_type']:
@@ -320,9 +346,13 @@ def get_events_for_tree_db(db: DBSession, tree_id: uuid.UUID,
         sort_by_attr = sort_by if (sort_by and hasattr(Event, sort_by)) else "date"
         if sort_by_attr == "date" and not hasattr(Event, "date"): sort_by_attr="created_at"
 
-        return paginate_query(query, Event, page, per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by_attr, sort_order or "asc")
+        query = query.options(*sparse_load_options(Event, fields))
+        return paginate_query(query, Event, page, per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by_attr, sort_order or "asc",
+                              fields=fields)
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching events for tree {tree_id}", db)
+    except HTTPException:
+        raise
     except Exception as e: # Catch any other unexpected error
         logger.error("Unexpected error fetching events for tree.", exc_info=True, tree_id=tree_id)
         abort(500, description="An unexpected error occurred while fetching events for the tree.")
@@ -0,0 +1,158 @@
+# backend/services/family_service.py
+"""
+Family units: a couple (or a lone parent) plus their children, derived from parent/child
+and spouse Relationship rows. Relationships follow "person1 is <type> of person2", so a
+*_parent edge points from parent to child and a *_child edge from child to parent.
+
+Only id and marriage columns are read, never the encrypted Person rows, so units for a
+whole tree are cheap to build in memory. Built units are kept per tree version in a small
+in-process LRU, so paging through a tree's families builds them once.
+"""
+import uuid
+import structlog
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as DBSession
+from flask import abort
+from werkzeug.exceptions import HTTPException
+
+from config import config
+from models import Relationship, RelationshipTypeEnum, Tree
+from utils import _handle_sqlalchemy_error
+from services.relationship_service import tree_relationships_filter
+from services.tree_version_service import TreeVersionCache
+
+logger = structlog.get_logger(__name__)
+
+_FAMILY_NAMESPACE = uuid.UUID("db0066bc-2a79-41f0-9152-e18113f7da47")
+
+_family_units_cache = TreeVersionCache(max_entries=64)
+
+PARENT_TYPES = (RelationshipTypeEnum.biological_parent, RelationshipTypeEnum.adoptive_parent,
+                RelationshipTypeEnum.step_parent, RelationshipTypeEnum.foster_parent)
+CHILD_TYPES = (RelationshipTypeEnum.biological_child, RelationshipTypeEnum.adoptive_child,
+               RelationshipTypeEnum.step_child, RelationshipTypeEnum.foster_child)
+SPOUSE_TYPES = (RelationshipTypeEnum.spouse_current, RelationshipTypeEnum.spouse_former, RelationshipTypeEnum.partner)
+
+
+@dataclass
+class FamilyUnit:
+    partner_ids: List[uuid.UUID]
+    child_ids: List[uuid.UUID] = field(default_factory=list)
+    relationship_id: Optional[uuid.UUID] = None # The spouse edge, None for parents who were never linked as a couple
+    relationship_type: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    location: Optional[str] = None
+
+    @property
+    def id(self) -> uuid.UUID:
+        """Stable across tree versions: derived from the partners only."""
+        return uuid.uuid5(_FAMILY_NAMESPACE, ":".join(sorted(str(pid) for pid in self.partner_ids)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": str(self.id), "partner_ids": [str(pid) for pid in self.partner_ids],
+                "child_ids": [str(cid) for cid in self.child_ids],
+                "relationship_id": str(self.relationship_id) if self.relationship_id else None,
+                "relationship_type": self.relationship_type,
+                "start_date": self.start_date.isoformat() if self.start_date else None,
+                "end_date": self.end_date.isoformat() if self.end_date else None,
+                "location": self.location}
+
+
+def build_family_units(rows: Iterable[Any]) -> List[FamilyUnit]:
+    """
+    Groups relationship rows (id, person1_id, person2_id, relationship_type, start_date,
+    end_date, location) into family units ordered by id. A child joins every recorded
+    couple made up of two of its parents; parents not covered by such a couple form one
+    implicit unit when there are at most two of them, otherwise one unit each.
+    """
+    couples: Dict[FrozenSet[uuid.UUID], FamilyUnit] = {}
+    couples_by_person: Dict[uuid.UUID, List[FrozenSet[uuid.UUID]]] = defaultdict(list)
+    parents_of: Dict[uuid.UUID, Set[uuid.UUID]] = defaultdict(set)
+    for row in rows:
+        rel_type = RelationshipTypeEnum(row.relationship_type)
+        if row.person1_id == row.person2_id:
+            continue
+        if rel_type in SPOUSE_TYPES:
+            key = frozenset((row.person1_id, row.person2_id))
+            if key in couples: # The first (oldest) spouse edge describes the couple
+                continue
+            couples[key] = FamilyUnit(partner_ids=[row.person1_id, row.person2_id], relationship_id=row.id,
+                                      relationship_type=rel_type.value, start_date=row.start_date,
+                                      end_date=row.end_date, location=row.location)
+            for person_id in key:
+                couples_by_person[person_id].append(key)
+        elif rel_type in PARENT_TYPES:
+            parents_of[row.person2_id].add(row.person1_id)
+        elif rel_type in CHILD_TYPES:
+            parents_of[row.person1_id].add(row.person2_id)
+
+    units = dict(couples)
+    for child_id, parent_ids in parents_of.items():
+        covered: Set[uuid.UUID] = set()
+        for key in {key for pid in parent_ids for key in couples_by_person[pid] if key <= parent_ids}:
+            units[key].child_ids.append(child_id)
+            covered |= key
+        rest = sorted(parent_ids - covered, key=str)
+        for group in ([rest] if 0 < len(rest) <= 2 else [[pid] for pid in rest]):
+            key = frozenset(group)
+            units.setdefault(key, FamilyUnit(partner_ids=group)).child_ids.append(child_id)
+
+    for unit in units.values():
+        unit.child_ids.sort(key=str)
+    return sorted(units.values(), key=lambda unit: unit.id)
+
+
+def load_family_units(db: DBSession, tree_id: uuid.UUID, batch_size: int = 1000) -> List[FamilyUnit]:
+    """Reads the tree's parent/child/spouse edges through a server-side cursor and builds its family units."""
+    statement = (
+        select(Relationship.id, Relationship.person1_id, Relationship.person2_id, Relationship.relationship_type,
+               Relationship.start_date, Relationship.end_date, Relationship.location)
+        .where(tree_relationships_filter(tree_id),
+               Relationship.relationship_type.in_(PARENT_TYPES + CHILD_TYPES + SPOUSE_TYPES))
+        .order_by(Relationship.created_at, Relationship.id)
+    )
+    units = build_family_units(db.execute(statement.execution_options(yield_per=batch_size)))
+    logger.debug("Built family units for tree.", tree_id=tree_id, families=len(units))
+    return units
+
+
+def _cached_family_units(db: DBSession, tree_id: uuid.UUID, version: int) -> List[FamilyUnit]:
+    return _family_units_cache.get_or_build(tree_id, version, lambda: load_family_units(db, tree_id))
+
+
+def get_tree_families_db(db: DBSession, tree_id: uuid.UUID, page: int = -1, per_page: int = -1) -> Dict[str, Any]:
+    """Returns one page of the tree's family units (ordered by family id) in the usual pagination envelope."""
+    cfg_pagination = config.PAGINATION_DEFAULTS
+    if page == -1: page = cfg_pagination["page"]
+    if per_page == -1: per_page = cfg_pagination["per_page"]
+    per_page = max(1, min(per_page, cfg_pagination["max_per_page"]))
+    page = max(1, page)
+    logger.info("Fetching family units for tree", tree_id=tree_id, page=page, per_page=per_page)
+    try:
+        version = db.query(Tree.version).filter(Tree.id == tree_id).scalar()
+        if version is None:
+            abort(404, description=f"Tree with ID {tree_id} not found.")
+        units = _cached_family_units(db, tree_id, version)
+        total_items = len(units)
+        total_pages = (total_items + per_page - 1) // per_page
+        offset = (page - 1) * per_page
+        return {
+            "items": [unit.to_dict() for unit in units[offset:offset + per_page]], "page": page, "per_page": per_page,
+            "total_items": total_items, "total_pages": total_pages,
+            "has_next": page < total_pages, "has_prev": page > 1, "tree_version": version,
+        }
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, f"fetching family units for tree {tree_id}", db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Unexpected error fetching family units.", tree_id=tree_id, exc_info=True)
+        abort(500, "Error fetching families.")
+    return {} # Should be unreachable
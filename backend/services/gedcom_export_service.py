@@ -0,0 +1,240 @@
+# backend/services/gedcom_export_service.py
+"""
+GEDCOM 7 export of a whole tree.
+
+Family units are built first from id-only relationship rows (a server-side cursor), so
+every INDI can carry its FAMC/FAMS pointers. People are then read in keyset batches by id
+with their events fetched per batch, so decryption happens one batch at a time and memory
+stays flat. The finished file is cached in object storage under the tree's version; as
+long as the tree is unchanged, later downloads are served from that single object GET.
+"""
+import tempfile
+import uuid
+import structlog
+from collections import defaultdict
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+from sqlalchemy.orm import Session as DBSession
+
+from config import config
+from gedcom import ATTRIBUTE_TAGS, INDIVIDUAL_EVENT_TYPES, format_gedcom_date, gedcom_line
+from models import Event, Person, Tree
+from storage_client import get_storage_client, create_bucket_if_not_exists
+from utils import _get_or_404
+from services.family_service import FamilyUnit, load_family_units
+from services.tree_service import _tree_people_query
+
+logger = structlog.get_logger(__name__)
+
+GEDCOM_MIMETYPE = "text/vnd.familysearch.gedcom"
+_EXPORT_STREAM_CHUNK = 64 * 1024
+_SEX = {"male": "M", "female": "F", "other": "X", "unknown": "U"}
+_EVENT_TAGS = {event_type: tag for tag, event_type in INDIVIDUAL_EVENT_TYPES.items() if tag != "EVEN"}
+# Event types _family() already writes as MARR/DIV for these spouse relationship types
+_FAMILY_RECORD_EVENTS = {"marriage": ("spouse_current", "spouse_former"), "divorce": ("spouse_former",)}
+
+
+def _xref(prefix: str, entity_id: uuid.UUID) -> str:
+    return f"@{prefix}{entity_id.hex.upper()}@"
+
+
+def _export_key(tree_id: uuid.UUID, version: int) -> str:
+    return f"{config.GEDCOM_EXPORT_PREFIX}{tree_id}/v{version}.ged"
+
+
+def _header(tree: Tree) -> str:
+    return (gedcom_line(0, "HEAD") + gedcom_line(1, "GEDC") + gedcom_line(2, "VERS", "7.0")
+            + gedcom_line(1, "SOUR", "DZINZA") + gedcom_line(2, "NAME", "Dzinza Family Tree")
+            + gedcom_line(1, "NOTE", tree.name))
+
+
+def _event_lines(level: int, tag: str, value: Optional[str], event_date, approx: bool,
+                 place: Optional[str], event_type: Optional[str] = None, note: Optional[str] = None) -> str:
+    lines = gedcom_line(level, tag, value)
+    if event_type:
+        lines += gedcom_line(level + 1, "TYPE", event_type)
+    if event_date:
+        lines += gedcom_line(level + 1, "DATE", format_gedcom_date(event_date, approx))
+    if place:
+        lines += gedcom_line(level + 1, "PLAC", place)
+    if note:
+        lines += gedcom_line(level + 1, "NOTE", note)
+    return lines
+
+
+def _represented_by_family(event: Event, units: List[FamilyUnit]) -> bool:
+    """True for a marriage/divorce event whose participants are the partners of a FAM record that carries it."""
+    spouse_types = _FAMILY_RECORD_EVENTS.get(event.event_type)
+    if not spouse_types:
+        return False
+    participants = {event.person_id}
+    for related_id in event.related_person_ids or []:
+        try: participants.add(uuid.UUID(str(related_id)))
+        except ValueError: continue
+    return any(unit.relationship_type in spouse_types and participants <= set(unit.partner_ids) for unit in units)
+
+
+def _individual(person: Person, events: List[Event], famc: Dict[uuid.UUID, List[uuid.UUID]],
+                fams: Dict[uuid.UUID, List[FamilyUnit]]) -> str:
+    given = " ".join(part for part in (person.first_name, person.middle_names) if part)
+    lines = gedcom_line(0, "INDI", xref=_xref("I", person.id))
+    lines += gedcom_line(1, "NAME", f"{given} /{person.last_name or ''}/".strip())
+    if given:
+        lines += gedcom_line(2, "GIVN", given)
+    if person.last_name:
+        lines += gedcom_line(2, "SURN", person.last_name)
+    if person.nickname:
+        lines += gedcom_line(2, "NICK", person.nickname)
+    if person.gender and person.gender.lower() in _SEX:
+        lines += gedcom_line(1, "SEX", _SEX[person.gender.lower()])
+    birth_place = person.place_of_birth or person.birth_place
+    if person.birth_date or birth_place:
+        lines += _event_lines(1, "BIRT", None, person.birth_date, person.birth_date_approx, birth_place)
+    death_place = person.place_of_death or person.death_place
+    if person.death_date or death_place:
+        lines += _event_lines(1, "DEAT", None, person.death_date, person.death_date_approx, death_place)
+    elif person.is_living is False:
+        lines += gedcom_line(1, "DEAT", "Y")
+    if person.burial_place:
+        lines += _event_lines(1, "BURI", None, None, False, person.burial_place)
+    for event in events:
+        if _represented_by_family(event, fams.get(person.id, [])):
+            continue # Re-importing both copies would duplicate the FAM record's MARR/DIV
+        tag = _EVENT_TAGS.get(event.event_type)
+        if tag in ATTRIBUTE_TAGS:
+            lines += _event_lines(1, tag, event.description, event.date, event.date_approx, event.place)
+        elif tag:
+            lines += _event_lines(1, tag, None, event.date, event.date_approx, event.place, note=event.description)
+        else:
+            lines += _event_lines(1, "EVEN", None, event.date, event.date_approx, event.place,
+                                  event_type=event.event_type, note=event.description)
+    if person.notes:
+        lines += gedcom_line(1, "NOTE", person.notes)
+    for family_id in famc.get(person.id, []):
+        lines += gedcom_line(1, "FAMC", _xref("F", family_id))
+    for unit in fams.get(person.id, []):
+        lines += gedcom_line(1, "FAMS", _xref("F", unit.id))
+    return lines
+
+
+def _family(unit: FamilyUnit) -> str:
+    lines = gedcom_line(0, "FAM", xref=_xref("F", unit.id))
+    for tag, partner_id in zip(("HUSB", "WIFE"), unit.partner_ids): # GEDCOM 7 HUSB/WIFE do not imply sex
+        lines += gedcom_line(1, tag, _xref("I", partner_id))
+    for child_id in unit.child_ids:
+        lines += gedcom_line(1, "CHIL", _xref("I", child_id))
+    if unit.relationship_type in ("spouse_current", "spouse_former"):
+        lines += _event_lines(1, "MARR", None if unit.start_date or unit.location else "Y",
+                              unit.start_date, False, unit.location)
+        if unit.relationship_type == "spouse_former":
+            lines += _event_lines(1, "DIV", None if unit.end_date else "Y", unit.end_date, False, None)
+    return lines
+
+
+def _events_by_person(db: DBSession, person_ids: List[uuid.UUID]) -> Dict[uuid.UUID, List[Event]]:
+    events: Dict[uuid.UUID, List[Event]] = defaultdict(list)
+    for event in db.query(Event).filter(Event.person_id.in_(person_ids)).order_by(Event.date, Event.id):
+        events[event.person_id].append(event)
+    return events
+
+
+def _gedcom_chunks(db: DBSession, tree: Tree, batch_size: int) -> Iterator[str]:
+    units = load_family_units(db, tree.id, batch_size)
+    famc: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+    fams: Dict[uuid.UUID, List[FamilyUnit]] = defaultdict(list)
+    for unit in units:
+        for partner_id in unit.partner_ids:
+            fams[partner_id].append(unit)
+        for child_id in unit.child_ids:
+            famc[child_id].append(unit.id)
+    yield _header(tree)
+
+    last_id = None
+    while True:
+        query = _tree_people_query(db, tree.id)
+        if last_id is not None:
+            query = query.filter(Person.id > last_id)
+        people = query.order_by(Person.id).limit(batch_size).all()
+        if not people:
+            break
+        events = _events_by_person(db, [person.id for person in people])
+        yield "".join(_individual(person, events.get(person.id, []), famc, fams) for person in people)
+        last_id = people[-1].id
+
+    for start in range(0, len(units), batch_size):
+        yield "".join(_family(unit) for unit in units[start:start + batch_size])
+    yield gedcom_line(0, "TRLR")
+
+
+def _cached_export(s3_client, key: str):
+    try:
+        return s3_client.get_object(Bucket=config.OBJECT_STORAGE_BUCKET_NAME, Key=key)["Body"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            logger.warning("Could not read cached GEDCOM export.", key=key, error=str(e))
+        return None
+
+
+def _store_export(db: DBSession, s3_client, tree_id: uuid.UUID, version: int, spool) -> None:
+    """Caches a finished export unless the tree changed while it was being written, then drops older versions."""
+    if db.query(Tree.version).filter(Tree.id == tree_id).scalar() != version:
+        logger.info("Tree changed during GEDCOM export; not caching it.", tree_id=tree_id, version=version)
+        return
+    bucket = config.OBJECT_STORAGE_BUCKET_NAME
+    try:
+        if not create_bucket_if_not_exists(s3_client, bucket):
+            return
+        key = _export_key(tree_id, version)
+        spool.seek(0)
+        s3_client.upload_fileobj(spool, bucket, key, ExtraArgs={"ContentType": GEDCOM_MIMETYPE})
+        listing = s3_client.list_objects_v2(Bucket=bucket, Prefix=f"{config.GEDCOM_EXPORT_PREFIX}{tree_id}/")
+        stale = [{"Key": obj["Key"]} for obj in listing.get("Contents", []) if obj["Key"] != key]
+        if stale:
+            s3_client.delete_objects(Bucket=bucket, Delete={"Objects": stale})
+        logger.info("Cached GEDCOM export.", tree_id=tree_id, key=key, removed=len(stale))
+    except ClientError as e:
+        logger.warning("Could not cache GEDCOM export.", tree_id=tree_id, error=str(e))
+
+
+def export_tree_gedcom_db(db: DBSession, tree_id: uuid.UUID, batch_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Returns a generator streaming the tree as a UTF-8 GEDCOM 7 file. The tree is validated
+    eagerly so a missing tree still produces a normal 404 before streaming starts.
+    """
+    batch_size = batch_size or config.EXPORT_STREAM_BATCH_SIZE
+    tree = _get_or_404(db, Tree, tree_id)
+    version = tree.version
+    try:
+        s3_client = get_storage_client()
+    except Exception:
+        s3_client = None # Export still works, just uncached
+    cached = _cached_export(s3_client, _export_key(tree_id, version)) if s3_client else None
+    if cached is not None:
+        logger.info("Serving cached GEDCOM export.", tree_id=tree_id, version=version)
+
+        def _replay() -> Iterator[bytes]:
+            with closing(cached):
+                yield from cached.iter_chunks(_EXPORT_STREAM_CHUNK)
+        return _replay()
+
+    logger.info("Starting GEDCOM export of tree", tree_id=tree_id, version=version, batch_size=batch_size)
+
+    def _generate() -> Iterator[bytes]:
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+            try:
+                for chunk in _gedcom_chunks(db, tree, batch_size):
+                    data = chunk.encode("utf-8")
+                    spool.write(data)
+                    yield data
+            except Exception:
+                # Headers are already sent; the missing TRLR marks the file as truncated.
+                db.rollback()
+                logger.error("GEDCOM export of tree failed mid-stream.", tree_id=tree_id, exc_info=True)
+                return
+            if s3_client:
+                _store_export(db, s3_client, tree_id, version, spool)
+        logger.info("GEDCOM export of tree completed.", tree_id=tree_id, version=version)
+
+    return _generate()
@@ -0,0 +1,418 @@
+# backend/services/gedcom_import_service.py
+"""
+GEDCOM import pipeline.
+
+`create_gedcom_import_db` stores the upload in object storage, records an ImportJob and
+queues it for the Celery worker, which calls `run_gedcom_import`. The worker streams the
+object twice, individuals first and then families, so both ends of every relationship
+already exist. Each chunk of GEDCOM_IMPORT_BATCH_SIZE records is encrypted in one pass,
+COPYed into temporary staging tables and moved into the real tables with set-based
+INSERT ... SELECT ... ON CONFLICT DO NOTHING. The job checkpoint is committed in the same
+transaction as its chunk. Row ids are derived from the job id and the GEDCOM xref, so a
+resumed job that replays a chunk never duplicates anything.
+"""
+import codecs
+import itertools
+import json
+import uuid
+import structlog
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from flask import abort
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as DBSession
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+
+from config import config
+from extensions import get_fernet
+from gedcom import (ATTRIBUTE_TAGS, GedcomNode, FAMILY_EVENT_TYPES, INDIVIDUAL_EVENT_TYPES, iter_gedcom_records,
+                    parse_gedcom_date, parse_gedcom_name)
+from models import ImportJob, Tree, RelationshipTypeEnum, PrivacyLevelEnum
+from storage_client import get_storage_client, create_bucket_if_not_exists
+from utils import _get_or_404, _handle_sqlalchemy_error
+from services.activity_service import log_activity
+from services.event_service import _participant_rows
+from services.relationship_service import inverse_rows
+from services.sibling_service import affected_children, refresh_inferred_siblings
+from services.tree_version_service import bump_tree_versions
+
+logger = structlog.get_logger(__name__)
+
+PHASES = ("individuals", "families")
+_STALE_RUNNING_AFTER = timedelta(minutes=15) # A running job this quiet lost its worker and may be resumed
+
+_GENDERS = {"M": "male", "F": "female", "U": "unknown", "X": "other"}
+
+_PERSON_COLUMNS = ["id", "first_name", "middle_names", "last_name", "nickname", "gender",
+                   "birth_date", "birth_date_approx", "place_of_birth", "death_date", "death_date_approx",
+                   "place_of_death", "burial_place", "privacy_level", "is_living", "notes",
+                   "custom_attributes", "custom_fields", "created_by", "created_at", "updated_at"]
+_EVENT_COLUMNS = ["id", "person_id", "event_type", "date", "date_approx", "place", "description",
+                  "custom_attributes", "related_person_ids", "privacy_level", "created_by", "created_at", "updated_at"]
+_RELATIONSHIP_COLUMNS = ["id", "person1_id", "person2_id", "relationship_type", "start_date", "location",
+                         "custom_attributes", "created_by", "created_at", "updated_at"]
+_ENCRYPTED_COLUMNS = {
+    "people": ("first_name", "middle_names", "last_name", "place_of_birth", "place_of_death", "burial_place", "notes"),
+    "events": ("place", "description"),
+}
+
+
+@dataclass
+class _ImportContext:
+    job_id: uuid.UUID
+    tree_id: uuid.UUID
+    user_id: uuid.UUID
+    now: datetime
+
+    def record_id(self, *parts: str) -> uuid.UUID:
+        return uuid.uuid5(self.job_id, ":".join(parts))
+
+    def person_id(self, xref: Optional[str]) -> Optional[uuid.UUID]:
+        return self.record_id("INDI", xref) if xref else None
+
+
+@dataclass
+class _Chunk:
+    people: List[Dict[str, Any]]
+    events: List[Dict[str, Any]]
+    relationships: List[Dict[str, Any]]
+
+
+def _event_description(node: GedcomNode) -> Optional[str]:
+    """Attributes (OCCU, RESI, ...) carry it as the line value; events as an inline NOTE, as the exporter writes them."""
+    if node.tag in ATTRIBUTE_TAGS:
+        return node.value
+    notes = "\n\n".join(n.value for n in node.all("NOTE") if n.value and not n.value.startswith("@"))
+    return notes or (node.value if node.value and node.value.upper() != "Y" else None)
+
+
+def _event_row(ctx: _ImportContext, event_id: uuid.UUID, event_type: str, node: GedcomNode,
+               person_id: Optional[uuid.UUID], related_ids: List[uuid.UUID]) -> Dict[str, Any]:
+    event_date, approx = parse_gedcom_date(node.value_of("DATE"))
+    if node.tag == "EVEN":
+        event_type = (node.value_of("TYPE") or event_type).strip().lower()[:100]
+    return {"id": event_id, "person_id": person_id, "event_type": event_type, "date": event_date,
+            "date_approx": approx, "place": node.value_of("PLAC"), "description": _event_description(node),
+            "custom_attributes": {"gedcom_tag": node.tag}, "related_person_ids": [str(pid) for pid in related_ids],
+            "privacy_level": PrivacyLevelEnum.inherit.value, "created_by": ctx.user_id,
+            "created_at": ctx.now, "updated_at": ctx.now}
+
+
+def map_individual(ctx: _ImportContext, record: GedcomNode) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Maps an INDI record to a people row plus one events row per individual event."""
+    person_id = ctx.person_id(record.xref)
+    name = record.first("NAME")
+    given, surname = parse_gedcom_name(name.value if name else None)
+    if name is not None:
+        given = name.value_of("GIVN") or given
+        surname = name.value_of("SURN") or surname
+    given_names = (given or "").split()
+    birth, death = record.first("BIRT"), record.first("DEAT")
+    birth_date, birth_approx = parse_gedcom_date(birth.value_of("DATE") if birth else None)
+    death_date, death_approx = parse_gedcom_date(death.value_of("DATE") if death else None)
+    burial = record.first("BURI")
+    nickname = (name.value_of("NICK") if name else None) or record.value_of("NICK")
+    notes = "\n\n".join(n.value for n in record.all("NOTE") if n.value and not n.value.startswith("@"))
+    person = {
+        "id": person_id, "first_name": given_names[0] if given_names else None,
+        "middle_names": " ".join(given_names[1:]) or None, "last_name": surname,
+        "nickname": nickname[:100] if nickname else None,
+        "gender": _GENDERS.get((record.value_of("SEX") or "").strip().upper()[:1]),
+        "birth_date": birth_date, "birth_date_approx": birth_approx,
+        "place_of_birth": birth.value_of("PLAC") if birth else None,
+        "death_date": death_date, "death_date_approx": death_approx,
+        "place_of_death": death.value_of("PLAC") if death else None,
+        "burial_place": burial.value_of("PLAC") if burial else None,
+        "privacy_level": PrivacyLevelEnum.inherit.value, "is_living": death is None,
+        "notes": notes or None, "custom_attributes": {"gedcom_xref": record.xref}, "custom_fields": {},
+        "created_by": ctx.user_id, "created_at": ctx.now, "updated_at": ctx.now,
+    }
+    events = []
+    for index, node in enumerate(record.children):
+        if node.tag in INDIVIDUAL_EVENT_TYPES:
+            event_id = ctx.record_id("INDI", record.xref, node.tag, str(index))
+            events.append(_event_row(ctx, event_id, INDIVIDUAL_EVENT_TYPES[node.tag], node, person_id, []))
+    return person, events
+
+
+def map_family(ctx: _ImportContext, record: GedcomNode) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Maps a FAM record to relationship rows (a spouse edge between HUSB and WIFE, former if
+    divorced, and a biological_parent edge from each partner to each CHIL) plus family events.
+    """
+    partners = [pid for pid in (ctx.person_id(record.value_of("HUSB")), ctx.person_id(record.value_of("WIFE"))) if pid]
+    children = [ctx.person_id(child.value) for child in record.all("CHIL") if child.value]
+    marriage = record.first("MARR")
+    relationships = []
+
+    def edge(person1_id, person2_id, rel_type, start_date=None, location=None):
+        relationships.append({
+            "id": ctx.record_id("FAM", record.xref, str(person1_id), str(person2_id)),
+            "person1_id": person1_id, "person2_id": person2_id, "relationship_type": rel_type.value,
+            "start_date": start_date, "location": location[:255] if location else None,
+            "custom_attributes": {"gedcom_family": record.xref},
+            "created_by": ctx.user_id, "created_at": ctx.now, "updated_at": ctx.now})
+
+    if len(partners) == 2:
+        spouse_type = RelationshipTypeEnum.spouse_former if record.first("DIV") else RelationshipTypeEnum.spouse_current
+        married_on = parse_gedcom_date(marriage.value_of("DATE"))[0] if marriage else None
+        edge(partners[0], partners[1], spouse_type, married_on, marriage.value_of("PLAC") if marriage else None)
+    for parent_id in partners:
+        for child_id in children:
+            edge(parent_id, child_id, RelationshipTypeEnum.biological_parent)
+
+    events = []
+    if partners:
+        for index, node in enumerate(record.children):
+            if node.tag in FAMILY_EVENT_TYPES:
+                event_id = ctx.record_id("FAM", record.xref, node.tag, str(index))
+                events.append(_event_row(ctx, event_id, FAMILY_EVENT_TYPES[node.tag], node, partners[0], partners[1:]))
+    return relationships, events
+
+
+def _map_chunk(ctx: _ImportContext, phase: str, records: List[GedcomNode]) -> _Chunk:
+    chunk = _Chunk(people=[], events=[], relationships=[])
+    for record in records:
+        if not record.xref: # Ids derive from xrefs, and INDI/FAM records without one cannot be referenced
+            continue
+        if phase == "individuals" and record.tag == "INDI":
+            person, events = map_individual(ctx, record)
+            chunk.people.append(person); chunk.events.extend(events)
+        elif phase == "families" and record.tag == "FAM":
+            relationships, events = map_family(ctx, record)
+            chunk.relationships.extend(relationships); chunk.events.extend(events)
+    return chunk
+
+
+def _encrypt_rows(table: str, rows: List[Dict[str, Any]]) -> None:
+    """Encrypts the EncryptedString columns in place; COPY bypasses the column type's bind processing."""
+    columns = _ENCRYPTED_COLUMNS.get(table, ())
+    if not rows or not columns:
+        return
+    fernet = get_fernet()
+    if fernet is None:
+        raise RuntimeError("Encryption is not initialized; refusing to import personal data as plaintext.")
+    for row in rows:
+        for column in columns:
+            if row[column] is not None:
+                row[column] = fernet.encrypt(str(row[column]).encode("utf-8")).decode("utf-8")
+
+
+def _copy_value(value: Any) -> Any:
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+def _stage(db: DBSession, table: str, columns: List[str], rows: List[Dict[str, Any]]) -> str:
+    """COPYs rows into a transaction-scoped staging copy of `table` and returns its name."""
+    staging = f"import_staging_{table}"
+    db.execute(text(f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+    driver_connection = db.connection().connection.driver_connection
+    with driver_connection.cursor() as cursor:
+        with cursor.copy(f"COPY {staging} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row([_copy_value(row[column]) for column in columns])
+    return staging
+
+
+def _insert_from_staging(db: DBSession, table: str, columns: List[str], rows: List[Dict[str, Any]],
+                         where: str = "", returning: bool = True) -> List[uuid.UUID]:
+    if not rows:
+        return []
+    staging = _stage(db, table, columns, rows)
+    column_list = ", ".join(columns)
+    statement = (f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} s {where} "
+                 f"ON CONFLICT DO NOTHING" + (" RETURNING id" if returning else ""))
+    result = db.execute(text(statement))
+    return list(result.scalars()) if returning else []
+
+
+def _inverse_relationship_rows(ctx: _ImportContext, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The materialized inverses of `rows`, with ids derived from the forward edge so a resumed chunk reloads the same rows."""
+    inverses = []
+    for row in rows:
+        for inverse in inverse_rows([row]):
+            inverses.append({**inverse, "id": ctx.record_id("INVERSE", str(row["id"])),
+                             "relationship_type": inverse["relationship_type"].value,
+                             "created_at": ctx.now, "updated_at": ctx.now})
+    return inverses
+
+
+def _load_chunk(db: DBSession, ctx: _ImportContext, chunk: _Chunk) -> Dict[str, List[uuid.UUID]]:
+    """Loads one mapped chunk; rows pointing at people that were never imported are dropped by the EXISTS filters."""
+    _encrypt_rows("people", chunk.people)
+    _encrypt_rows("events", chunk.events)
+    person_ids = _insert_from_staging(db, "people", _PERSON_COLUMNS, chunk.people)
+    _insert_from_staging(db, "person_tree_association", ["person_id", "tree_id"],
+                         [{"person_id": p["id"], "tree_id": ctx.tree_id} for p in chunk.people],
+                         where="WHERE EXISTS (SELECT 1 FROM people p WHERE p.id = s.person_id)", returning=False)
+    relationships = chunk.relationships
+    if config.RELATIONSHIP_MATERIALIZE_INVERSE:
+        relationships = relationships + _inverse_relationship_rows(ctx, relationships)
+    relationship_ids = _insert_from_staging(
+        db, "relationships", _RELATIONSHIP_COLUMNS, relationships,
+        where="WHERE EXISTS (SELECT 1 FROM people p WHERE p.id = s.person1_id) "
+              "AND EXISTS (SELECT 1 FROM people p WHERE p.id = s.person2_id)")
+    if relationship_ids and config.INFERRED_SIBLINGS_ENABLED:
+        refresh_inferred_siblings(db, affected_children(
+            (r["person1_id"], r["person2_id"], r["relationship_type"]) for r in chunk.relationships))
+    event_ids = _insert_from_staging(db, "events", _EVENT_COLUMNS, chunk.events,
+                                     where="WHERE EXISTS (SELECT 1 FROM people p WHERE p.id = s.person_id)")
+    participants = [row for event in chunk.events for row in _participant_rows(
+        event["id"], event["person_id"], [uuid.UUID(pid) for pid in event["related_person_ids"]])]
+    _insert_from_staging(db, "event_participants", ["event_id", "person_id", "role"], participants,
+                         where="WHERE EXISTS (SELECT 1 FROM events e WHERE e.id = s.event_id) "
+                               "AND EXISTS (SELECT 1 FROM people p WHERE p.id = s.person_id)", returning=False)
+    return {"person": person_ids, "relationship": relationship_ids, "event": event_ids}
+
+
+def _source_lines(source_key: str) -> Iterator[str]:
+    body = get_storage_client().get_object(Bucket=config.OBJECT_STORAGE_BUCKET_NAME, Key=source_key)["Body"]
+    with closing(body):
+        yield from codecs.iterdecode(body.iter_lines(), "utf-8-sig")
+
+
+def _run_phase(db: DBSession, job: ImportJob, ctx: _ImportContext,
+               progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+    records = itertools.islice(iter_gedcom_records(_source_lines(job.source_key)), job.records_done, None)
+    while True:
+        batch = list(itertools.islice(records, config.GEDCOM_IMPORT_BATCH_SIZE))
+        if not batch:
+            return
+        loaded = _load_chunk(db, ctx, _map_chunk(ctx, job.phase, batch))
+        changes = [(entity, entity_id, "upsert") for entity, ids in loaded.items() for entity_id in ids]
+        if changes:
+            bump_tree_versions(db, tree_ids=[ctx.tree_id], changes=changes)
+        job.records_done += len(batch)
+        job.people_imported += len(loaded["person"])
+        job.relationships_imported += len(loaded["relationship"])
+        job.events_imported += len(loaded["event"])
+        db.commit() # Chunk and checkpoint become durable together
+        logger.info("GEDCOM import chunk committed.", job_id=job.id, phase=job.phase, records_done=job.records_done)
+        if progress:
+            progress(job.to_dict())
+
+
+def run_gedcom_import(db: DBSession, job_id: uuid.UUID,
+                      progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Runs (or resumes) a queued import job from its last committed checkpoint. Returns the
+    finished job, or None when the job was not pending (already claimed by another delivery).
+    """
+    claimed = db.query(ImportJob).filter(ImportJob.id == job_id, ImportJob.status == "pending") \
+        .update({"status": "running", "error": None}, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        logger.warning("GEDCOM import job is not pending; skipping.", job_id=job_id)
+        return None
+    job = db.query(ImportJob).filter(ImportJob.id == job_id).one()
+    ctx = _ImportContext(job_id=job.id, tree_id=job.tree_id, user_id=job.user_id, now=datetime.utcnow())
+    try:
+        for phase in PHASES[PHASES.index(job.phase):]:
+            if job.phase != phase:
+                job.phase = phase; job.records_done = 0
+                db.commit()
+            _run_phase(db, job, ctx, progress)
+        job.status = "completed"; job.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("GEDCOM import failed.", job_id=job_id, phase=job.phase, records_done=job.records_done, exc_info=True)
+        job.status = "failed"; job.error = str(e)[:2000]
+        db.commit()
+        raise
+    log_activity(db=db, actor_user_id=job.user_id, action_type="IMPORT_GEDCOM", entity_type="TREE",
+                 entity_id=job.tree_id, tree_id=job.tree_id, new_state=job.to_dict())
+    logger.info("GEDCOM import completed.", job_id=job.id, people=job.people_imported,
+                relationships=job.relationships_imported, events=job.events_imported)
+    return job.to_dict()
+
+
+def _enqueue_import(job_id: uuid.UUID) -> None:
+    from celery_app import import_gedcom_task # Deferred: celery_app imports this module's runner lazily too
+    import_gedcom_task.delay(str(job_id))
+
+
+def _enqueue_or_fail(db: DBSession, job: ImportJob) -> None:
+    """Queues a committed pending job; if the broker is unreachable the job is marked failed (so it can be resumed) and 503 raised."""
+    try:
+        _enqueue_import(job.id)
+    except Exception as e:
+        logger.error("Could not queue GEDCOM import.", job_id=job.id, error=str(e), exc_info=True)
+        job.status = "failed"; job.error = f"Could not queue the import: {e}"[:2000]
+        db.commit()
+        abort(503, description="The import could not be queued; resume it once the service is available.")
+
+
+def _get_job_or_404(db: DBSession, tree_id: uuid.UUID, job_id: uuid.UUID) -> ImportJob:
+    job = db.query(ImportJob).filter(ImportJob.id == job_id, ImportJob.tree_id == tree_id).one_or_none()
+    if job is None:
+        abort(404, description=f"Import job {job_id} not found.")
+    return job
+
+
+def create_gedcom_import_db(db: DBSession, user_id: uuid.UUID, tree_id: uuid.UUID,
+                            file_stream, filename: str) -> Dict[str, Any]:
+    """Uploads a GEDCOM file to object storage and queues its import into `tree_id`."""
+    secured_filename = secure_filename(filename or "")
+    if not secured_filename.lower().endswith(".ged"):
+        abort(400, description={"message": "Validation failed", "details": {"file": "A .ged file is required."}})
+    _get_or_404(db, Tree, tree_id)
+    job_id = uuid.uuid4()
+    source_key = f"{config.GEDCOM_IMPORT_PREFIX}{tree_id}/{job_id}.ged"
+    logger.info("Creating GEDCOM import", tree_id=tree_id, user_id=user_id, job_id=job_id, filename=secured_filename)
+    try:
+        s3_client = get_storage_client()
+        if not create_bucket_if_not_exists(s3_client, config.OBJECT_STORAGE_BUCKET_NAME):
+            abort(500, description="Storage bucket is not ready.")
+        s3_client.upload_fileobj(file_stream, config.OBJECT_STORAGE_BUCKET_NAME, source_key,
+                                 ExtraArgs={"ContentType": "text/plain"})
+        job = ImportJob(id=job_id, tree_id=tree_id, user_id=user_id, filename=secured_filename, source_key=source_key)
+        db.add(job)
+        db.commit()
+        _enqueue_or_fail(db, job)
+        return job.to_dict()
+    except ClientError as e:
+        db.rollback()
+        logger.error("Storage error uploading GEDCOM file.", tree_id=tree_id, error=str(e), exc_info=True)
+        abort(500, description="A storage service error occurred while uploading the GEDCOM file.")
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "creating GEDCOM import job", db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("Unexpected error creating GEDCOM import.", tree_id=tree_id, exc_info=True)
+        abort(500, description="Error starting GEDCOM import.")
+    return {} # Should be unreachable
+
+
+def get_gedcom_import_db(db: DBSession, tree_id: uuid.UUID, job_id: uuid.UUID) -> Dict[str, Any]:
+    return _get_job_or_404(db, tree_id, job_id).to_dict()
+
+
+def resume_gedcom_import_db(db: DBSession, tree_id: uuid.UUID, job_id: uuid.UUID) -> Dict[str, Any]:
+    """Re-queues a failed (or abandoned running) job; it continues after its last committed chunk."""
+    job = _get_job_or_404(db, tree_id, job_id)
+    abandoned = job.status == "running" and job.updated_at and job.updated_at < datetime.utcnow() - _STALE_RUNNING_AFTER
+    if job.status != "failed" and not abandoned:
+        abort(409, description=f"Import job is {job.status} and cannot be resumed.")
+    try:
+        job.status = "pending"; job.error = None
+        db.commit()
+        _enqueue_or_fail(db, job)
+        logger.info("GEDCOM import resumed.", job_id=job.id, phase=job.phase, records_done=job.records_done)
+        return job.to_dict()
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, "resuming GEDCOM import job", db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Unexpected error resuming GEDCOM import.", job_id=job_id, exc_info=True)
+        abort(500, description="Error resuming GEDCOM import.")
+    return {} # Should be unreachable
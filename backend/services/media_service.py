@@ -2,7 +2,7 @@
 import uuid
 import structlog
 import os
-from typing import Dict, Any, Optional, IO
+from typing import Dict, Any, Optional, IO, List
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError
 from flask import abort
@@ -12,12 +12,31 @@ from werkzeug.utils import secure_filename
 
 # Absolute imports from the app root
 from models import MediaItem, MediaTypeEnum, Person, Tree, Event, Relationship # Event (if/when Event model exists)
-from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query
+from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query, sparse_load_options, ensure_exists_or_404
 from config import config # Direct import of the config instance
 from storage_client import get_storage_client, create_bucket_if_not_exists
+from services.tree_version_service import bump_tree_versions
 
 logger = structlog.get_logger(__name__)
 
+def _bump_versions_for_media(db: DBSession, media_item: MediaItem, operation: str) -> None:
+    """Bumps the versions of the trees in which the media item's linked entity appears."""
+    entity_type, entity_id = media_item.linked_entity_type, media_item.linked_entity_id
+    changes = [("media", media_item.id, operation)]
+    if entity_type == "Tree":
+        bump_tree_versions(db, tree_ids=[entity_id], changes=changes)
+    elif entity_type == "Person":
+        bump_tree_versions(db, person_ids=[entity_id], changes=changes)
+    elif entity_type == "Event":
+        event = db.get(Event, entity_id)
+        if event:
+            from services.event_service import _event_person_ids
+            bump_tree_versions(db, person_ids=_event_person_ids(event), changes=changes)
+    elif entity_type == "Relationship":
+        relationship = db.get(Relationship, entity_id)
+        if relationship:
+            bump_tree_versions(db, person_ids=[relationship.person1_id, relationship.person2_id], changes=changes)
+
 # Helper to map content_type to MediaTypeEnum
 def _infer_file_type(content_type: Optional[str], filename: Optional[str]) -> MediaTypeEnum:
     if content_type:
@@ -33,13 +52,13 @@ def _infer_file_type(content_type: Optional[str], filename: Optional[str]) -> Me
         elif ext == '.pdf': return MediaTypeEnum.document
     return MediaTypeEnum.other
 
-def get_media_item_db(db: DBSession, media_id: uuid.UUID) -> Dict[str, Any]:
+def get_media_item_db(db: DBSession, media_id: uuid.UUID, fields: Optional[List[str]] = None) -> Dict[str, Any]:
     # Removed tree_id from parameters
     """Fetches a single media item by its ID."""
     logger.info("Fetching media item", media_id=media_id)
     # Fetch globally. Authorization (e.g. if user can access this media) is a higher-level concern.
-    media_item = _get_or_404(db, MediaItem, media_id)
-    return media_item.to_dict()
+    media_item = _get_or_404(db, MediaItem, media_id, options=sparse_load_options(MediaItem, fields))
+    return media_item.to_dict(fields=fields) if fields else media_item.to_dict()
 
 def upload_media_item_db(db: DBSession, user_id: uuid.UUID, 
                          tree_id_context: Optional[uuid.UUID], # The tree user is currently in, can be None
@@ -61,7 +80,7 @@ def upload_media_item_db(db: DBSession, user_id: uuid.UUID,
 
     # Validate linked entity and determine MediaItem.tree_id
     if linked_entity_type == "Person":
-        _get_or_404(db, Person, linked_entity_id) # Check person exists globally
+        ensure_exists_or_404(db, Person, linked_entity_id) # Check person exists globally
         media_item_tree_id = None # Media linked to a Person is global (tree_id is NULL)
     elif linked_entity_type == "Tree":
         tree_entity = _get_or_404(db, Tree, linked_entity_id)
@@ -72,10 +91,10 @@ def upload_media_item_db(db: DBSession, user_id: uuid.UUID,
                            provided_tree_id_context=tree_id_context, target_tree_id=media_item_tree_id)
             abort(400, "Context tree ID mismatch for Tree entity media.")
     elif linked_entity_type == "Event": # Assuming Event is global
-        _get_or_404(db, Event, linked_entity_id)
+        ensure_exists_or_404(db, Event, linked_entity_id)
         media_item_tree_id = None
     elif linked_entity_type == "Relationship": # Assuming Relationship is global
-        _get_or_404(db, Relationship, linked_entity_id)
+        ensure_exists_or_404(db, Relationship, linked_entity_id)
         media_item_tree_id = None
     else:
         logger.warning("Unsupported entity type for media linking.", entity_type=linked_entity_type)
@@ -137,6 +156,8 @@ def upload_media_item_db(db: DBSession, user_id: uuid.UUID,
         )
 
         db.add(new_media_item)
+        db.flush() # Assigns new_media_item.id for the change journal
+        _bump_versions_for_media(db, new_media_item, "upsert")
         db.commit()
         db.refresh(new_media_item)
         
@@ -193,6 +214,7 @@ def delete_media_item_db(db: DBSession, media_id: uuid.UUID, user_id: uuid.UUID)
                          error=str(e), exc_info=True)
             # Depending on policy, you might choose to abort here if S3 deletion is critical and must succeed.
 
+        _bump_versions_for_media(db, media_item, "delete")
         db.delete(media_item)
         db.commit()
         
@@ -219,7 +241,8 @@ def get_media_for_entity_db(db: DBSession, entity_type: str, entity_id: uuid.UUI
                               page: int = -1, per_page: int = -1, # -1 means use config default
                               sort_by: Optional[str] = "created_at",
                               sort_order: Optional[str] = "desc",
-                              tree_id_context: Optional[uuid.UUID] = None # Used for Tree entity type to ensure correct tree
+                              tree_id_context: Optional[uuid.UUID] = None, # Used for Tree entity type to ensure correct tree
+                              fields: Optional[List[str]] = None
                              ) -> Dict[str, Any]:
     """Fetches paginated media items linked to a specific entity."""
     current_page = page if page != -1 else config.PAGINATION_DEFAULTS["page"]
@@ -259,7 +282,9 @@ def get_media_for_entity_db(db: DBSession, entity_type: str, entity_id: uuid.UUI
             logger.warning(f"Invalid sort_order '{sort_order}'. Defaulting to 'desc'.")
             sort_order = 'desc'
 
-        return paginate_query(query, MediaItem, current_page, current_per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by, sort_order)
+        query = query.options(*sparse_load_options(MediaItem, fields))
+        return paginate_query(query, MediaItem, current_page, current_per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by, sort_order,
+                              fields=fields)
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching media for entity {entity_type}:{entity_id}", db)
     except HTTPException: # Re-raise aborts
@@ -1,11 +1,14 @@
 # backend/services/person_service.py
 import uuid
 import structlog
+from collections import defaultdict
 from datetime import date
 from typing import Dict, Any, Optional, List # Ensure List is also imported if used by paginate_query
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, func, case, delete, exists, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import aliased
 from flask import abort
 from werkzeug.exceptions import HTTPException
 
@@ -14,26 +17,98 @@ from werkzeug.utils import secure_filename # For sanitizing filenames
 # from botocore.exceptions import S3UploadFailedError, ClientError # More specific Boto3 exceptions
 
 # Absolute imports from the app root
-from models import Person, PrivacyLevelEnum, PersonTreeAssociation # MediaItem, MediaTypeEnum (Not needed for this task)
-from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query
+from models import (Person, PrivacyLevelEnum, PersonTreeAssociation, Relationship, Event, EventParticipant, MediaItem,
+                    Tree, TreeAccess)
+from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query, sparse_load_options, forget_existence
 from config import config # Direct import of the config instance
 from storage_client import get_storage_client, create_bucket_if_not_exists
 # from services.media_service import create_media_item_record_db # Not using for direct profile pic update
-from services.activity_service import log_activity # For audit logging
+from services.activity_service import log_activity, attribute_diff, should_snapshot # For audit logging
+from services.tree_version_service import bump_tree_versions
+from services.sibling_service import affected_children, refresh_inferred_siblings
 
 logger = structlog.get_logger(__name__)
 
+# Related collections that can be embedded in person responses via ?include=
+PERSON_INCLUDES = ("relationships", "events", "media_summary")
+
+def _validate_includes(include: Optional[List[str]]) -> List[str]:
+    if not include:
+        return []
+    unknown = [i for i in include if i not in PERSON_INCLUDES]
+    if unknown:
+        abort(400, description={"message": "Validation failed",
+                                "details": {"include": f"Unknown include(s): {', '.join(unknown)}. Allowed: {', '.join(PERSON_INCLUDES)}."}})
+    return include
+
+def _attach_person_includes(db: DBSession, items: List[Dict[str, Any]], include: List[str],
+                            tree_id: uuid.UUID) -> None:
+    """
+    Embeds the requested related collections into each serialized person.
+    Each collection is loaded for the whole page with a single IN (...) query
+    and stitched in memory, so the query count does not grow with page size.
+    Relationships are limited to edges whose other endpoint is also in `tree_id`.
+    """
+    if not items or not include:
+        return
+    person_ids = [uuid.UUID(item["id"]) for item in items]
+    id_set = set(person_ids)
+
+    if "relationships" in include:
+        from services.relationship_service import tree_relationships_filter # Deferred: relationship_service imports this module
+        rels_by_person: Dict[uuid.UUID, List[Dict[str, Any]]] = defaultdict(list)
+        relationships = db.query(Relationship).filter(
+            or_(Relationship.person1_id.in_(person_ids), Relationship.person2_id.in_(person_ids)),
+            tree_relationships_filter(tree_id)
+        ).all()
+        for rel in relationships:
+            rel_dict = rel.to_dict()
+            if rel.person1_id in id_set: rels_by_person[rel.person1_id].append(rel_dict)
+            if rel.person2_id in id_set and rel.person2_id != rel.person1_id: rels_by_person[rel.person2_id].append(rel_dict)
+        for item, pid in zip(items, person_ids):
+            item["relationships"] = rels_by_person.get(pid, [])
+
+    if "events" in include:
+        events_by_person: Dict[uuid.UUID, List[Dict[str, Any]]] = defaultdict(list)
+        participating = select(EventParticipant.event_id).where(EventParticipant.person_id.in_(person_ids))
+        events = db.query(Event).filter(Event.id.in_(participating)).order_by(Event.date.asc().nulls_last()).all()
+        for event in events:
+            event_dict = event.to_dict()
+            participants = {event.person_id} if event.person_id else set()
+            for related_id in event.related_person_ids or []:
+                try: participants.add(uuid.UUID(str(related_id)))
+                except ValueError: continue
+            for pid in participants & id_set:
+                events_by_person[pid].append(event_dict)
+        for item, pid in zip(items, person_ids):
+            item["events"] = events_by_person.get(pid, [])
+
+    if "media_summary" in include:
+        summaries: Dict[uuid.UUID, Dict[str, Any]] = {}
+        rows = db.query(MediaItem.linked_entity_id, MediaItem.file_type, func.count(MediaItem.id))\
+            .filter(MediaItem.linked_entity_type == "Person", MediaItem.linked_entity_id.in_(person_ids))\
+            .group_by(MediaItem.linked_entity_id, MediaItem.file_type).all()
+        for entity_id, file_type, count in rows:
+            summary = summaries.setdefault(entity_id, {"total": 0, "by_type": {}})
+            summary["total"] += count
+            summary["by_type"][file_type.value if file_type else "other"] = count
+        for item, pid in zip(items, person_ids):
+            item["media_summary"] = summaries.get(pid, {"total": 0, "by_type": {}})
+
 def get_all_people_db(db: DBSession,
                         tree_id: uuid.UUID,
                         page: int = -1, # Default to trigger config lookup
                         per_page: int = -1, # Default to trigger config lookup
                         sort_by: Optional[str] = "last_name",
                         sort_order: Optional[str] = "asc",
-                        filters: Optional[Dict[str, Any]] = None
+                        filters: Optional[Dict[str, Any]] = None,
+                        fields: Optional[List[str]] = None,
+                        include: Optional[List[str]] = None
                         ) -> Dict[str, Any]:
     """
     Fetches a paginated list of people for a given tree.
-    Correctly indented docstring.
+    If `fields` is given, only those columns (plus `id`) are selected and returned.
+    `include` embeds related collections (see PERSON_INCLUDES), batch-loaded for the page.
     """
     # cfg_pagination = app_config_module.config.PAGINATION_DEFAULTS # Using direct config import
     current_page = page if page != -1 else config.PAGINATION_DEFAULTS["page"]
@@ -41,9 +116,11 @@ def get_all_people_db(db: DBSession,
 
     logger.info("Fetching people for tree", tree_id=tree_id, page=current_page, per_page=current_per_page, sort_by=sort_by, filters=filters)
     try:
+        include = _validate_includes(include)
         # Query Person objects by joining with PersonTreeAssociation
         query = db.query(Person).join(PersonTreeAssociation, Person.id == PersonTreeAssociation.person_id)\
-                                .filter(PersonTreeAssociation.tree_id == tree_id)
+                                .filter(PersonTreeAssociation.tree_id == tree_id)\
+                                .options(*sparse_load_options(Person, fields))
         
         filter_conditions = [] 
 
@@ -103,7 +180,10 @@ def get_all_people_db(db: DBSession,
         if sort_order not in ['asc', 'desc']:
             sort_order = 'asc'
 
-        return paginate_query(query, Person, current_page, current_per_page, cfg_pagination["max_per_page"], sort_by, sort_order)
+        result = paginate_query(query, Person, current_page, current_per_page, config.PAGINATION_DEFAULTS["max_per_page"], sort_by, sort_order,
+                                fields=fields)
+        _attach_person_includes(db, result["items"], include, tree_id)
+        return result
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching people for tree {tree_id}", db) # This will abort
     except HTTPException: # Re-raise aborts if they happen within this function
@@ -113,22 +193,30 @@ def get_all_people_db(db: DBSession,
         abort(500, description="An unexpected error occurred while fetching people.")
     return {} # Should be unreachable if aborts are working
 
-def get_person_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID) -> Dict[str, Any]:
+def get_person_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID,
+                  fields: Optional[List[str]] = None,
+                  include: Optional[List[str]] = None) -> Dict[str, Any]:
     """Fetches a single person by ID if they are associated with the specific tree."""
     logger.info("Fetching person details", person_id=person_id, tree_id=tree_id)
     try:
+        include = _validate_includes(include)
         person = db.query(Person)\
             .join(PersonTreeAssociation, Person.id == PersonTreeAssociation.person_id)\
             .filter(Person.id == person_id, PersonTreeAssociation.tree_id == tree_id)\
+            .options(*sparse_load_options(Person, fields))\
             .one_or_none()
 
         if not person:
             logger.warning("Person not found or not associated with tree", person_id=person_id, tree_id=tree_id)
             abort(404, description=f"Person with ID {person_id} not found in tree {tree_id}.")
         
-        return person.to_dict()
+        person_dict = person.to_dict(fields=fields) if fields else person.to_dict()
+        _attach_person_includes(db, [person_dict], include, tree_id)
+        return person_dict
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching person {person_id} for tree {tree_id}", db)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Unexpected error fetching person.", person_id=person_id, tree_id=tree_id, exc_info=True)
         abort(500, description="Error fetching person details.")
@@ -215,6 +303,7 @@ def create_person_db(db: DBSession,
         # Create the association with the tree
         association = PersonTreeAssociation(person_id=new_person.id, tree_id=tree_id)
         db.add(association)
+        bump_tree_versions(db, tree_ids=[tree_id], changes=[("person", new_person.id, "upsert")])
         
         db.commit()
         db.refresh(new_person) # Refresh new_person to get any db-generated values if needed
@@ -231,7 +320,7 @@ def create_person_db(db: DBSession,
         # Audit Log - tree_id is still relevant for context of creation
         log_activity(db=db, actor_user_id=user_id, action_type="CREATE_PERSON",
                      entity_type="PERSON", entity_id=new_person.id, tree_id=tree_id, 
-                     new_state=person_dict, ip_address=ip_address, user_agent=user_agent)
+                     new_state=person_dict, is_snapshot=True, ip_address=ip_address, user_agent=user_agent)
         
         return person_dict
     except SQLAlchemyError as e:
@@ -264,7 +353,6 @@ def update_person_db(db: DBSession,
 
     # If association exists, fetch the person
     person = _get_or_404(db, Person, person_id) # No longer pass tree_id here
-    previous_state = person.to_dict() # Capture state before update
     
     validation_errors: Dict[str, str] = {}
     allowed_fields = [
@@ -325,16 +413,19 @@ def update_person_db(db: DBSession,
     
     # person.updated_at is handled by onupdate in the model
     try:
+        field_changes = attribute_diff(person) # Must run before the flush below resets attribute history
+        snapshot = should_snapshot(db, Person, person.id) # Same transaction as the edit it audits
+        bump_tree_versions(db, person_ids=[person.id], changes=[("person", person.id, "upsert")])
         db.commit()
         db.refresh(person)
         updated_person_dict = person.to_dict()
         logger.info("Person updated successfully", person_id=person.id, tree_id=tree_id, actor_user_id=actor_user_id)
 
-        # Audit Log
+        # Audit Log: the diff only, plus the full state every AUDIT_SNAPSHOT_INTERVAL entries
         log_activity(db=db, actor_user_id=actor_user_id, action_type="UPDATE_PERSON",
                      entity_type="PERSON", entity_id=person.id, tree_id=tree_id,
-                     previous_state=previous_state, new_state=updated_person_dict,
-                     ip_address=ip_address, user_agent=user_agent)
+                     changes=field_changes, new_state=updated_person_dict if snapshot else None,
+                     is_snapshot=snapshot, ip_address=ip_address, user_agent=user_agent)
         
         return updated_person_dict
     except SQLAlchemyError as e:
@@ -370,7 +461,23 @@ def delete_person_db(db: DBSession,
 
 
     try:
+        # Journal the rows the delete cascades to, before the cascade removes the associations
+        cascaded_rels = db.query(Relationship.id, Relationship.person1_id, Relationship.person2_id,
+                                 Relationship.relationship_type).filter(
+            or_(Relationship.person1_id == person.id, Relationship.person2_id == person.id)).all()
+        cascaded_rel_ids = [row.id for row in cascaded_rels]
+        cascaded_event_ids = [eid for (eid,) in db.query(Event.id).filter(Event.person_id == person.id).all()]
+        bump_tree_versions(db, person_ids=[person.id], changes=(
+            [("person", person.id, "delete")]
+            + [("relationship", rid, "delete") for rid in cascaded_rel_ids]
+            + [("event", eid, "delete") for eid in cascaded_event_ids]
+        ))
         db.delete(person)
+        forget_existence(Person, [person.id]); forget_existence(Relationship, cascaded_rel_ids)
+        forget_existence(Event, cascaded_event_ids)
+        if config.INFERRED_SIBLINGS_ENABLED: # Their children lose a shared parent
+            refresh_inferred_siblings(db, affected_children(
+                (row.person1_id, row.person2_id, row.relationship_type) for row in cascaded_rels) - {person.id})
         db.commit()
         logger.info("Person deleted successfully", person_id=person_id, person_name=person_name_for_log, tree_id=tree_id, actor_user_id=actor_user_id)
 
@@ -389,6 +496,158 @@ def delete_person_db(db: DBSession,
     return False # Should be unreachable
 
 
+def _move_relationships(db: DBSession, keep_id: uuid.UUID, merge_id: uuid.UUID):
+    """
+    Repoints the merged person's relationships at `keep_id` with one UPDATE. Edges that would
+    collide on uq_relationship_key_fields with one the kept person already has, or that would
+    become self-relationships, are deleted first. Returns (moved rows, dropped rows), each
+    row carrying id, person1_id, person2_id and relationship_type.
+    """
+    other = aliased(Relationship)
+    duplicate_as_person1 = and_(Relationship.person1_id == merge_id, exists().where(
+        other.person1_id == keep_id, other.person2_id == Relationship.person2_id,
+        other.relationship_type == Relationship.relationship_type))
+    duplicate_as_person2 = and_(Relationship.person2_id == merge_id, exists().where(
+        other.person1_id == Relationship.person1_id, other.person2_id == keep_id,
+        other.relationship_type == Relationship.relationship_type))
+    between_the_pair = and_(Relationship.person1_id.in_([keep_id, merge_id]), Relationship.person2_id.in_([keep_id, merge_id]),
+                            or_(Relationship.person1_id == merge_id, Relationship.person2_id == merge_id))
+    dropped = db.execute(
+        delete(Relationship).where(or_(between_the_pair, duplicate_as_person1, duplicate_as_person2))
+        .returning(Relationship.id, Relationship.person1_id, Relationship.person2_id, Relationship.relationship_type)
+        .execution_options(synchronize_session=False)).all()
+    moved = db.execute(
+        update(Relationship).where(or_(Relationship.person1_id == merge_id, Relationship.person2_id == merge_id))
+        .values(person1_id=case((Relationship.person1_id == merge_id, keep_id), else_=Relationship.person1_id),
+                person2_id=case((Relationship.person2_id == merge_id, keep_id), else_=Relationship.person2_id),
+                updated_at=func.now())
+        .returning(Relationship.id, Relationship.person1_id, Relationship.person2_id, Relationship.relationship_type)
+        .execution_options(synchronize_session=False)).all()
+    return moved, dropped
+
+
+def _move_events(db: DBSession, keep_id: uuid.UUID, merge_id: uuid.UUID) -> List[uuid.UUID]:
+    """
+    Repoints principal and related event references and copies event_participants rows; returns
+    changed event ids. On events the kept person now leads, they are dropped from the related side.
+    """
+    principal_ids = db.execute(
+        update(Event).where(Event.person_id == merge_id).values(person_id=keep_id, updated_at=func.now())
+        .returning(Event.id).execution_options(synchronize_session=False)).scalars().all()
+    related_ids = db.execute(text(
+        "UPDATE events SET updated_at = now(), related_person_ids = ("
+        "  SELECT coalesce(jsonb_agg(DISTINCT mapped) FILTER (WHERE mapped IS DISTINCT FROM CAST(events.person_id AS text)), '[]'::jsonb)"
+        "  FROM (SELECT CASE WHEN pid = :merge_id THEN :keep_id ELSE pid END AS mapped"
+        "        FROM jsonb_array_elements_text(events.related_person_ids) AS pid) AS related)"
+        " WHERE related_person_ids @> jsonb_build_array(CAST(:merge_id AS text))"
+        "    OR (person_id = CAST(:keep_id AS uuid) AND related_person_ids @> jsonb_build_array(CAST(:keep_id AS text))) RETURNING id"),
+        {"merge_id": str(merge_id), "keep_id": str(keep_id)}).scalars().all()
+    participants = select(EventParticipant.event_id, literal(keep_id, EventParticipant.person_id.type), EventParticipant.role) \
+        .join(Event, Event.id == EventParticipant.event_id) \
+        .where(EventParticipant.person_id == merge_id,
+               or_(EventParticipant.role != "related", Event.person_id.is_distinct_from(keep_id)))
+    db.execute(pg_insert(EventParticipant).from_select(["event_id", "person_id", "role"], participants)
+               .on_conflict_do_nothing()) # The merged person's own rows go with the person's delete cascade
+    if principal_ids: # Events where the kept person was already a related participant
+        db.execute(delete(EventParticipant).where(EventParticipant.person_id == keep_id, EventParticipant.role == "related",
+                                                  EventParticipant.event_id.in_(principal_ids)))
+    return list(dict.fromkeys(list(principal_ids) + list(related_ids)))
+
+
+def _ensure_can_edit_trees_of(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID,
+                              actor_user_id: Optional[uuid.UUID]) -> None:
+    """
+    The merge deletes the duplicate from every tree it belongs to and adds the kept person to
+    them, so the actor needs edit access on all of those trees, not just the active one.
+    """
+    editable = or_(Tree.created_by == actor_user_id, exists().where(
+        TreeAccess.tree_id == Tree.id, TreeAccess.user_id == actor_user_id, TreeAccess.access_level.in_(("edit", "admin"))))
+    forbidden = db.execute(
+        select(PersonTreeAssociation.tree_id).join(Tree, Tree.id == PersonTreeAssociation.tree_id)
+        .where(PersonTreeAssociation.person_id == person_id, PersonTreeAssociation.tree_id != tree_id, ~editable)
+    ).scalars().all()
+    if forbidden:
+        logger.warning("Merge refused: duplicate belongs to trees the actor cannot edit.", person_id=person_id,
+                       actor_user_id=actor_user_id, tree_ids=[str(tid) for tid in forbidden])
+        abort(403, description={"message": "You need edit access to every tree the merged person belongs to.",
+                                "code": "ACCESS_DENIED_TREE", "tree_ids": [str(tid) for tid in forbidden]})
+
+
+def merge_people_db(db: DBSession, keep_id: uuid.UUID, merge_id: uuid.UUID, tree_id: uuid.UUID,
+                    actor_user_id: Optional[uuid.UUID] = None, ip_address: Optional[str] = None,
+                    user_agent: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Merges the duplicate `merge_id` into `keep_id` in one transaction and deletes it.
+    Relationships, events (principal, related and participants), media links and tree
+    memberships are rewritten with set-based statements, so the cost is a handful of
+    statements regardless of how connected either person is. The kept person's own
+    attributes are left unchanged; the merged person's full record goes to the audit entry.
+    The actor must be able to edit every tree the duplicate belongs to (403 otherwise).
+    """
+    logger.info("Merging people", keep_id=keep_id, merge_id=merge_id, tree_id=tree_id, actor_user_id=actor_user_id)
+    if keep_id == merge_id:
+        abort(400, description={"message": "Validation failed", "details": {"merge_person_id": "A person cannot be merged into itself."}})
+    try:
+        people = {person.id: person for person in db.query(Person)
+                  .join(PersonTreeAssociation, PersonTreeAssociation.person_id == Person.id)
+                  .filter(Person.id.in_([keep_id, merge_id]), PersonTreeAssociation.tree_id == tree_id)
+                  .with_for_update(of=Person).all()} # Serializes concurrent merges of either person
+        for person_id in (keep_id, merge_id):
+            if person_id not in people:
+                abort(404, description=f"Person with ID {person_id} not found in tree {tree_id}.")
+        _ensure_can_edit_trees_of(db, merge_id, tree_id, actor_user_id)
+        merged_state = people[merge_id].to_dict()
+
+        moved, dropped = _move_relationships(db, keep_id, merge_id)
+        event_ids = _move_events(db, keep_id, merge_id)
+        media_ids = db.execute(
+            update(MediaItem).where(MediaItem.linked_entity_type == "Person", MediaItem.linked_entity_id == merge_id)
+            .values(linked_entity_id=keep_id).returning(MediaItem.id).execution_options(synchronize_session=False)).scalars().all()
+        added_tree_ids = db.execute(
+            pg_insert(PersonTreeAssociation).from_select(
+                ["person_id", "tree_id"],
+                select(literal(keep_id, PersonTreeAssociation.person_id.type), PersonTreeAssociation.tree_id)
+                .where(PersonTreeAssociation.person_id == merge_id))
+            .on_conflict_do_nothing().returning(PersonTreeAssociation.tree_id)).scalars().all()
+
+        changes = [("person", keep_id, "upsert"), ("person", merge_id, "delete"), ("association", merge_id, "delete")]
+        if added_tree_ids:
+            changes.append(("association", keep_id, "upsert"))
+        bump_tree_versions(db, person_ids=[keep_id, merge_id], changes=(
+            changes
+            + [("relationship", row.id, "upsert") for row in moved]
+            + [("relationship", row.id, "delete") for row in dropped]
+            + [("event", eid, "upsert") for eid in event_ids]
+            + [("media", mid, "upsert") for mid in media_ids]
+        ))
+        db.execute(delete(Person).where(Person.id == merge_id).execution_options(synchronize_session=False))
+        db.expunge(people[merge_id])
+        forget_existence(Person, [merge_id]); forget_existence(Relationship, [row.id for row in dropped])
+        if config.INFERRED_SIBLINGS_ENABLED:
+            refresh_inferred_siblings(db, affected_children(
+                (row.person1_id, row.person2_id, row.relationship_type) for row in moved + dropped) | {keep_id})
+        db.commit()
+        summary = {"merged_person_id": str(merge_id), "relationships_moved": len(moved),
+                   "relationships_dropped": len(dropped), "events_moved": len(event_ids),
+                   "media_moved": len(media_ids), "trees_added": [str(tid) for tid in added_tree_ids]}
+        logger.info("People merged", keep_id=keep_id, **summary)
+
+        log_activity(db=db, actor_user_id=actor_user_id, action_type="MERGE_PERSON",
+                     entity_type="PERSON", entity_id=keep_id, tree_id=tree_id,
+                     previous_state=merged_state, new_state=summary, ip_address=ip_address, user_agent=user_agent)
+        db.refresh(people[keep_id])
+        return {"person": people[keep_id].to_dict(), "merge": summary}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, f"merging person {merge_id} into {keep_id}", db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("Unexpected error merging people.", keep_id=keep_id, merge_id=merge_id, exc_info=True)
+        abort(500, description="An unexpected error occurred while merging people.")
+    return {} # Should be unreachable
+
+
 def upload_profile_picture_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID, 
                               user_id: uuid.UUID, # user_id for auditing, consistency
                               file_stream, filename: str, content_type: str) -> Dict[str, Any]:
@@ -452,6 +711,7 @@ def upload_profile_picture_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid
                 # Non-critical error, so we don't abort the upload of the new picture
 
         person.profile_picture_url = object_key
+        bump_tree_versions(db, person_ids=[person.id], changes=[("person", person.id, "upsert")])
         db.commit()
         db.refresh(person)
         
@@ -1,24 +1,32 @@
 # backend/services/relationship_service.py
 import uuid
 import structlog
-from datetime import date
-from typing import Dict, Any, Optional
+from datetime import date, datetime
+from typing import Dict, Any, Optional, List, Tuple
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, exists, select, func, update, delete, case, cast, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from flask import abort
+from werkzeug.exceptions import HTTPException
 
-from models import Relationship, Person, RelationshipTypeEnum, PersonTreeAssociation # Added PersonTreeAssociation
-from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query
+from models import Relationship, Person, RelationshipTypeEnum, PersonTreeAssociation, Tree # Added PersonTreeAssociation
+from utils import (_get_or_404, _handle_sqlalchemy_error, paginate_query, sparse_load_options,
+                   _encode_keyset_cursor, _decode_keyset_cursor, ensure_exist, ensure_exists_or_404,
+                   forget_existence)
 import config as app_config_module
 # Import for get_relationships_for_tree_db
 from services.person_service import get_all_people_db as get_persons_in_tree_db
+from services.tree_version_service import bump_tree_versions, Change, TreeVersionCache
+from services.sibling_service import affected_children, refresh_inferred_siblings
 
 
 logger = structlog.get_logger(__name__)
 
-# For future use: Map of relationship types to their inverses.
-# Not used for automatic creation in the current implementation.
+_relationship_count_cache = TreeVersionCache(max_entries=1024)
+
+# Map of relationship types to their inverses. Used to materialize the reverse edge of every
+# relationship when RELATIONSHIP_MATERIALIZE_INVERSE is enabled (see materialize_inverse_relationships_db).
 INVERSE_RELATIONSHIP_MAP = {
     RelationshipTypeEnum.biological_parent: RelationshipTypeEnum.biological_child,
     RelationshipTypeEnum.adoptive_parent: RelationshipTypeEnum.adoptive_child,
@@ -41,32 +49,135 @@ INVERSE_RELATIONSHIP_MAP = {
 }
 
 
+_INVERSE_COPIED_FIELDS = ("start_date", "end_date", "certainty_level", "custom_attributes", "notes", "location")
+
+def inverse_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert rows for the inverse of each relationship row that has one (types mapped to None have no inverse)."""
+    now = datetime.utcnow()
+    inverses = []
+    for row in rows:
+        inverse_type = INVERSE_RELATIONSHIP_MAP.get(RelationshipTypeEnum(row["relationship_type"]))
+        if inverse_type is None:
+            continue
+        inverses.append({"id": uuid.uuid4(), "person1_id": row["person2_id"], "person2_id": row["person1_id"],
+                         "relationship_type": inverse_type, "created_by": row["created_by"],
+                         "created_at": now, "updated_at": now,
+                         **{field: row.get(field) for field in _INVERSE_COPIED_FIELDS}})
+    return inverses
+
+def upsert_relationship_rows(db: DBSession, rows: List[Dict[str, Any]]) -> List[uuid.UUID]:
+    """One INSERT ... ON CONFLICT ON CONSTRAINT uq_relationship_key_fields DO NOTHING; returns the ids actually inserted."""
+    if not rows:
+        return []
+    statement = pg_insert(Relationship).values(rows) \
+        .on_conflict_do_nothing(constraint="uq_relationship_key_fields").returning(Relationship.id)
+    return list(db.execute(statement).scalars())
+
+def _inverse_key(person1_id: uuid.UUID, person2_id: uuid.UUID, relationship_type: Any):
+    inverse_type = INVERSE_RELATIONSHIP_MAP.get(RelationshipTypeEnum(relationship_type))
+    if inverse_type is None:
+        return None
+    return and_(Relationship.person1_id == person2_id, Relationship.person2_id == person1_id,
+                Relationship.relationship_type == inverse_type)
+
+def _sync_inverse(db: DBSession, old_key: Tuple[uuid.UUID, uuid.UUID, Any], relationship: Relationship) -> List[Change]:
+    """
+    Moves the inverse of `old_key` onto the updated relationship (keeping its id), inserts it if it
+    was missing, or deletes it when the new type has no inverse. Returns the tree-change entries.
+    """
+    old_inverse = _inverse_key(*old_key)
+    new_type = INVERSE_RELATIONSHIP_MAP.get(RelationshipTypeEnum(relationship.relationship_type))
+    if new_type is None:
+        if old_inverse is None:
+            return []
+        deleted = db.execute(delete(Relationship).where(old_inverse).returning(Relationship.id)).scalars()
+        return [("relationship", rid, "delete") for rid in deleted]
+    values = {"person1_id": relationship.person2_id, "person2_id": relationship.person1_id,
+              "relationship_type": new_type, "updated_at": datetime.utcnow(),
+              **{field: getattr(relationship, field) for field in _INVERSE_COPIED_FIELDS}}
+    updated = list(db.execute(update(Relationship).where(old_inverse).values(**values)
+                              .returning(Relationship.id)).scalars()) if old_inverse is not None else []
+    if not updated:
+        row = {"person1_id": relationship.person1_id, "person2_id": relationship.person2_id,
+               "relationship_type": relationship.relationship_type, "created_by": relationship.created_by,
+               **{field: getattr(relationship, field) for field in _INVERSE_COPIED_FIELDS}}
+        updated = upsert_relationship_rows(db, inverse_rows([row]))
+    return [("relationship", rid, "upsert") for rid in updated]
+
+def _refresh_siblings(db: DBSession, *edges: Tuple[uuid.UUID, uuid.UUID, Any]) -> None:
+    """Keeps inferred_siblings in step with parent-edge writes, inside the caller's transaction."""
+    if app_config_module.config.INFERRED_SIBLINGS_ENABLED:
+        refresh_inferred_siblings(db, affected_children(edges))
+
+def _in_tree(person_id_column, tree_id: uuid.UUID):
+    return exists().where(PersonTreeAssociation.tree_id == tree_id, PersonTreeAssociation.person_id == person_id_column)
+
+def tree_relationships_filter(tree_id: uuid.UUID):
+    """Relationships whose endpoints are both in the tree: two semi-joins on person_tree_association(tree_id, person_id)."""
+    return and_(_in_tree(Relationship.person1_id, tree_id), _in_tree(Relationship.person2_id, tree_id))
+
+def _count_tree_relationships(db: DBSession, tree_id: uuid.UUID) -> int:
+    version = db.query(Tree.version).filter(Tree.id == tree_id).scalar()
+    return _relationship_count_cache.get_or_build(tree_id, version, lambda: db.execute(
+        select(func.count()).select_from(Relationship).where(tree_relationships_filter(tree_id))).scalar())
+
 def get_all_relationships_db(db: DBSession,
                                tree_id: uuid.UUID,
                                page: int = -1, per_page: int = -1,
                                sort_by: Optional[str] = "created_at",
                                sort_order: Optional[str] = "desc",
-                               filters: Optional[Dict[str, Any]] = None
+                               filters: Optional[Dict[str, Any]] = None,
+                               fields: Optional[List[str]] = None,
+                               after: Optional[str] = None
                                ) -> Dict[str, Any]:
+    """
+    Lists the tree's relationships. With `after` (empty string for the first page) it uses keyset
+    pagination on (created_at, id) descending and returns `next_cursor`; otherwise page/per_page.
+    The unfiltered total is cached per tree version.
+    """
     cfg_pagination = app_config_module.config.PAGINATION_DEFAULTS
     if page == -1: page = cfg_pagination["page"]
     if per_page == -1: per_page = cfg_pagination["per_page"]
 
-    logger.info("Fetching relationships for tree", tree_id=tree_id, page=page, per_page=per_page, filters=filters)
+    logger.info("Fetching relationships for tree", tree_id=tree_id, page=page, per_page=per_page, filters=filters,
+                keyset=after is not None)
     try:
-        query = db.query(Relationship).filter(Relationship.tree_id == tree_id)
+        query = db.query(Relationship).filter(tree_relationships_filter(tree_id))
+        filtered = False
         if filters:
             if 'person_id' in filters and filters['person_id']:
                 try: person_uuid = uuid.UUID(str(filters['person_id']))
                 except ValueError: abort(400, "Invalid person_id format for filter.")
                 query = query.filter(or_(Relationship.person1_id == person_uuid, Relationship.person2_id == person_uuid))
+                filtered = True
             if 'relationship_type' in filters and filters['relationship_type']:
-                try: query = query.filter(Relationship.relationship_type == RelationshipTypeEnum(str(filters['relationship_type'])))
+                try:
+                    query = query.filter(Relationship.relationship_type == RelationshipTypeEnum(str(filters['relationship_type'])))
+                    filtered = True
                 except ValueError: logger.warning(f"Invalid relationship_type filter: {filters['relationship_type']}. Ignoring.")
+        total_items = None if filtered else _count_tree_relationships(db, tree_id)
+        query = query.options(*sparse_load_options(Relationship, fields))
+
+        if after is not None:
+            per_page = min(abs(per_page), cfg_pagination["max_per_page"])
+            if after:
+                after_created_at, after_id = _decode_keyset_cursor(after)
+                query = query.filter(or_(Relationship.created_at < after_created_at,
+                                         and_(Relationship.created_at == after_created_at, Relationship.id < after_id)))
+            rows = query.order_by(Relationship.created_at.desc(), Relationship.id.desc()).limit(per_page + 1).all()
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+            return {
+                "items": [row.to_dict(fields=fields) if fields else row.to_dict() for row in rows],
+                "per_page": per_page, "total_items": total_items, "has_next": has_next,
+                "next_cursor": _encode_keyset_cursor(rows[-1].created_at, rows[-1].id) if has_next else None,
+            }
+
         if not hasattr(Relationship, sort_by or ""):
             logger.warning(f"Invalid sort_by '{sort_by}' for Relationship. Defaulting to 'created_at'.")
             sort_by = "created_at"
-        return paginate_query(query, Relationship, page, per_page, cfg_pagination["max_per_page"], sort_by, sort_order)
+        return paginate_query(query, Relationship, page, per_page, cfg_pagination["max_per_page"], sort_by, sort_order,
+                              fields=fields, total_items=total_items)
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, f"fetching relationships for tree {tree_id}", db)
     except HTTPException: raise
     except Exception as e:
@@ -74,10 +185,12 @@ def get_all_relationships_db(db: DBSession,
         abort(500, "Error fetching relationships.")
     return {}
 
-def get_relationship_db(db: DBSession, relationship_id: uuid.UUID, tree_id: uuid.UUID) -> Dict[str, Any]:
+def get_relationship_db(db: DBSession, relationship_id: uuid.UUID, tree_id: Optional[uuid.UUID] = None,
+                        fields: Optional[List[str]] = None) -> Dict[str, Any]:
     logger.info("Fetching relationship", relationship_id=relationship_id) # Removed tree_id from log
-    relationship = _get_or_404(db, Relationship, relationship_id) # Fetch globally
-    return relationship.to_dict()
+    relationship = _get_or_404(db, Relationship, relationship_id,
+                               options=sparse_load_options(Relationship, fields)) # Fetch globally
+    return relationship.to_dict(fields=fields) if fields else relationship.to_dict()
 
 def create_relationship_db(db: DBSession, user_id: uuid.UUID, rel_data: Dict[str, Any]) -> Dict[str, Any]:
     # Removed tree_id from parameters
@@ -94,7 +207,9 @@ def create_relationship_db(db: DBSession, user_id: uuid.UUID, rel_data: Dict[str
         relationship_type = RelationshipTypeEnum(rel_type_str)
     except ValueError as e: abort(400, f"Invalid input format: {e}")
     # Validate persons globally
-    _get_or_404(db, Person, person1_id); _get_or_404(db, Person, person2_id)
+    existing = ensure_exist(db, Person, [person1_id, person2_id])
+    for person_id in (person1_id, person2_id):
+        if person_id not in existing: abort(404, description=f"Person with ID {person_id} not found")
     start_date, end_date = None, None
     if rel_data.get('start_date'):
         try: start_date = date.fromisoformat(rel_data['start_date'])
@@ -104,14 +219,22 @@ def create_relationship_db(db: DBSession, user_id: uuid.UUID, rel_data: Dict[str
         except ValueError: abort(400, {"message": "Validation failed", "details": {"end_date": "Invalid date format."}})
     if start_date and end_date and end_date < start_date: abort(400, {"message": "Validation failed", "details": {"date_comparison": "End date before start."}})
     try:
+        if app_config_module.config.RELATIONSHIP_MATERIALIZE_INVERSE:
+            return _create_relationship_with_inverse(db, user_id, rel_data, person1_id, person2_id, relationship_type,
+                                                     start_date, end_date)
         new_rel = Relationship( # tree_id removed
             created_by=user_id, person1_id=person1_id, person2_id=person2_id,
             relationship_type=relationship_type, start_date=start_date, end_date=end_date,
             certainty_level=rel_data.get('certainty_level'), custom_attributes=rel_data.get('custom_attributes', {}),
             notes=rel_data.get('notes'), location=rel_data.get('location'))
-        db.add(new_rel); db.commit(); db.refresh(new_rel)
+        db.add(new_rel)
+        db.flush() # Assigns new_rel.id for the change journal
+        bump_tree_versions(db, person_ids=[person1_id, person2_id], changes=[("relationship", new_rel.id, "upsert")])
+        _refresh_siblings(db, (person1_id, person2_id, relationship_type))
+        db.commit(); db.refresh(new_rel)
         logger.info("Relationship created.", rel_id=new_rel.id) # Removed tree_id from log
         return new_rel.to_dict()
+    except HTTPException: raise
     except IntegrityError as e: _handle_sqlalchemy_error(e, "creating relationship (integrity)", db)
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, "creating relationship", db)
     except Exception as e:
@@ -119,10 +242,33 @@ def create_relationship_db(db: DBSession, user_id: uuid.UUID, rel_data: Dict[str
         abort(500, "Error creating relationship.")
     return {}
 
+def _create_relationship_with_inverse(db: DBSession, user_id: uuid.UUID, rel_data: Dict[str, Any],
+                                      person1_id: uuid.UUID, person2_id: uuid.UUID, relationship_type: RelationshipTypeEnum,
+                                      start_date: Optional[date], end_date: Optional[date]) -> Dict[str, Any]:
+    """Inserts the edge and its inverse in one statement; only the requested edge may already exist to fail with 409."""
+    now = datetime.utcnow()
+    row = {"id": uuid.uuid4(), "created_by": user_id, "person1_id": person1_id, "person2_id": person2_id,
+           "relationship_type": relationship_type, "start_date": start_date, "end_date": end_date,
+           "certainty_level": rel_data.get('certainty_level'), "custom_attributes": rel_data.get('custom_attributes', {}),
+           "notes": rel_data.get('notes'), "location": rel_data.get('location'), "created_at": now, "updated_at": now}
+    inserted = upsert_relationship_rows(db, [row] + inverse_rows([row]))
+    if row["id"] not in inserted:
+        db.rollback()
+        abort(409, description="This relationship already exists.")
+    bump_tree_versions(db, person_ids=[person1_id, person2_id],
+                       changes=[("relationship", rid, "upsert") for rid in inserted])
+    _refresh_siblings(db, (person1_id, person2_id, relationship_type))
+    db.commit()
+    new_rel = db.get(Relationship, row["id"])
+    logger.info("Relationship created with inverse.", rel_id=new_rel.id, inverse_created=len(inserted) > 1)
+    return new_rel.to_dict()
+
 def update_relationship_db(db: DBSession, relationship_id: uuid.UUID, rel_data: Dict[str, Any]) -> Dict[str, Any]:
     # Removed tree_id from parameters
     logger.info("Updating relationship", rel_id=relationship_id, data_keys=list(rel_data.keys()))
     relationship = _get_or_404(db, Relationship, relationship_id) # Fetch globally
+    previous_person_ids = [relationship.person1_id, relationship.person2_id]
+    previous_key = (relationship.person1_id, relationship.person2_id, relationship.relationship_type)
     # Authorization to update a relationship would typically depend on user's rights to edit EITHER person involved,
     # or specific rights to the relationship type, or admin rights. This is not handled here yet.
 
@@ -133,7 +279,7 @@ def update_relationship_db(db: DBSession, relationship_id: uuid.UUID, rel_data:
         try:
             if field in ['person1_id', 'person2_id']:
                 person_uuid = uuid.UUID(str(value)) if value else None
-                if person_uuid: _get_or_404(db, Person, person_uuid) # Validate globally
+                if person_uuid: ensure_exists_or_404(db, Person, person_uuid) # Validate globally
                 setattr(relationship, field, person_uuid)
             elif field == 'relationship_type': setattr(relationship, field, RelationshipTypeEnum(value) if value else None)
             elif field in ['start_date', 'end_date']: setattr(relationship, field, date.fromisoformat(str(value)) if value else None)
@@ -153,8 +299,14 @@ def update_relationship_db(db: DBSession, relationship_id: uuid.UUID, rel_data:
     if relationship.start_date and relationship.end_date and relationship.end_date < relationship.start_date:
         abort(400, "End date cannot be before start date.")
     try:
+        changes = [("relationship", relationship.id, "upsert")]
+        if app_config_module.config.RELATIONSHIP_MATERIALIZE_INVERSE:
+            changes += _sync_inverse(db, previous_key, relationship)
+        bump_tree_versions(db, person_ids=previous_person_ids + [relationship.person1_id, relationship.person2_id],
+                           changes=changes)
+        _refresh_siblings(db, previous_key, (relationship.person1_id, relationship.person2_id, relationship.relationship_type))
         db.commit(); db.refresh(relationship)
-        logger.info("Relationship updated.", rel_id=relationship.id, tree_id=tree_id)
+        logger.info("Relationship updated.", rel_id=relationship.id)
         return relationship.to_dict()
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, f"updating relationship {relationship_id}", db)
     except Exception as e:
@@ -177,7 +329,7 @@ def get_relationships_for_person_db(db: DBSession,
     logger.info("Fetching all relationships for person", person_id=person_id, page=page, per_page=per_page, filters=filters)
     
     # Ensure person exists globally
-    _get_or_404(db, Person, person_id)
+    ensure_exists_or_404(db, Person, person_id)
 
     try:
         query = db.query(Relationship).filter(
@@ -196,7 +348,7 @@ def get_relationships_for_person_db(db: DBSession,
                 try:
                     other_person_uuid = uuid.UUID(str(filters['other_person_id']))
                     # Ensure this other person also exists globally
-                    _get_or_404(db, Person, other_person_uuid)
+                    ensure_exists_or_404(db, Person, other_person_uuid)
                     query = query.filter(
                         or_(
                             (Relationship.person1_id == person_id) & (Relationship.person2_id == other_person_uuid),
@@ -217,7 +369,7 @@ def get_relationships_for_person_db(db: DBSession,
         return paginate_query(query, Relationship, page, per_page, cfg_pagination["max_per_page"], sort_by, sort_order)
     except SQLAlchemyError as e:
         _handle_sqlalchemy_error(e, f"fetching relationships for person {person_id}", db)
-    except HTTPException: # Re-raise aborts (e.g. from _get_or_404 if other_person_id not found)
+    except HTTPException: # Re-raise aborts (e.g. from ensure_exists_or_404 if other_person_id not found)
         raise
     except Exception as e:
         logger.error("Unexpected error fetching relationships for person.", person_id=person_id, exc_info=True)
@@ -231,7 +383,16 @@ def delete_relationship_db(db: DBSession, relationship_id: uuid.UUID) -> bool:
     # Authorization to delete a relationship would be similar to updating.
 
     try:
-        db.delete(relationship); db.commit()
+        changes = [("relationship", relationship.id, "delete")]
+        inverse_key = _inverse_key(relationship.person1_id, relationship.person2_id, relationship.relationship_type)
+        if app_config_module.config.RELATIONSHIP_MATERIALIZE_INVERSE and inverse_key is not None:
+            deleted = db.execute(delete(Relationship).where(inverse_key).returning(Relationship.id)).scalars()
+            changes += [("relationship", rid, "delete") for rid in deleted]
+        bump_tree_versions(db, person_ids=[relationship.person1_id, relationship.person2_id], changes=changes)
+        db.delete(relationship)
+        forget_existence(Relationship, [rid for _, rid, _ in changes])
+        _refresh_siblings(db, (relationship.person1_id, relationship.person2_id, relationship.relationship_type))
+        db.commit()
         logger.info("Relationship deleted.", rel_id=relationship_id) # Removed tree_id from log
         return True
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, f"deleting relationship {relationship_id}", db)
@@ -239,3 +400,53 @@ def delete_relationship_db(db: DBSession, relationship_id: uuid.UUID) -> bool:
         db.rollback(); logger.error("Unexpected error deleting relationship.", rel_id=relationship_id, exc_info=True)
         abort(500, "Error deleting relationship.")
     return False
+
+
+def materialize_inverse_relationships_db(db: DBSession, tree_id: Optional[uuid.UUID] = None,
+                                         batch_size: Optional[int] = None) -> int:
+    """
+    Backfills the missing inverse of every relationship (only those inside `tree_id` when given).
+    Source ids are walked in keyset batches; each batch is one INSERT ... SELECT ... ON CONFLICT
+    DO NOTHING committed together with its tree-version bump, so the job can be stopped and rerun.
+    Returns the number of inverse edges created.
+    """
+    batch_size = batch_size or app_config_module.config.RELATIONSHIP_BACKFILL_BATCH_SIZE
+    inverse_types = {source: target for source, target in INVERSE_RELATIONSHIP_MAP.items() if target is not None}
+    inverse_type = case(*[(Relationship.relationship_type == source, cast(literal(target.value), Relationship.relationship_type.type))
+                          for source, target in inverse_types.items()])
+    conditions = [Relationship.relationship_type.in_(list(inverse_types))]
+    if tree_id is not None:
+        conditions.append(tree_relationships_filter(tree_id))
+    columns = ["id", "person1_id", "person2_id", "relationship_type", *_INVERSE_COPIED_FIELDS, "created_by",
+               "created_at", "updated_at"]
+    created, after = 0, None
+    logger.info("Materializing inverse relationships", tree_id=tree_id, batch_size=batch_size)
+    while True:
+        id_query = select(Relationship.id).where(*conditions)
+        if after is not None:
+            id_query = id_query.where(Relationship.id > after)
+        batch_ids = list(db.execute(id_query.order_by(Relationship.id).limit(batch_size)).scalars())
+        if not batch_ids:
+            break
+        after = batch_ids[-1]
+        now = literal(datetime.utcnow(), Relationship.created_at.type)
+        source = select(func.gen_random_uuid(), Relationship.person2_id, Relationship.person1_id, inverse_type,
+                        *[getattr(Relationship, field) for field in _INVERSE_COPIED_FIELDS],
+                        Relationship.created_by, now, now).where(Relationship.id.in_(batch_ids))
+        statement = pg_insert(Relationship).from_select(columns, source) \
+            .on_conflict_do_nothing(constraint="uq_relationship_key_fields") \
+            .returning(Relationship.id, Relationship.person1_id, Relationship.person2_id)
+        try:
+            inserted = db.execute(statement).all()
+            if inserted:
+                bump_tree_versions(db, person_ids={pid for row in inserted for pid in (row.person1_id, row.person2_id)},
+                                   changes=[("relationship", row.id, "upsert") for row in inserted])
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.error("Inverse relationship backfill batch failed.", tree_id=tree_id, after=after, exc_info=True)
+            raise
+        created += len(inserted)
+        logger.info("Inverse relationship backfill batch committed.", tree_id=tree_id, scanned=len(batch_ids),
+                    created=len(inserted))
+    return created
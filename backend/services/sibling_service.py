@@ -0,0 +1,167 @@
+# backend/services/sibling_service.py
+"""
+Inferred siblings: pairs of people who share a biological or step parent, derived from
+parent/child Relationship rows and stored in `inferred_siblings` (both directions), so a
+person's siblings are one primary-key lookup instead of a self-join over parent edges.
+
+Classification per pair: two or more shared biological parents make full siblings, exactly
+one makes half siblings, and a pair linked only through a step parent is step siblings.
+Derivation is one grouped INSERT ... SELECT per batch; nothing is decrypted or loaded
+into Python besides ids.
+"""
+import uuid
+import structlog
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import and_, case, cast, delete, distinct, func, literal, or_, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as DBSession
+from flask import abort
+from werkzeug.exceptions import HTTPException
+
+from config import config
+from models import InferredSibling, Person, PersonTreeAssociation, Relationship, RelationshipTypeEnum
+from utils import _handle_sqlalchemy_error
+
+logger = structlog.get_logger(__name__)
+
+# Parent edges siblings are derived from. *_parent edges point parent -> child, *_child edges child -> parent.
+_DOWNWARD_TYPES = (RelationshipTypeEnum.biological_parent, RelationshipTypeEnum.step_parent)
+_UPWARD_TYPES = (RelationshipTypeEnum.biological_child, RelationshipTypeEnum.step_child)
+SIBLING_SOURCE_TYPES = _DOWNWARD_TYPES + _UPWARD_TYPES
+
+
+def affected_children(edges: Iterable[Tuple[uuid.UUID, uuid.UUID, Any]]) -> Set[uuid.UUID]:
+    """The children whose sibling sets change when the (person1_id, person2_id, type) edges are written or removed."""
+    children = set()
+    for person1_id, person2_id, relationship_type in edges:
+        relationship_type = RelationshipTypeEnum(relationship_type)
+        if relationship_type in _DOWNWARD_TYPES:
+            children.add(person2_id)
+        elif relationship_type in _UPWARD_TYPES:
+            children.add(person1_id)
+    return children
+
+
+def _parent_edges(child_filter=None, parent_filter=None):
+    """(child_id, parent_id, biological) per distinct pair, from edges recorded in either direction."""
+    def _branch(child_column, parent_column, types, biological_type):
+        branch = select(child_column.label("child_id"), parent_column.label("parent_id"),
+                        (Relationship.relationship_type == biological_type).label("biological")) \
+            .where(Relationship.relationship_type.in_(types), child_column != parent_column)
+        if child_filter is not None:
+            branch = branch.where(child_column.in_(child_filter))
+        if parent_filter is not None:
+            branch = branch.where(parent_column.in_(parent_filter))
+        return branch
+    edges = union_all(
+        _branch(Relationship.person2_id, Relationship.person1_id, _DOWNWARD_TYPES, RelationshipTypeEnum.biological_parent),
+        _branch(Relationship.person1_id, Relationship.person2_id, _UPWARD_TYPES, RelationshipTypeEnum.biological_child),
+    ).subquery("parent_edges")
+    return select(edges.c.child_id, edges.c.parent_id, func.bool_or(edges.c.biological).label("biological")) \
+        .group_by(edges.c.child_id, edges.c.parent_id)
+
+
+def _sibling_type(value: RelationshipTypeEnum):
+    return cast(literal(value.value), InferredSibling.sibling_type.type)
+
+
+def refresh_inferred_siblings(db: DBSession, child_ids: Iterable[uuid.UUID]) -> int:
+    """
+    Recomputes every inferred pair involving `child_ids` inside the caller's transaction
+    (no commit): their old rows are deleted and the pairs re-derived from the current
+    parent edges of their parents. Returns the number of rows written.
+    """
+    child_ids = {cid for cid in child_ids if cid}
+    if not child_ids:
+        return 0
+    db.flush() # Pending relationship writes must be visible to the derivation
+    parent_ids = list(db.execute(select(distinct(_parent_edges(child_filter=child_ids).subquery().c.parent_id))).scalars())
+    db.execute(delete(InferredSibling).where(or_(InferredSibling.person_id.in_(child_ids),
+                                                 InferredSibling.sibling_id.in_(child_ids)))
+               .execution_options(synchronize_session=False))
+    if not parent_ids:
+        return 0
+
+    parents = _parent_edges(parent_filter=parent_ids).cte("parents")
+    a, b = parents.alias("a"), parents.alias("b")
+    shared_biological = func.count(distinct(a.c.parent_id)).filter(and_(a.c.biological, b.c.biological))
+    sibling_type = case((shared_biological >= 2, _sibling_type(RelationshipTypeEnum.sibling_full)),
+                        (shared_biological == 1, _sibling_type(RelationshipTypeEnum.sibling_half)),
+                        else_=_sibling_type(RelationshipTypeEnum.sibling_step))
+    pairs = select(a.c.child_id, b.c.child_id, sibling_type, func.jsonb_agg(distinct(a.c.parent_id)),
+                   literal(datetime.utcnow(), InferredSibling.computed_at.type)) \
+        .select_from(a.join(b, and_(a.c.parent_id == b.c.parent_id, a.c.child_id != b.c.child_id))) \
+        .where(or_(a.c.child_id.in_(child_ids), b.c.child_id.in_(child_ids))) \
+        .group_by(a.c.child_id, b.c.child_id)
+    statement = pg_insert(InferredSibling).from_select(
+        ["person_id", "sibling_id", "sibling_type", "shared_parent_ids", "computed_at"], pairs)
+    statement = statement.on_conflict_do_update(
+        index_elements=[InferredSibling.person_id, InferredSibling.sibling_id],
+        set_={"sibling_type": statement.excluded.sibling_type, "shared_parent_ids": statement.excluded.shared_parent_ids,
+              "computed_at": statement.excluded.computed_at}) # A concurrent refresh of an overlapping family
+    written = db.execute(statement).rowcount
+    logger.debug("Refreshed inferred siblings.", children=len(child_ids), parents=len(parent_ids), rows=written)
+    return written
+
+
+def rebuild_inferred_siblings_db(db: DBSession, tree_id: Optional[uuid.UUID] = None,
+                                 batch_size: Optional[int] = None) -> int:
+    """
+    Re-derives inferred siblings for every person (only the members of `tree_id` when given),
+    walking person ids in keyset batches and committing per batch so the job can be rerun.
+    Returns the number of rows written.
+    """
+    batch_size = batch_size or config.INFERRED_SIBLINGS_BATCH_SIZE
+    id_column = PersonTreeAssociation.person_id if tree_id is not None else Person.id
+    written, after = 0, None
+    logger.info("Rebuilding inferred siblings", tree_id=tree_id, batch_size=batch_size)
+    while True:
+        id_query = select(id_column)
+        if tree_id is not None:
+            id_query = id_query.where(PersonTreeAssociation.tree_id == tree_id)
+        if after is not None:
+            id_query = id_query.where(id_column > after)
+        batch_ids = list(db.execute(id_query.order_by(id_column).limit(batch_size)).scalars())
+        if not batch_ids:
+            break
+        after = batch_ids[-1]
+        try:
+            written += refresh_inferred_siblings(db, batch_ids)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.error("Inferred sibling rebuild batch failed.", tree_id=tree_id, after=after, exc_info=True)
+            raise
+    logger.info("Rebuilt inferred siblings.", tree_id=tree_id, rows=written)
+    return written
+
+
+def get_inferred_siblings_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID) -> Dict[str, Any]:
+    """
+    Returns the inferred siblings of a member of `tree_id`, full siblings first. Pairs are
+    derived across all trees, so siblings outside `tree_id` are filtered out here.
+    """
+    association = db.query(PersonTreeAssociation).filter_by(person_id=person_id, tree_id=tree_id).one_or_none()
+    if not association:
+        logger.warning("Person-tree association not found for siblings.", person_id=person_id, tree_id=tree_id)
+        abort(404, description=f"Person with ID {person_id} not found in tree {tree_id}.")
+    try:
+        order = case((InferredSibling.sibling_type == RelationshipTypeEnum.sibling_full, 0),
+                     (InferredSibling.sibling_type == RelationshipTypeEnum.sibling_half, 1), else_=2)
+        rows = db.query(InferredSibling) \
+            .join(PersonTreeAssociation, and_(PersonTreeAssociation.person_id == InferredSibling.sibling_id,
+                                              PersonTreeAssociation.tree_id == tree_id)) \
+            .filter(InferredSibling.person_id == person_id) \
+            .order_by(order, InferredSibling.sibling_id).all()
+        return {"person_id": str(person_id), "items": [row.to_dict() for row in rows]}
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, f"fetching inferred siblings for person {person_id}", db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Unexpected error fetching inferred siblings.", person_id=person_id, exc_info=True)
+        abort(500, "Error fetching siblings.")
+    return {} # Should be unreachable
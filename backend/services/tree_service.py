@@ -1,10 +1,11 @@
 # backend/services/tree_service.py
 import uuid
+import json
 import structlog
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterator
 from sqlalchemy.orm import Session as DBSession
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy import or_
+from sqlalchemy import or_, exists
 import os
 from flask import abort
 from werkzeug.utils import secure_filename
@@ -12,12 +13,15 @@ from flask import abort # Ensure abort is imported if used in user fetching
 # from botocore.exceptions import S3UploadFailedError, ClientError
 
 
-from models import Tree, TreeAccess, Person, Relationship, PrivacyLevelEnum, TreePrivacySettingEnum, User, UserRole, PersonTreeAssociation, Event # Added User, UserRole, PersonTreeAssociation, Event
-from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query
+from models import Tree, TreeAccess, Person, Relationship, PrivacyLevelEnum, TreePrivacySettingEnum, User, UserRole, PersonTreeAssociation, Event, EventParticipant # Added User, UserRole, PersonTreeAssociation, Event
+from utils import _get_or_404, _handle_sqlalchemy_error, paginate_query, ensure_exists_or_404
 from config import config # Direct import of the config instance
 # import config as app_config_module # Keep this if used by get_user_trees_db's cfg_pagination
 from storage_client import get_storage_client, create_bucket_if_not_exists
 from services.person_service import get_all_people_db as get_persons_in_tree_db # For fetching persons in a tree
+from services.relationship_service import tree_relationships_filter
+from services.tree_version_service import bump_tree_versions
+import permission_cache
 
 
 logger = structlog.get_logger(__name__)
@@ -50,6 +54,7 @@ def create_tree_db(db: DBSession, user_id: uuid.UUID, tree_data: Dict[str, Any])
         db.add(new_tree); db.flush() # Flush to get new_tree.id for TreeAccess
         tree_access = TreeAccess(tree_id=new_tree.id, user_id=user_id, access_level='admin', granted_by=user_id)
         db.add(tree_access); db.commit(); db.refresh(new_tree) # Commit all changes
+        permission_cache.invalidate_tree_access(new_tree.id, user_id)
         logger.info("Tree created with owner access.", tree_id=new_tree.id, created_by=user_id)
         return new_tree.to_dict()
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, "creating tree", db)
@@ -129,7 +134,10 @@ def update_tree_db(db: DBSession, tree_id: uuid.UUID, tree_data: Dict[str, Any])
         if validation_errors:
             abort(400, description={"message": "Validation failed", "details": validation_errors})
 
+        bump_tree_versions(db, tree_ids=[tree.id], changes=[("tree", tree.id, "upsert")])
         db.commit(); db.refresh(tree)
+        if 'privacy_setting' in tree_data:
+            permission_cache.invalidate_tree(tree.id)
         logger.info("Tree updated.", tree_id=tree.id)
         return tree.to_dict()
     # Removed specific ValueError for default_privacy_level, handled by common validation_errors
@@ -146,6 +154,7 @@ def delete_tree_db(db: DBSession, tree_id: uuid.UUID) -> None:
     tree = _get_or_404(db, Tree, tree_id)
     try:
         db.delete(tree); db.commit()
+        permission_cache.invalidate_tree(tree_id)
         logger.info("Tree deleted.", tree_id=tree_id)
     except IntegrityError as ie:
         db.rollback(); logger.error(f"Integrity error deleting tree {tree_id}.", exc_info=True)
@@ -157,7 +166,7 @@ def delete_tree_db(db: DBSession, tree_id: uuid.UUID) -> None:
 
 def get_tree_data_for_visualization_db(db: DBSession, tree_id: uuid.UUID, page: int, per_page: int = None, sort_by: str = "created_at", sort_order: str = "asc") -> Dict[str, Any]:
     logger.info("Fetching paginated tree data for visualization", tree_id=tree_id, page=page, per_page=per_page)
-    _get_or_404(db, Tree, tree_id)  # Ensure tree exists
+    ensure_exists_or_404(db, Tree, tree_id)  # Ensure tree exists
 
     try:
         # 1. Paginate persons associated with this tree_id
@@ -275,6 +284,71 @@ def get_tree_data_for_visualization_db(db: DBSession, tree_id: uuid.UUID, page:
         abort(500, "Error fetching paginated tree data for visualization.")
     return {} # Should be unreachable
 
+# --- Streaming export ---
+
+def _tree_people_query(db: DBSession, tree_id: uuid.UUID):
+    return db.query(Person).join(PersonTreeAssociation, Person.id == PersonTreeAssociation.person_id)\
+        .filter(PersonTreeAssociation.tree_id == tree_id)
+
+def _tree_relationships_query(db: DBSession, tree_id: uuid.UUID):
+    """Relationships whose two endpoints are both members of the tree."""
+    return db.query(Relationship).filter(tree_relationships_filter(tree_id))
+
+def _tree_events_query(db: DBSession, tree_id: uuid.UUID):
+    """Events whose primary or related person is a member of the tree (semi-join through event_participants)."""
+    participant_in_tree = exists().where(EventParticipant.event_id == Event.id,
+                                         PersonTreeAssociation.person_id == EventParticipant.person_id,
+                                         PersonTreeAssociation.tree_id == tree_id)
+    return db.query(Event).filter(participant_in_tree)
+
+def export_tree_ndjson_db(db: DBSession, tree_id: uuid.UUID, batch_size: Optional[int] = None) -> Iterator[str]:
+    """
+    Returns a generator streaming the whole tree as NDJSON: one {"type", "data"} line per
+    tree, person, relationship and event, followed by an "end" line with counts.
+
+    Rows are read through server-side cursors (yield_per) and decrypted/serialized one
+    batch at a time, so memory stays flat regardless of tree size. The tree is validated
+    eagerly so a missing tree still produces a normal 404 before streaming starts.
+    """
+    batch_size = batch_size or config.EXPORT_STREAM_BATCH_SIZE
+    tree = _get_or_404(db, Tree, tree_id)
+    tree_dict = tree.to_dict()
+    logger.info("Starting NDJSON export of tree", tree_id=tree_id, batch_size=batch_size)
+
+    def _line(record_type: str, data: Dict[str, Any]) -> str:
+        return json.dumps({"type": record_type, "data": data}, separators=(",", ":")) + "\n"
+
+    def _generate() -> Iterator[str]:
+        counts = {"person": 0, "relationship": 0, "event": 0}
+        yield _line("tree", tree_dict)
+        try:
+            sections = (
+                ("person", _tree_people_query(db, tree_id).order_by(Person.id)),
+                ("relationship", _tree_relationships_query(db, tree_id).order_by(Relationship.id)),
+                ("event", _tree_events_query(db, tree_id).order_by(Event.id)),
+            )
+            for record_type, query in sections:
+                chunk = []
+                for obj in query.yield_per(batch_size):
+                    chunk.append(_line(record_type, obj.to_dict()))
+                    if len(chunk) >= batch_size:
+                        counts[record_type] += len(chunk)
+                        yield "".join(chunk)
+                        chunk = []
+                if chunk:
+                    counts[record_type] += len(chunk)
+                    yield "".join(chunk)
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in-band instead of via abort().
+            db.rollback()
+            logger.error("NDJSON export of tree failed mid-stream.", tree_id=tree_id, counts=counts, exc_info=True)
+            yield json.dumps({"type": "error", "data": {"message": "Export aborted due to a server error."}}) + "\n"
+            return
+        logger.info("NDJSON export of tree completed.", tree_id=tree_id, counts=counts)
+        yield json.dumps({"type": "end", "data": {"counts": counts}}) + "\n"
+
+    return _generate()
+
 # --- New functions for Person-Tree association ---
 
 def add_person_to_tree_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUID, current_user_id: uuid.UUID) -> Dict[str, Any]:
@@ -291,7 +365,7 @@ def add_person_to_tree_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUI
             abort(403, description="You are not authorized to add people to this tree.")
 
     # Check if person exists (globally)
-    _get_or_404(db, Person, person_id)
+    ensure_exists_or_404(db, Person, person_id)
 
     # Check if association already exists
     existing_association = db.query(PersonTreeAssociation).filter_by(person_id=person_id, tree_id=tree_id).one_or_none()
@@ -303,6 +377,7 @@ def add_person_to_tree_db(db: DBSession, person_id: uuid.UUID, tree_id: uuid.UUI
     try:
         new_association = PersonTreeAssociation(person_id=person_id, tree_id=tree_id)
         db.add(new_association)
+        bump_tree_versions(db, tree_ids=[tree_id], changes=[("association", person_id, "upsert"), ("person", person_id, "upsert")])
         db.commit()
         # For composite PK models, there's no single 'id'. Return relevant info.
         logger.info("Person successfully added to tree", person_id=person_id, tree_id=tree_id)
@@ -334,6 +409,7 @@ def remove_person_from_tree_db(db: DBSession, person_id: uuid.UUID, tree_id: uui
 
     try:
         db.delete(association)
+        bump_tree_versions(db, tree_ids=[tree_id], changes=[("association", person_id, "delete"), ("person", person_id, "delete")])
         db.commit()
         logger.info("Person successfully removed from tree", person_id=person_id, tree_id=tree_id)
         return True
@@ -397,6 +473,7 @@ def upload_tree_cover_image_db(db: DBSession, tree_id: uuid.UUID, user_id: uuid.
                 # Non-critical error, proceed with updating the new image URL
 
         tree.cover_image_url = object_key
+        bump_tree_versions(db, tree_ids=[tree.id], changes=[("tree", tree.id, "upsert")])
         db.commit()
         db.refresh(tree)
         
@@ -0,0 +1,258 @@
+# backend/services/tree_version_service.py
+import uuid
+import threading
+import structlog
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Any, List, Set, Tuple, TypeVar
+from sqlalchemy.orm import Session as DBSession
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import and_, bindparam, delete, func, update, select, insert, or_
+from sqlalchemy.orm import aliased
+from flask import abort
+from werkzeug.exceptions import HTTPException
+
+from models import Tree, TreeChange, PersonTreeAssociation, Person, Relationship, Event, EventParticipant, MediaItem
+from utils import _get_or_404, _handle_sqlalchemy_error
+from config import config
+
+logger = structlog.get_logger(__name__)
+
+# (entity_type, entity_id, operation) where operation is "upsert" or "delete"
+Change = Tuple[str, uuid.UUID, str]
+
+# Entity types whose tree membership follows from their people; see _tree_memberships
+_SCOPED_ENTITY_TYPES = ("relationship", "event")
+
+# Entity types whose upserted rows are returned in full by the delta-sync endpoint
+_CHANGE_ENTITY_MODELS = {
+    "person": Person, "relationship": Relationship, "event": Event, "media": MediaItem, "tree": Tree,
+}
+
+T = TypeVar("T")
+
+
+class TreeVersionCache:
+    """
+    Thread-safe in-process LRU of values derived from a tree, keyed by (tree_id, version).
+    Every write bumps the tree version, so an entry can never go stale; entries for older
+    versions are never hit again and simply age out.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[uuid.UUID, int], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, tree_id: uuid.UUID, version: int, build: Callable[[], T]) -> T:
+        key = (tree_id, version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = build() # Outside the lock: builds run queries
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _tree_memberships(db: DBSession, changes: List[Change], tree_ids: List[uuid.UUID]) -> Set[Tuple[str, uuid.UUID, uuid.UUID]]:
+    """
+    (entity_type, entity_id, tree_id) for each upserted relationship or event that belongs to
+    one of `tree_ids` after the write: both endpoints of a relationship, or any participant
+    of an event, are tree members (the same scope the tree listings use).
+    """
+    upserted = defaultdict(set)
+    for entity_type, entity_id, operation in changes:
+        if entity_type in _SCOPED_ENTITY_TYPES and operation == "upsert":
+            upserted[entity_type].add(entity_id)
+    if not upserted or not tree_ids:
+        return set()
+    members = set()
+    if upserted["relationship"]:
+        first, second = aliased(PersonTreeAssociation), aliased(PersonTreeAssociation)
+        rows = db.execute(
+            select(Relationship.id, first.tree_id)
+            .join(first, first.person_id == Relationship.person1_id)
+            .join(second, and_(second.person_id == Relationship.person2_id, second.tree_id == first.tree_id))
+            .where(Relationship.id.in_(upserted["relationship"]), first.tree_id.in_(tree_ids))
+        ).all()
+        members.update(("relationship", entity_id, tree_id) for entity_id, tree_id in rows)
+    if upserted["event"]:
+        rows = db.execute(
+            select(EventParticipant.event_id, PersonTreeAssociation.tree_id).distinct()
+            .join(PersonTreeAssociation, PersonTreeAssociation.person_id == EventParticipant.person_id)
+            .where(EventParticipant.event_id.in_(upserted["event"]), PersonTreeAssociation.tree_id.in_(tree_ids))
+        ).all()
+        members.update(("event", entity_id, tree_id) for entity_id, tree_id in rows)
+    return members
+
+
+def _operation_in_tree(entity_type: str, entity_id: uuid.UUID, operation: str, tree_id: uuid.UUID,
+                       members: Set[Tuple[str, uuid.UUID, uuid.UUID]]) -> str:
+    """An upserted relationship/event that is not (or no longer) in the tree is journaled there as a delete."""
+    if operation == "upsert" and entity_type in _SCOPED_ENTITY_TYPES and (entity_type, entity_id, tree_id) not in members:
+        return "delete"
+    return operation
+
+
+def bump_tree_versions(db: DBSession,
+                       tree_ids: Optional[Iterable[uuid.UUID]] = None,
+                       person_ids: Optional[Iterable[uuid.UUID]] = None,
+                       changes: Optional[Iterable[Change]] = None
+                       ) -> Dict[uuid.UUID, int]:
+    """
+    Increments the version counter of every affected tree in a single UPDATE and
+    journals `changes` against each new tree version.
+
+    Trees can be named directly (`tree_ids`) or reached through the people whose
+    data changed (`person_ids`, resolved via PersonTreeAssociation in a sub-select).
+    An upserted relationship or event is journaled as a delete in every bumped tree it
+    is not (or no longer) part of, e.g. the tree an edited edge just left.
+    Must be called before the caller's commit so the bump is part of the same
+    transaction as the write it describes. Returns {tree_id: new_version}.
+    """
+    tree_ids = {tid for tid in (tree_ids or []) if tid}
+    person_ids = {pid for pid in (person_ids or []) if pid}
+    if not tree_ids and not person_ids:
+        return {}
+
+    conditions = []
+    if tree_ids:
+        conditions.append(Tree.id.in_(tree_ids))
+    if person_ids:
+        conditions.append(Tree.id.in_(
+            select(PersonTreeAssociation.tree_id).where(PersonTreeAssociation.person_id.in_(person_ids))
+        ))
+
+    db.flush() # Make pending association changes visible to the sub-select
+    rows = db.execute(
+        update(Tree).where(or_(*conditions)).values(version=Tree.version + 1)
+        .returning(Tree.id, Tree.version)
+        .execution_options(synchronize_session=False)
+    ).all()
+    versions = {row[0]: row[1] for row in rows}
+
+    changes = list(changes or [])
+    members = _tree_memberships(db, changes, list(versions))
+    journal_rows = [
+        {"id": uuid.uuid4(), "tree_id": tree_id, "version": version, "entity_type": entity_type,
+         "entity_id": entity_id, "operation": _operation_in_tree(entity_type, entity_id, operation, tree_id, members),
+         "created_at": datetime.utcnow()}
+        for tree_id, version in versions.items()
+        for entity_type, entity_id, operation in changes
+    ]
+    if journal_rows:
+        db.execute(insert(TreeChange), journal_rows)
+
+    logger.debug("Bumped tree versions", versions={str(k): v for k, v in versions.items()},
+                 journaled=len(journal_rows))
+    return versions
+
+
+def get_tree_changes_db(db: DBSession, tree_id: uuid.UUID, since: int) -> Dict[str, Any]:
+    """
+    Returns what changed in a tree after version `since`: for each entity type, the
+    upserted rows (latest state, batch-loaded with one IN query per type) and the IDs
+    deleted. Only the latest operation per entity is reported. If more entities changed
+    than DELTA_SYNC_MAX_CHANGES, or `since` is older than the retained journal,
+    `reset_required` tells the client to reload instead.
+    """
+    logger.info("Fetching tree changes", tree_id=tree_id, since=since)
+    if since < 0:
+        abort(400, description={"message": "Validation failed", "details": {"since": "Must be a non-negative version."}})
+    tree = _get_or_404(db, Tree, tree_id)
+    current_version = tree.version
+    result: Dict[str, Any] = {"tree_id": str(tree_id), "since": since, "version": current_version,
+                              "reset_required": False, "changes": {}}
+    if since >= current_version:
+        return result
+    if since < (tree.journal_min_version or 0):
+        logger.info("Requested version predates the retained journal, client must reload.", tree_id=tree_id,
+                    since=since, journal_min_version=tree.journal_min_version)
+        result["reset_required"] = True
+        return result
+
+    try:
+        latest = db.execute(
+            select(TreeChange.entity_type, TreeChange.entity_id, TreeChange.operation)
+            .where(TreeChange.tree_id == tree_id, TreeChange.version > since,
+                   TreeChange.version <= current_version)
+            .distinct(TreeChange.entity_type, TreeChange.entity_id)
+            .order_by(TreeChange.entity_type, TreeChange.entity_id, TreeChange.version.desc())
+            .limit(config.DELTA_SYNC_MAX_CHANGES + 1)
+        ).all()
+        if len(latest) > config.DELTA_SYNC_MAX_CHANGES:
+            logger.info("Too many changes for delta sync, client must reload.", tree_id=tree_id, since=since)
+            result["reset_required"] = True
+            return result
+
+        grouped: Dict[str, Dict[str, List[uuid.UUID]]] = {}
+        for entity_type, entity_id, operation in latest:
+            bucket = grouped.setdefault(entity_type, {"upsert": [], "delete": []})
+            bucket[operation].append(entity_id)
+
+        for entity_type, bucket in grouped.items():
+            model_cls = _CHANGE_ENTITY_MODELS.get(entity_type)
+            if model_cls is not None and bucket["upsert"]:
+                upserted = [obj.to_dict() for obj in db.query(model_cls).filter(model_cls.id.in_(bucket["upsert"])).all()]
+            else:
+                upserted = [str(eid) for eid in bucket["upsert"]]
+            result["changes"][entity_type] = {
+                "upserted": upserted,
+                "deleted": [str(eid) for eid in bucket["delete"]],
+            }
+        return result
+    except SQLAlchemyError as e:
+        _handle_sqlalchemy_error(e, f"fetching changes for tree {tree_id}", db)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.error("Unexpected error fetching tree changes.", tree_id=tree_id, since=since, exc_info=True)
+        abort(500, description="An unexpected error occurred while fetching tree changes.")
+    return {} # Should be unreachable
+
+
+def prune_tree_changes_db(db: DBSession, retention_days: Optional[int] = None,
+                          batch_size: Optional[int] = None) -> int:
+    """
+    Deletes journal rows older than TREE_CHANGES_RETENTION_DAYS in batches, committing per
+    batch, and raises each affected tree's journal_min_version to the newest version pruned
+    from it so get_tree_changes_db can tell a client that fell behind to reload.
+    Returns the number of rows deleted.
+    """
+    retention_days = config.TREE_CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or config.TREE_CHANGES_PRUNE_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    raise_low_water_mark = Tree.__table__.update().where(Tree.__table__.c.id == bindparam("pruned_tree_id")).values(
+        journal_min_version=func.greatest(Tree.__table__.c.journal_min_version, bindparam("pruned_version")))
+    deleted = 0
+    logger.info("Pruning tree change journal", cutoff=cutoff, batch_size=batch_size)
+    while True:
+        try:
+            doomed = select(TreeChange.id).where(TreeChange.created_at < cutoff).limit(batch_size)
+            rows = db.execute(delete(TreeChange).where(TreeChange.id.in_(doomed))
+                              .returning(TreeChange.tree_id, TreeChange.version)
+                              .execution_options(synchronize_session=False)).all()
+            if not rows:
+                break
+            low_water: Dict[uuid.UUID, int] = {}
+            for tree_id, version in rows:
+                low_water[tree_id] = max(version, low_water.get(tree_id, 0))
+            db.execute(raise_low_water_mark, [{"pruned_tree_id": tree_id, "pruned_version": version}
+                                              for tree_id, version in low_water.items()])
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.error("Tree change journal prune batch failed.", deleted=deleted, exc_info=True)
+            raise
+        deleted += len(rows)
+    logger.info("Pruned tree change journal.", rows=deleted)
+    return deleted
@@ -7,12 +7,13 @@ from sqlalchemy.orm import Session as DBSession # Renamed to avoid conflict
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy import or_
 from flask import abort
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
 
 # Import type hints
 from typing import Dict, Any, Optional # Added this line
 
 from models import User, UserRole
-from utils import (_validate_password_complexity, _hash_password, _verify_password,
+from utils import (_validate_password_complexity, _hash_password, _verify_password, _password_needs_rehash,
                      _get_or_404, _handle_sqlalchemy_error, paginate_query)
 import config as app_config_module
 import extensions # For metrics and get_fernet
@@ -82,6 +83,13 @@ def authenticate_user_db(db: DBSession,
         if not _verify_password(password, user.password_hash):
             if extensions.auth_failure_counter: extensions.auth_failure_counter.add(1, {"reason": "incorrect_password", "user_id": str(user.id)})
             return None
+        if _password_needs_rehash(user.password_hash):
+            # Stored cost differs from BCRYPT_ROUNDS: upgrade the hash while we hold the plaintext
+            try:
+                user.password_hash = _hash_password(password)
+                logger.info("Password rehashed with current cost.", user_id=user.id)
+            except ServiceUnavailable:
+                logger.warning("Skipping password rehash, hashing pool busy.", user_id=user.id)
         user.last_login = datetime.utcnow() 
         db.commit() 
         db.refresh(user) # Ensure last_login is refreshed before to_dict
@@ -195,6 +203,7 @@ def reset_password_db(db: DBSession, token: str, new_password: str) -> bool:
         return True
     except ValueError as ve: abort(400, str(ve)) # Password complexity error
     except SQLAlchemyError as e: _handle_sqlalchemy_error(e, "resetting password", db)
+    except HTTPException: raise
     except Exception as e:
         db.rollback(); logger.error("Unexpected error resetting password.", exc_info=True)
         abort(500, "Error resetting password.")
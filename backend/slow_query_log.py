@@ -0,0 +1,161 @@
+# backend/slow_query_log.py
+"""
+Application-level slow-query recorder.
+
+Statements slower than SLOW_QUERY_THRESHOLD_MS are sampled into a bounded in-process
+ring buffer with their normalized SQL, bind-parameter shapes (types, never values), the
+service/blueprint function that issued them and the endpoint being served. The EXPLAIN
+plan is captured afterwards by a background thread on a separate NullPool connection,
+so the request that ran the slow statement never waits for it. The plan is a plain
+EXPLAIN by default; with SLOW_QUERY_EXPLAIN_ANALYZE, SELECTs are re-run under
+EXPLAIN (ANALYZE, BUFFERS) inside a rolled-back transaction. Statements that take row
+locks or call volatile functions (nextval, advisory locks) are never explained, and
+the side connection runs under SLOW_QUERY_EXPLAIN_TIMEOUT_MS.
+"""
+import queue
+import random
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+import structlog
+from flask import has_request_context, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from config import config
+from query_tracker import fingerprint
+
+logger = structlog.get_logger(__name__)
+
+_CALL_SITE_DIRS = ("/services/", "/blueprints/")
+# Explaining these could lock rows or consume sequence values/advisory locks (ANALYZE executes them).
+_UNSAFE_TO_EXPLAIN = re.compile(
+    r"\bFOR\s+(NO\s+KEY\s+)?(UPDATE|KEY\s+SHARE|SHARE)\b|\b(nextval|setval|pg_(try_)?advisory_\w+)\s*\(",
+    re.IGNORECASE)
+
+
+def _param_shape(parameters: Any) -> Any:
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)): # executemany
+            return {"rows": len(parameters), "row": _param_shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+def _call_site() -> Optional[str]:
+    for frame in reversed(traceback.extract_stack()):
+        if any(marker in frame.filename for marker in _CALL_SITE_DIRS):
+            module = frame.filename.rsplit("/", 2)
+            return f"{module[-2]}.{module[-1][:-3]}:{frame.name}:{frame.lineno}"
+    return None
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements plus the background EXPLAIN worker that fills in their plans."""
+
+    def __init__(self, threshold_ms: float, max_entries: int, sample_rate: float = 1.0, explain: bool = True,
+                 analyze: bool = False, explain_timeout_ms: int = 2000):
+        self.threshold_seconds = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.analyze = analyze
+        self.explain_timeout_ms = explain_timeout_ms
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self._explain_queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_entries // 4))
+        self._explain_engines: Dict[str, Engine] = {}
+        self._worker: Optional[threading.Thread] = None
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most recent first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold_seconds or random.random() >= self.sample_rate:
+            return
+        entry = {
+            "recorded_at": datetime.utcnow().isoformat() + "Z",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": fingerprint(statement),
+            "parameters": _param_shape(parameters),
+            "call_site": _call_site(),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "plan": None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning("Slow query recorded.", duration_ms=entry["duration_ms"], call_site=entry["call_site"],
+                       endpoint=entry["endpoint"], statement=entry["statement"][:200])
+        if self.explain and not executemany:
+            if _UNSAFE_TO_EXPLAIN.search(statement):
+                entry["plan"] = "skipped: statement locks rows or calls a volatile function"
+            else:
+                self._schedule_explain(entry, conn.engine.url, statement, parameters)
+
+    def _schedule_explain(self, entry, url, statement, parameters) -> None:
+        try:
+            self._explain_queue.put_nowait((entry, url, statement, parameters))
+        except queue.Full:
+            entry["plan"] = "skipped: explain queue full"
+            return
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+            self._worker.start()
+
+    def _explain_loop(self) -> None:
+        while True:
+            entry, url, statement, parameters = self._explain_queue.get()
+            try:
+                entry["plan"] = self._explain(url, statement, parameters)
+            except Exception as e:
+                entry["plan"] = f"unavailable: {e}"
+                logger.warning("EXPLAIN of slow query failed.", call_site=entry["call_site"], error=str(e))
+            finally:
+                self._explain_queue.task_done()
+
+    def _explain(self, url, statement: str, parameters: Any) -> List[str]:
+        key = url.render_as_string(hide_password=False)
+        engine = self._explain_engines.get(key)
+        if engine is None: # Not instrumented, so EXPLAINs are never recorded themselves
+            engine = self._explain_engines[key] = create_engine(url, poolclass=NullPool)
+        is_select = statement.lstrip().upper().startswith("SELECT") # A WITH may wrap DML
+        options = "(ANALYZE, BUFFERS, FORMAT TEXT)" if self.analyze and is_select else "(FORMAT TEXT)"
+        with engine.connect() as conn:
+            transaction = conn.begin()
+            try:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                rows = conn.exec_driver_sql(f"EXPLAIN {options} {statement}", parameters or {}).all()
+            finally:
+                transaction.rollback() # ANALYZE ran the statement; never keep its effects
+        return [row[0] for row in rows]
+
+
+slow_query_log = SlowQueryLog(config.SLOW_QUERY_THRESHOLD_MS, config.SLOW_QUERY_LOG_SIZE,
+                              config.SLOW_QUERY_SAMPLE_RATE, config.SLOW_QUERY_EXPLAIN,
+                              config.SLOW_QUERY_EXPLAIN_ANALYZE, config.SLOW_QUERY_EXPLAIN_TIMEOUT_MS)
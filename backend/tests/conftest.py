@@ -0,0 +1,5 @@
+import os
+
+# Unit tests write audit entries through the mocked session; the buffered writer's
+# background thread would try to reach a real database.
+os.environ["AUDIT_LOG_MODE"] = "sync"
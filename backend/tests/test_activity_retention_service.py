@@ -0,0 +1,77 @@
+import unittest
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+from sqlalchemy.exc import OperationalError
+
+from services.activity_retention_service import (
+    partitions_to_archive, _add_months, _partition_name, ensure_activity_log_partitions
+)
+
+
+class TestActivityRetentionService(unittest.TestCase):
+
+    def test_partition_name_and_month_arithmetic(self):
+        self.assertEqual(_partition_name(date(2026, 3, 1)), "activity_log_y2026m03")
+        self.assertEqual(_add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(_add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+
+    def test_partitions_to_archive_respects_retention_window(self):
+        names = ["activity_log_y2025m10", "activity_log_y2025m08", "activity_log_y2025m09",
+                 "activity_log_y2026m10", "activity_log_default"]
+
+        # Today 2026-10-18 with 12 months retention keeps October 2025 onwards
+        expired = partitions_to_archive(names, date(2026, 10, 18), retention_months=12)
+
+        self.assertEqual(expired, ["activity_log_y2025m08", "activity_log_y2025m09"])
+
+
+class TestEnsureActivityLogPartitions(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = MagicMock()
+        self.conn = self.engine.begin.return_value.__enter__.return_value
+        self.statements = []
+        self.this_month = datetime.utcnow().date().replace(day=1)
+        self.stranded_month = _add_months(self.this_month, -2) # Missed by the beat task; its rows went to DEFAULT
+        self.failing_month = None
+
+        def execute(statement, params=None):
+            sql = str(statement)
+            self.statements.append(sql)
+            result = MagicMock()
+            if "date_trunc" in sql:
+                result.scalars.return_value = [datetime.combine(self.stranded_month, datetime.min.time())]
+            elif "to_regclass" in sql:
+                result.scalar.return_value = False
+            elif "count(*)" in sql:
+                result.scalar.return_value = 3 if params["start"] == self.stranded_month else 0
+            elif self.failing_month and sql.startswith("CREATE TABLE IF NOT EXISTS " + _partition_name(self.failing_month)):
+                raise OperationalError(sql, params, Exception("boom"))
+            return result
+        self.conn.execute.side_effect = execute
+
+    def test_each_month_is_created_in_its_own_transaction_and_stranded_rows_are_moved(self):
+        created = ensure_activity_log_partitions(self.engine, months_ahead=1)
+
+        self.assertEqual(created, [_partition_name(month) for month in
+                                   (self.stranded_month, self.this_month, _add_months(self.this_month, 1))])
+        self.assertEqual(self.engine.begin.call_count, 4) # DEFAULT check, then one per month
+        moved = [sql for sql in self.statements if "activity_log_default" in sql and not sql.startswith("SELECT")]
+        self.assertEqual([sql.split(" WHERE")[0] for sql in moved[1:]], [
+            "ALTER TABLE activity_log DETACH PARTITION activity_log_default",
+            "INSERT INTO activity_log SELECT * FROM activity_log_default",
+            "DELETE FROM activity_log_default",
+            "ALTER TABLE activity_log ATTACH PARTITION activity_log_default DEFAULT",
+        ])
+
+    def test_a_failing_month_does_not_stop_the_others(self):
+        self.failing_month = self.this_month
+        with self.assertRaises(RuntimeError):
+            ensure_activity_log_partitions(self.engine, months_ahead=1)
+        next_partition = _partition_name(_add_months(self.this_month, 1))
+        self.assertTrue(any(sql.startswith("CREATE TABLE IF NOT EXISTS " + next_partition) for sql in self.statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import MagicMock
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import ActivityLog, Person
+from sqlalchemy.dialects import postgresql
+
+from services.activity_service import attribute_diff, should_snapshot, _replay
+
+
+class TestActivityService(unittest.TestCase):
+
+    def test_should_snapshot_advances_the_entity_counter(self):
+        db = MagicMock()
+        db.execute.return_value.scalar.side_effect = [5, 0]
+        self.assertFalse(should_snapshot(db, Person, uuid.uuid4()))
+        self.assertTrue(should_snapshot(db, Person, uuid.uuid4())) # Counter wrapped to 0
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("audit_entries_since_snapshot=CASE", sql)
+        self.assertIn("updated_at=people.updated_at", sql)
+        self.assertIn("RETURNING people.audit_entries_since_snapshot", sql)
+        self.assertNotIn("activity_log", sql) # No scan of the log itself
+
+    def test_attribute_diff_reports_only_changed_fields(self):
+        person = Person(id=uuid.uuid4())
+        set_committed_value(person, 'first_name', 'Ada')
+        set_committed_value(person, 'birth_date', date(1815, 12, 10))
+        set_committed_value(person, 'nickname', 'A')
+
+        person.first_name = 'Augusta'
+        person.birth_date = date(1815, 12, 11)
+        person.nickname = 'A' # Re-assigned, unchanged
+
+        self.assertEqual(attribute_diff(person), {
+            'first_name': {'old': 'Ada', 'new': 'Augusta'},
+            'birth_date': {'old': '1815-12-10', 'new': '1815-12-11'},
+        })
+
+    def test_replay_applies_diffs_on_top_of_snapshots(self):
+        def entry(action, new_state=None, changes=None, is_snapshot=False):
+            return MagicMock(spec=ActivityLog, id=uuid.uuid4(), action_type=action, new_state=new_state,
+                             changes=changes, is_snapshot=is_snapshot, created_at=datetime.utcnow())
+        entries = [
+            entry("CREATE_PERSON", new_state={"first_name": "Ada", "last_name": "Byron"}, is_snapshot=True),
+            entry("UPDATE_PERSON", changes={"last_name": {"old": "Byron", "new": "King"}}),
+            entry("UPDATE_PERSON", changes={"first_name": {"old": "Ada", "new": "Augusta"}}),
+            entry("DELETE_PERSON"),
+        ]
+
+        states = [state for _, state in _replay(entries)]
+
+        self.assertEqual(states[1], {"first_name": "Ada", "last_name": "King"})
+        self.assertEqual(states[2], {"first_name": "Augusta", "last_name": "King"})
+        self.assertIsNone(states[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
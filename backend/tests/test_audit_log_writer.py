@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import uuid
+
+from sqlalchemy.orm import Session as DBSession
+
+from audit_log_writer import AuditLogWriter
+from services.activity_service import log_activity
+from config import config
+
+
+class TestAuditLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.writer = AuditLogWriter(max_entries=3, batch_size=2, flush_interval=60)
+        # Keep the background thread out of these tests; flush() is driven explicitly
+        patch.object(self.writer, '_ensure_thread').start()
+        self.mock_engine = MagicMock()
+        self.mock_conn = self.mock_engine.begin.return_value.__enter__.return_value
+        patch('audit_log_writer.get_engine', return_value=self.mock_engine).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_enqueue_applies_back_pressure_when_full(self):
+        self.assertTrue(all(self.writer.enqueue({"n": i}) for i in range(3)))
+        self.assertFalse(self.writer.enqueue({"n": 3}))
+
+    def test_flush_writes_in_multi_row_batches(self):
+        for i in range(3):
+            self.writer.enqueue({"n": i})
+
+        self.writer.flush()
+
+        self.assertEqual(self.mock_conn.execute.call_count, 2) # batch_size=2: [0, 1] then [2]
+        batches = [c.args[1] for c in self.mock_conn.execute.call_args_list]
+        self.assertEqual(batches, [[{"n": 0}, {"n": 1}], [{"n": 2}]])
+
+    @patch('services.activity_service.audit_log_writer')
+    def test_log_activity_buffered_does_not_touch_request_session(self, mock_writer):
+        mock_writer.enqueue.return_value = True
+        mock_db = MagicMock(spec=DBSession)
+        with patch.object(config, 'AUDIT_LOG_MODE', 'buffered'):
+            log_activity(mock_db, "CREATE_PERSON", "PERSON", uuid.uuid4(), actor_user_id=uuid.uuid4())
+
+        row = mock_writer.enqueue.call_args.args[0]
+        self.assertEqual(row["action_type"], "CREATE_PERSON")
+        self.assertIsNotNone(row["created_at"]) # Stamped at enqueue time, not at flush time
+        mock_db.add.assert_not_called()
+        mock_db.commit.assert_not_called()
+
+    @patch('services.activity_service.audit_log_writer')
+    def test_log_activity_falls_back_to_sync_when_buffer_full(self, mock_writer):
+        mock_writer.enqueue.return_value = False
+        mock_db = MagicMock(spec=DBSession)
+        with patch.object(config, 'AUDIT_LOG_MODE', 'buffered'):
+            log_activity(mock_db, "CREATE_PERSON", "PERSON", uuid.uuid4())
+
+        mock_db.add.assert_called_once()
+        mock_db.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import uuid
+
+from sqlalchemy.orm import Session as DBSession
+from werkzeug.exceptions import BadRequest
+
+from models import Relationship, RelationshipTypeEnum
+from services.batch_service import create_people_batch_db, create_relationships_batch_db
+
+
+class TestBatchService(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db_session = MagicMock(spec=DBSession)
+        self.user_id = uuid.uuid4()
+        self.tree_id = uuid.uuid4()
+        self.patcher_bump = patch('services.batch_service.bump_tree_versions')
+        self.patcher_log = patch('services.batch_service.log_activity')
+        self.mock_bump = self.patcher_bump.start()
+        self.mock_log = self.patcher_log.start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    @patch('services.batch_service._loaded_dicts')
+    @patch('services.batch_service._insert_returning_ids')
+    def test_people_batch_reports_invalid_items_by_index(self, mock_insert, mock_loaded):
+        new_id = uuid.uuid4()
+        mock_insert.return_value = [new_id]
+        mock_loaded.return_value = {new_id: {"id": str(new_id), "first_name": "Rudo"}}
+
+        result = create_people_batch_db(self.mock_db_session, self.user_id, self.tree_id, [
+            {"first_name": "Rudo", "death_date": "1990-01-01"},
+            {"last_name": "NoFirstName", "birth_date": "not-a-date"},
+        ])
+
+        self.assertEqual(result["created"], [{"index": 0, "id": str(new_id), "first_name": "Rudo"}])
+        self.assertEqual(result["errors"][0]["index"], 1)
+        self.assertEqual(set(result["errors"][0]["details"]), {"first_name", "birth_date"})
+        rows = mock_insert.call_args.args[2]
+        self.assertEqual(len(rows), 1)
+        self.assertFalse(rows[0]["is_living"]) # Derived from death_date like create_person_db
+        self.mock_bump.assert_called_once()
+        self.mock_db_session.commit.assert_called_once()
+        self.assertEqual(self.mock_log.call_count, 1)
+
+    def test_people_batch_with_no_valid_items_is_rejected(self):
+        with self.assertRaises(BadRequest) as context:
+            create_people_batch_db(self.mock_db_session, self.user_id, self.tree_id, [{"last_name": "X"}])
+        self.assertEqual(context.exception.description["details"]["items"][0]["index"], 0)
+        self.mock_db_session.commit.assert_not_called()
+
+    def test_batch_size_is_limited(self):
+        with patch('services.batch_service.config') as mock_config:
+            mock_config.BATCH_MAX_ITEMS = 2
+            with self.assertRaises(BadRequest):
+                create_people_batch_db(self.mock_db_session, self.user_id, self.tree_id, [{"first_name": "A"}] * 3)
+
+    @patch('services.batch_service._loaded_dicts')
+    @patch('services.batch_service._insert_returning_ids')
+    def test_relationship_batch_validates_people_and_duplicates_in_bulk(self, mock_insert, mock_loaded):
+        p1, p2, missing = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        new_id = uuid.uuid4()
+        mock_insert.return_value = [new_id]
+        mock_loaded.return_value = {new_id: {"id": str(new_id)}}
+        existence_result, duplicate_result = MagicMock(), MagicMock()
+        existence_result.scalars.return_value = iter([p1, p2])
+        duplicate_result.tuples.return_value = iter([])
+        self.mock_db_session.execute.side_effect = [existence_result, duplicate_result]
+        spouse = RelationshipTypeEnum.spouse_current.value
+
+        result = create_relationships_batch_db(self.mock_db_session, self.user_id, [
+            {"person1_id": str(p1), "person2_id": str(p2), "relationship_type": spouse},
+            {"person1_id": str(p1), "person2_id": str(missing), "relationship_type": spouse},
+            {"person1_id": str(p1), "person2_id": str(p2), "relationship_type": spouse},
+        ])
+
+        self.assertEqual([item["index"] for item in result["created"]], [0])
+        self.assertEqual(result["errors"][0], {"index": 1, "details": {"person2_id": f"Person with ID {missing} not found."}})
+        self.assertEqual(result["errors"][1], {"index": 2, "details": {"relationship_type": "This relationship already exists."}})
+        self.assertEqual(self.mock_db_session.execute.call_count, 2) # One existence query, one duplicate query
+        self.assertIs(mock_insert.call_args.args[1], Relationship)
+        self.assertEqual(len(mock_insert.call_args.args[2]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import text, update
+
+from database import LazySession, RoutingSession, pending_write_lsn, remember_write_lsn
+from models import Tree
+
+
+class TestLazySession(unittest.TestCase):
+
+    @patch('database.get_db_session')
+    def test_session_created_only_on_first_use(self, mock_get_db_session):
+        lazy = LazySession()
+
+        self.assertTrue(lazy) # Truthiness checks must not create the session
+        self.assertFalse(lazy.session_created)
+        mock_get_db_session.assert_not_called()
+
+        lazy.query("anything")
+        lazy.commit()
+
+        mock_get_db_session.assert_called_once()
+        self.assertTrue(lazy.session_created)
+        mock_get_db_session.return_value.query.assert_called_once_with("anything")
+        mock_get_db_session.return_value.commit.assert_called_once()
+
+
+class TestRoutingSession(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = MagicMock(name="primary")
+        self.replica = MagicMock(name="replica")
+        self.session = RoutingSession(bind=self.primary)
+
+    @patch('database._choose_replica')
+    def test_reads_use_replica_until_first_write(self, mock_choose):
+        mock_choose.return_value = self.replica
+        self.session.info.update(use_replica=True, min_replica_lsn="0/16B3748")
+
+        self.assertIs(self.session.get_bind(clause=text("SELECT 1")), self.replica)
+        self.assertIs(self.session.get_bind(clause=update(Tree).values(version=1)), self.primary)
+        self.assertIs(self.session.get_bind(clause=text("SELECT 1")), self.primary)
+
+        mock_choose.assert_called_once_with("0/16B3748")
+        self.assertTrue(self.session.info["wrote"])
+        self.assertTrue(self.session.info["replica_lsn_confirmed"])
+
+    @patch('database._choose_replica')
+    def test_falls_back_to_primary_without_caught_up_replica(self, mock_choose):
+        mock_choose.return_value = None
+        self.session.info.update(use_replica=True, min_replica_lsn="0/16B3748")
+
+        self.assertIs(self.session.get_bind(clause=text("SELECT 1")), self.primary)
+        self.assertFalse(self.session.info["replica_lsn_confirmed"])
+
+    @patch('database._choose_replica')
+    def test_raw_sql_goes_to_replica_only_when_it_is_a_plain_read(self, mock_choose):
+        mock_choose.return_value = self.replica
+        self.session.info.update(use_replica=True)
+
+        self.assertIs(self.session.get_bind(clause=text("SELECT id FROM trees WHERE updated_at > now()")), self.replica)
+        self.assertIs(self.session.get_bind(clause=text("SELECT id FROM trees FOR SHARE")), self.primary)
+        self.assertTrue(self.session.info["wrote"])
+
+    def test_raw_write_is_routed_to_primary(self):
+        self.session.info.update(use_replica=True, replica=self.replica)
+        self.assertIs(self.session.get_bind(clause=text("UPDATE trees SET version = version + 1")), self.primary)
+        self.assertIs(self.session.get_bind(clause=text("SELECT 1")), self.primary) # Sticks to the primary after a write
+
+    def test_without_replica_flag_uses_primary(self):
+        self.assertIs(self.session.get_bind(clause=text("SELECT 1")), self.primary)
+
+
+class TestReadYourWritesLsn(unittest.TestCase):
+
+    def test_lsn_is_kept_until_its_timer_expires(self):
+        user_session = {}
+        with patch('database.time.time', return_value=1000.0):
+            remember_write_lsn(user_session, "0/16B3748")
+        with patch('database.time.time', return_value=1010.0):
+            self.assertEqual(pending_write_lsn(user_session), "0/16B3748") # Still required, whatever replica served last
+        with patch('database.time.time', return_value=1000.0 + 3600):
+            self.assertIsNone(pending_write_lsn(user_session))
+        self.assertEqual(user_session, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
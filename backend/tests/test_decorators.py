@@ -3,8 +3,9 @@ import uuid
 from flask import Flask, g, session, jsonify, request
 from unittest.mock import MagicMock, patch
 
-from decorators import require_auth, require_admin, require_tree_access
+from decorators import require_auth, require_admin, require_tree_access, tree_etag
 from models import User, Tree, TreeAccess, UserRole, TreePrivacySettingEnum
+import permission_cache
 
 # Helper function to create a mock user object (already provided in previous attempt)
 def create_mock_user(user_id, username, role, is_active=True):
@@ -93,6 +94,25 @@ class TestDecorators(unittest.TestCase):
                            tree_id=str(g.active_tree_id),
                            access_level=g.tree_access_level), 200
 
+        # --- Route for @tree_etag (active tree injected directly instead of via @require_tree_access) ---
+        self.etag_tree = create_mock_tree(uuid.uuid4(), "ETag Tree", self.tree_owner_id)
+        self.etag_tree.version = 7
+        self.etag_view_calls = 0
+
+        def _with_active_tree(f):
+            def wrapper(*args, **kwargs):
+                g.active_tree = self.etag_tree
+                return f(*args, **kwargs)
+            wrapper.__name__ = f.__name__
+            return wrapper
+
+        @self.app.route('/etag_test')
+        @_with_active_tree
+        @tree_etag
+        def etag_route_test():
+            self.etag_view_calls += 1
+            return jsonify(message="ETag Success"), 200
+
         self.client = self.app.test_client()
 
     # --- Tests for @require_auth ---
@@ -283,5 +303,51 @@ class TestDecorators(unittest.TestCase):
         self.assertIn("You do not have sufficient permissions ('view' required)", response.json['description']['message'])
 
 
+    # --- Tests for @tree_etag ---
+    def test_tree_etag_returns_304_until_tree_version_changes(self):
+        first = self.client.get('/etag_test?b=2&a=1')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+
+        # Same query params in a different order map to the same ETag
+        not_modified = self.client.get('/etag_test?a=1&b=2', headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.etag_view_calls, 1)
+
+        self.etag_tree.version = 8
+        modified = self.client.get('/etag_test?a=1&b=2', headers={'If-None-Match': etag})
+        self.assertEqual(modified.status_code, 200)
+        self.assertNotEqual(modified.headers['ETag'], etag)
+        self.assertEqual(self.etag_view_calls, 2)
+
+    # --- Tests for the permission cache behind @require_tree_access ---
+    def test_require_tree_access_second_request_served_from_permission_cache(self):
+        test_tree_id = uuid.uuid4()
+        mock_tree = create_mock_tree(test_tree_id, "Cached Tree", self.tree_owner_id)
+        mock_db_session = MagicMock()
+        mock_db_session.query.return_value.filter.return_value.one_or_none.return_value = mock_tree
+        self.app.before_request(lambda: setattr(g, 'db', mock_db_session))
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = str(self.tree_owner_id)
+
+        with patch('permission_cache._get_redis', return_value=None):
+            first = self.client.get(f'/trees/{test_tree_id}/protected_tree_param_admin_test')
+            queries_after_first = mock_db_session.query.call_count
+            second = self.client.get(f'/trees/{test_tree_id}/protected_tree_param_admin_test')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json['access_level'], 'admin')
+        self.assertEqual(mock_db_session.query.call_count, queries_after_first) # No Tree/TreeAccess lookups
+
+        with patch('permission_cache._get_redis', return_value=MagicMock()) as mock_redis:
+            permission_cache.invalidate_tree(test_tree_id)
+        mock_redis.return_value.pipeline.return_value.incr.assert_called_once_with(f"treeperm:{{{test_tree_id}}}:gen")
+        with patch('permission_cache._get_redis', return_value=None):
+            self.client.get(f'/trees/{test_tree_id}/protected_tree_param_admin_test')
+        self.assertGreater(mock_db_session.query.call_count, queries_after_first)
+
+
 if __name__ == '__main__':
     unittest.main()
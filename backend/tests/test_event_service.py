@@ -206,5 +206,72 @@ class TestEventService(unittest.TestCase):
         # self.assertIn("events.event_type ILIKE '%MARRIAGE%'", str(query_obj).lower()) # Example of checking filter
         self.assertEqual(result, mock_paginated_result)
 
+    def test_get_events_for_tree_db_uses_participant_semi_join(self):
+        self.mock_paginate_query.return_value = {"items": [], "total_items": 0}
+
+        get_events_for_tree_db(self.mock_db_session, self.test_tree_id, 1, 10, "date", "asc")
+
+        criterion = str(self.mock_db_session.query.return_value.filter.call_args.args[0])
+        self.assertIn("event_participants", criterion)
+        self.assertIn("person_tree_association", criterion)
+        self.assertNotIn("LIKE", criterion.upper())
+        self.mock_db_session.query.assert_called_once_with(Event) # No per-person fan-out query
+
+    @patch('services.event_service.bump_tree_versions')
+    def test_update_event_db_rewrites_participants(self, mock_bump):
+        mock_event = MagicMock(spec=Event, id=self.test_event_id, person_id=self.test_person_id, related_person_ids=[], date_range_start=None, date_range_end=None)
+        self.mock_get_or_404.return_value = mock_event
+        with patch('services.event_service._validate_person_ids', return_value=[self.related_person1_id]):
+            update_event_db(self.mock_db_session, self.test_event_id, {"related_person_ids": [str(self.related_person1_id)]})
+
+        delete_stmt, (insert_stmt, rows) = [c.args for c in self.mock_db_session.execute.call_args_list]
+        self.assertIn("DELETE FROM event_participants", str(delete_stmt[0]))
+        self.assertEqual(rows, [
+            {"event_id": self.test_event_id, "person_id": self.test_person_id, "role": "principal"},
+            {"event_id": self.test_event_id, "person_id": self.related_person1_id, "role": "related"},
+        ])
+
+    @patch('services.event_service.bump_tree_versions')
+    @patch('services.event_service.ensure_exists_or_404')
+    def test_update_event_db_person_change_drops_deleted_related_people(self, mock_exists, mock_bump):
+        mock_event = MagicMock(spec=Event, id=self.test_event_id, person_id=self.test_person_id, date_range_start=None,
+                               date_range_end=None, related_person_ids=[str(self.related_person1_id), str(self.related_person2_id)])
+        self.mock_get_or_404.return_value = mock_event
+        new_principal = uuid.uuid4()
+        with patch('services.event_service.ensure_exist', return_value={self.related_person1_id}): # Person 2 was deleted
+            update_event_db(self.mock_db_session, self.test_event_id, {"person_id": str(new_principal)})
+
+        self.assertEqual(mock_event.related_person_ids, [str(self.related_person1_id)])
+        rows = self.mock_db_session.execute.call_args_list[-1].args[1]
+        self.assertEqual([row["person_id"] for row in rows], [new_principal, self.related_person1_id])
+
+    def test_validate_person_ids_checks_existence_in_one_query(self):
+        missing_id = uuid.uuid4()
+        self.mock_db_session.execute.return_value.scalars.return_value = iter([self.related_person1_id, self.related_person2_id])
+        ids = [str(self.related_person1_id), str(self.related_person2_id), str(missing_id)]
+
+        with self.assertRaises(BadRequest) as context:
+            _validate_person_ids(self.mock_db_session, ids, "related_person_ids")
+
+        self.assertEqual(context.exception.description["details"]["related_person_ids"], [f"Person with ID {missing_id} not found."])
+        self.mock_db_session.execute.assert_called_once()
+        self.mock_db_session.query.assert_not_called() # No per-id SELECTs loading Person rows
+
+    # --- Tests for sparse fieldsets ---
+    def test_get_event_db_with_fields_returns_only_requested(self):
+        mock_event = Event(id=self.test_event_id, event_type="BIRTH", date=date(1990, 5, 17))
+        self.mock_get_or_404.return_value = mock_event
+
+        result = get_event_db(self.mock_db_session, self.test_event_id, fields=["event_type", "date"])
+
+        self.assertEqual(result, {"id": str(self.test_event_id), "event_type": "BIRTH", "date": "1990-05-17"})
+        options = self.mock_get_or_404.call_args.kwargs["options"]
+        self.assertEqual(len(options), 1) # A single load_only option restricting the SELECT list
+
+    def test_get_event_db_with_unknown_field_aborts(self):
+        with self.assertRaises(BadRequest):
+            get_event_db(self.mock_db_session, self.test_event_id, fields=["event_type", "not_a_column"])
+        self.mock_get_or_404.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import uuid
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from services import family_service
+from services.family_service import FamilyUnit, build_family_units, get_tree_families_db
+
+
+def _edge(person1_id, person2_id, relationship_type, **extra):
+    return SimpleNamespace(id=uuid.uuid4(), person1_id=person1_id, person2_id=person2_id,
+                           relationship_type=relationship_type, start_date=extra.get("start_date"),
+                           end_date=None, location=extra.get("location"))
+
+
+class TestBuildFamilyUnits(unittest.TestCase):
+
+    def setUp(self):
+        self.father, self.mother, self.stepmother, self.child, self.half_sibling = (uuid.uuid4() for _ in range(5))
+
+    def test_children_join_the_couple_formed_by_their_parents(self):
+        marriage = _edge(self.father, self.mother, "spouse_current", start_date=date(1975, 6, 12), location="Mutare")
+        units = build_family_units([
+            marriage,
+            _edge(self.father, self.child, "biological_parent"),
+            _edge(self.child, self.mother, "biological_child"), # Child-to-parent edges count too
+        ])
+        self.assertEqual(len(units), 1)
+        unit = units[0]
+        self.assertEqual(unit.partner_ids, [self.father, self.mother])
+        self.assertEqual(unit.child_ids, [self.child])
+        self.assertEqual((unit.relationship_id, unit.start_date, unit.location), (marriage.id, date(1975, 6, 12), "Mutare"))
+
+    def test_unlinked_parents_and_childless_couples_form_their_own_units(self):
+        units = build_family_units([
+            _edge(self.father, self.stepmother, "spouse_former"),
+            _edge(self.father, self.half_sibling, "biological_parent"),
+            _edge(self.mother, self.half_sibling, "biological_parent"),
+        ])
+        by_partners = {frozenset(u.partner_ids): u for u in units}
+        self.assertEqual(by_partners[frozenset((self.father, self.stepmother))].child_ids, [])
+        implicit = by_partners[frozenset((self.father, self.mother))]
+        self.assertEqual(implicit.child_ids, [self.half_sibling])
+        self.assertIsNone(implicit.relationship_id)
+
+    def test_family_ids_are_stable_regardless_of_edge_order(self):
+        first = build_family_units([_edge(self.father, self.mother, "partner")])
+        second = build_family_units([_edge(self.mother, self.father, "partner")])
+        self.assertEqual(first[0].id, second[0].id)
+
+
+class TestGetTreeFamilies(unittest.TestCase):
+
+    def setUp(self):
+        family_service._family_units_cache.clear()
+        self.tree_id = uuid.uuid4()
+        self.db = MagicMock()
+        self.units = sorted((FamilyUnit(partner_ids=[uuid.uuid4()]) for _ in range(3)), key=lambda unit: unit.id)
+
+    def test_pages_are_served_from_units_built_once_per_tree_version(self):
+        self.db.query.return_value.filter.return_value.scalar.return_value = 7
+        with patch('services.family_service.load_family_units', return_value=self.units) as mock_load:
+            first = get_tree_families_db(self.db, self.tree_id, page=1, per_page=2)
+            second = get_tree_families_db(self.db, self.tree_id, page=2, per_page=2)
+        mock_load.assert_called_once_with(self.db, self.tree_id)
+        self.assertEqual([item["id"] for item in first["items"] + second["items"]], [str(u.id) for u in self.units])
+        self.assertEqual((first["total_items"], first["total_pages"], first["has_next"], second["has_next"]), (3, 2, True, False))
+
+    def test_new_tree_version_rebuilds_units(self):
+        self.db.query.return_value.filter.return_value.scalar.side_effect = [1, 2]
+        with patch('services.family_service.load_family_units', return_value=self.units) as mock_load:
+            get_tree_families_db(self.db, self.tree_id)
+            get_tree_families_db(self.db, self.tree_id)
+        self.assertEqual(mock_load.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import uuid
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from gedcom import gedcom_line, iter_gedcom_records, parse_gedcom_date, parse_gedcom_name
+from models import Event, ImportJob, Person, PrivacyLevelEnum
+from services.family_service import FamilyUnit
+from services.gedcom_export_service import _individual
+from services.gedcom_import_service import (_ImportContext, _inverse_relationship_rows, _map_chunk,
+                                             resume_gedcom_import_db)
+
+SAMPLE = """\ufeff0 HEAD
+1 CHAR UTF-8
+0 @I1@ INDI
+1 NAME Tendai Farai /Moyo/
+1 SEX M
+1 BIRT
+2 DATE ABT 1950
+2 PLAC Harare
+1 OCCU Teacher
+1 NOTE First line
+2 CONT second line
+0 @I2@ INDI
+1 NAME Rudo /Chirwa/
+1 SEX F
+1 DEAT
+2 DATE 3 MAR 2001
+0 @I3@ INDI
+1 NAME Tariro /Moyo/
+0 @F1@ FAM
+1 HUSB @I1@
+1 WIFE @I2@
+1 CHIL @I3@
+1 MARR
+2 DATE 12 JUN 1975
+1 DIV
+0 TRLR
+""".splitlines(keepends=True)
+
+
+class TestGedcomReader(unittest.TestCase):
+
+    def test_records_are_streamed_with_continuations_folded(self):
+        records = list(iter_gedcom_records(iter(SAMPLE)))
+        self.assertEqual([r.tag for r in records], ["HEAD", "INDI", "INDI", "INDI", "FAM", "TRLR"])
+        tendai = records[1]
+        self.assertEqual(tendai.xref, "@I1@")
+        self.assertEqual(tendai.first("BIRT").value_of("PLAC"), "Harare")
+        self.assertEqual(tendai.value_of("NOTE"), "First line\nsecond line")
+
+    def test_dates_and_names(self):
+        self.assertEqual(parse_gedcom_date("3 MAR 2001"), (date(2001, 3, 3), False))
+        self.assertEqual(parse_gedcom_date("ABT 1950"), (date(1950, 1, 1), True))
+        self.assertEqual(parse_gedcom_date("BET JAN 1900 AND 1910"), (date(1900, 1, 1), True))
+        self.assertEqual(parse_gedcom_date("unknown"), (None, False))
+        self.assertEqual(parse_gedcom_name("Tendai Farai /Moyo/"), ("Tendai Farai", "Moyo"))
+        self.assertEqual(parse_gedcom_name("Rudo"), ("Rudo", None))
+
+    def test_written_lines_round_trip_through_the_reader(self):
+        text = gedcom_line(0, "INDI", xref="@I1@") + gedcom_line(1, "NOTE", "@home\nsecond line")
+        self.assertEqual(text, "0 @I1@ INDI\n1 NOTE @@home\n2 CONT second line\n")
+        record = next(iter_gedcom_records(text.splitlines(keepends=True)))
+        self.assertEqual(record.value_of("NOTE"), "@home\nsecond line")
+
+
+class TestGedcomMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = _ImportContext(job_id=uuid.uuid4(), tree_id=uuid.uuid4(), user_id=uuid.uuid4(), now=datetime(2026, 1, 1))
+        self.records = list(iter_gedcom_records(iter(SAMPLE)))
+
+    def test_individuals_phase_maps_people_and_events(self):
+        chunk = _map_chunk(self.ctx, "individuals", self.records)
+        self.assertEqual(len(chunk.people), 3)
+        tendai, rudo = chunk.people[0], chunk.people[1]
+        self.assertEqual((tendai["first_name"], tendai["middle_names"], tendai["last_name"]), ("Tendai", "Farai", "Moyo"))
+        self.assertEqual((tendai["gender"], tendai["birth_date"], tendai["birth_date_approx"]), ("male", date(1950, 1, 1), True))
+        self.assertTrue(tendai["is_living"])
+        self.assertFalse(rudo["is_living"])
+        self.assertEqual([(e["event_type"], e["description"]) for e in chunk.events], [("occupation", "Teacher")])
+        self.assertEqual(chunk.relationships, [])
+
+    def test_families_phase_maps_relationships_with_ids_stable_across_runs(self):
+        chunk = _map_chunk(self.ctx, "families", self.records)
+        people = {p["custom_attributes"]["gedcom_xref"]: p["id"] for p in _map_chunk(self.ctx, "individuals", self.records).people}
+        edges = {(r["person1_id"], r["person2_id"], r["relationship_type"]) for r in chunk.relationships}
+        self.assertEqual(edges, {
+            (people["@I1@"], people["@I2@"], "spouse_former"),
+            (people["@I1@"], people["@I3@"], "biological_parent"),
+            (people["@I2@"], people["@I3@"], "biological_parent"),
+        })
+        marriage, divorce = chunk.events
+        self.assertEqual((marriage["event_type"], marriage["date"]), ("marriage", date(1975, 6, 12)))
+        self.assertEqual(marriage["related_person_ids"], [str(people["@I2@"])])
+        self.assertEqual(divorce["event_type"], "divorce")
+        again = _map_chunk(self.ctx, "families", self.records)
+        self.assertEqual([r["id"] for r in again.relationships], [r["id"] for r in chunk.relationships])
+
+    def test_materialized_inverses_are_stable_across_runs(self):
+        relationships = _map_chunk(self.ctx, "families", self.records).relationships
+        inverses = _inverse_relationship_rows(self.ctx, relationships)
+        self.assertEqual({(r["person1_id"], r["person2_id"], r["relationship_type"]) for r in inverses},
+                         {(r["person2_id"], r["person1_id"], "spouse_former" if r["relationship_type"] == "spouse_former"
+                           else "biological_child") for r in relationships})
+        self.assertEqual([r["id"] for r in _inverse_relationship_rows(self.ctx, relationships)], [r["id"] for r in inverses])
+
+    def test_exported_events_round_trip_without_duplicating_family_events(self):
+        person_id, spouse_id = uuid.uuid4(), uuid.uuid4()
+        person = Person(id=person_id, first_name="Tendai", last_name="Moyo", privacy_level=PrivacyLevelEnum.inherit)
+        events = [
+            Event(event_type="baptism", person_id=person_id, date=date(1950, 3, 1), date_approx=False,
+                  description="St Mary's"),
+            Event(event_type="occupation", person_id=person_id, description="Teacher"),
+            Event(event_type="marriage", person_id=person_id, related_person_ids=[str(spouse_id)],
+                  date=date(1975, 6, 12), date_approx=False),
+        ]
+        unit = FamilyUnit(partner_ids=[person_id, spouse_id], relationship_type="spouse_current")
+        text = gedcom_line(0, "HEAD") + _individual(person, events, {}, {person_id: [unit]}) + gedcom_line(0, "TRLR")
+
+        chunk = _map_chunk(self.ctx, "individuals", list(iter_gedcom_records(text.splitlines(keepends=True))))
+        self.assertEqual([(e["event_type"], e["description"]) for e in chunk.events],
+                         [("baptism", "St Mary's"), ("occupation", "Teacher")]) # MARR comes from the FAM record
+
+
+class TestGedcomImportQueueing(unittest.TestCase):
+
+    @patch('services.gedcom_import_service._enqueue_import', side_effect=ConnectionError("broker down"))
+    def test_job_that_cannot_be_queued_is_failed_and_resumable(self, mock_enqueue):
+        job = ImportJob(id=uuid.uuid4(), tree_id=uuid.uuid4(), status="failed")
+        db = MagicMock()
+        db.query.return_value.filter.return_value.one_or_none.return_value = job
+
+        with self.assertRaises(ServiceUnavailable):
+            resume_gedcom_import_db(db, job.tree_id, job.id)
+        self.assertEqual(job.status, "failed") # Not stranded as pending
+        self.assertIn("broker down", job.error)
+
+        mock_enqueue.side_effect = None
+        self.assertEqual(resume_gedcom_import_db(db, job.tree_id, job.id)["status"], "pending")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+import password_hasher
+from password_hasher import PasswordHasherBusy, hash_password, verify_password, needs_rehash, hash_rounds
+from config import config
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def setUp(self):
+        # Inline mode: no worker processes, low cost to keep the tests fast
+        patch.object(config, 'PASSWORD_HASH_WORKERS', 0).start()
+        patch.object(config, 'BCRYPT_ROUNDS', 4).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_hash_and_verify_inline(self):
+        hashed = hash_password("01Admin_2025")
+        self.assertEqual(hash_rounds(hashed), 4)
+        self.assertTrue(verify_password("01Admin_2025", hashed))
+        self.assertFalse(verify_password("wrong_password", hashed))
+
+    def test_needs_rehash_when_cost_differs(self):
+        self.assertFalse(needs_rehash(hash_password("01Admin_2025")))
+        self.assertTrue(needs_rehash(hash_password("01Admin_2025", rounds=5)))
+        self.assertFalse(needs_rehash("not-a-bcrypt-hash"))
+
+    def test_saturated_pool_fails_fast(self):
+        patch.object(config, 'PASSWORD_HASH_WORKERS', 1).start()
+        with patch.object(password_hasher, '_slots') as mock_slots, \
+             patch.object(password_hasher, '_get_executor') as mock_get_executor:
+            mock_slots.acquire.return_value = False
+            with self.assertRaises(PasswordHasherBusy):
+                hash_password("01Admin_2025")
+        mock_get_executor.assert_not_called()
+
+    def test_pool_round_trip(self):
+        patch.object(config, 'PASSWORD_HASH_WORKERS', 1).start()
+        hashed = hash_password("01Admin_2025")
+        self.assertTrue(verify_password("01Admin_2025", hashed))
+
+    def test_timed_out_job_keeps_its_slot_until_it_finishes(self):
+        patch.object(config, 'PASSWORD_HASH_WORKERS', 1).start()
+        patch.object(config, 'PASSWORD_HASH_TIMEOUT', 0.01).start()
+        future = Future()
+        with patch.object(password_hasher, '_slots') as mock_slots, \
+             patch.object(password_hasher, '_get_executor') as mock_get_executor:
+            mock_slots.acquire.return_value = True
+            mock_get_executor.return_value.submit.return_value = future
+            with self.assertRaises(PasswordHasherBusy):
+                hash_password("01Admin_2025")
+            mock_slots.release.assert_not_called() # The worker is still hashing
+            future.set_result(b"$2b$04$done")
+            mock_slots.release.assert_called_once()
+
+    def test_broken_pool_is_discarded_and_reported_busy(self):
+        patch.object(config, 'PASSWORD_HASH_WORKERS', 1).start()
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool("worker died")
+        patch.object(password_hasher, '_executor', broken).start()
+        with patch.object(password_hasher, '_slots') as mock_slots:
+            mock_slots.acquire.return_value = True
+            with self.assertRaises(PasswordHasherBusy):
+                hash_password("01Admin_2025")
+            mock_slots.release.assert_called_once()
+        self.assertIsNone(password_hasher._executor)
+        broken.shutdown.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import uuid
+from unittest.mock import patch
+
+import redis
+
+import permission_cache
+
+
+class FakeRedis:
+    """In-memory stand-in for the few commands the cache uses; `down` makes every command fail."""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise redis.ConnectionError("Redis is down")
+
+    def mget(self, *keys):
+        self._check()
+        return [self.values.get(key) for key in keys]
+
+    def eval(self, script, numkeys, generation_key, entry_key, expected, value, ttl):
+        """The compare-and-set script: write only while the generation is unchanged."""
+        self._check()
+        if str(self.values.get(generation_key, 0)) != expected:
+            return 0
+        self.values[entry_key], self.ttls[entry_key] = value, ttl
+        return 1
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+
+    def __init__(self, client):
+        self.client, self.commands = client, []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        self.client._check()
+        for name, args in self.commands:
+            if name == "incr":
+                self.client.values[args[0]] = int(self.client.values.get(args[0], 0)) + 1
+
+
+class TestPermissionCacheInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeRedis()
+        self.user_id, self.tree_id = uuid.uuid4(), uuid.uuid4()
+        permission_cache._local_cache.clear()
+        permission_cache._pending_invalidations.clear()
+        permission_cache._redis_retry_at = 0.0
+        patcher = patch('permission_cache._redis_client', self.fake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(permission_cache._pending_invalidations.clear)
+        entry, generation = permission_cache.get_permission(self.user_id, self.tree_id)
+        permission_cache.set_permission(self.user_id, self.tree_id, "edit", "PRIVATE", generation)
+        permission_cache._local_cache.clear() # As seen from another worker: only the Redis entry exists
+
+    def _access_level(self):
+        entry, _ = permission_cache.get_permission(self.user_id, self.tree_id)
+        return entry["access_level"] if entry else None
+
+    def test_redis_entry_is_served_before_invalidation(self):
+        self.assertEqual(self._access_level(), "edit")
+        self.assertEqual(self.fake.ttls[f"treeperm:{{{self.tree_id}}}:{self.user_id}"], 300) # Its own expiry
+
+    def test_failed_invalidation_is_retried_before_redis_is_read_again(self):
+        self.fake.down = True
+        permission_cache.invalidate_tree_access(self.tree_id, self.user_id)
+        self.assertIsNone(self._access_level())
+
+        self.fake.down = False
+        permission_cache._redis_retry_at = 0.0 # Back-off over
+        self.assertIsNone(self._access_level())
+        self.assertEqual(self.fake.values[f"treeperm:{{{self.tree_id}}}:gen"], 1)
+        self.assertFalse(permission_cache._pending_invalidations)
+
+    def test_stale_entry_is_not_read_while_invalidation_is_outstanding(self):
+        self.fake.down = True
+        permission_cache.invalidate_tree(self.tree_id)
+        self.fake.down = False # Reachable again, but this worker is still backing off
+        self.assertIsNone(self._access_level())
+        self.assertNotIn(f"treeperm:{{{self.tree_id}}}:gen", self.fake.values) # Not invalidated yet, and not served
+
+    def test_invalidation_is_attempted_during_back_off(self):
+        permission_cache._redis_failed("get") # An unrelated earlier error started the back-off
+        permission_cache.invalidate_tree(self.tree_id)
+        self.assertEqual(self.fake.values[f"treeperm:{{{self.tree_id}}}:gen"], 1)
+        self.assertFalse(permission_cache._pending_invalidations)
+
+    def test_resolve_that_raced_an_invalidation_is_not_cached(self):
+        other_user = uuid.uuid4()
+        _, generation = permission_cache.get_permission(other_user, self.tree_id) # Miss, then the DB is read...
+        permission_cache.invalidate_tree_access(self.tree_id, other_user) # ...while access is revoked
+        permission_cache.set_permission(other_user, self.tree_id, "edit", "PRIVATE", generation)
+
+        self.assertNotIn(f"treeperm:{{{self.tree_id}}}:{other_user}", self.fake.values)
+        entry, _ = permission_cache.get_permission(other_user, self.tree_id)
+        self.assertIsNone(entry) # Not in the local tier either
+
+
+if __name__ == '__main__':
+    unittest.main()
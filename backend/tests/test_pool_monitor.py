@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from pool_monitor import InstrumentedQueuePool, PoolMonitor
+
+
+class TestPoolMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool, pool_size=2, max_overflow=0)
+        self.monitor = PoolMonitor("primary", wait_warn_seconds=0).attach(self.engine)
+        self.app = Flask(__name__)
+        self.app.add_url_rule("/api/trees", "trees_api.list_trees", lambda: "")
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_tracks_holder_and_pool_occupancy(self):
+        with self.app.test_request_context("/api/trees"):
+            conn = self.engine.connect()
+        conn.execute(text("SELECT 1"))
+
+        status = self.monitor.status(self.engine.pool)
+        self.assertEqual(status["checked_out"], 1)
+        self.assertFalse(status["saturated"])
+        self.assertEqual(status["longest_holder"]["endpoint"], "trees_api.list_trees")
+
+        conn.close()
+        status = self.monitor.status(self.engine.pool)
+        self.assertEqual(status["checked_out"], 0)
+        self.assertIsNone(status["longest_holder"])
+
+    @patch('pool_monitor.logger')
+    def test_slow_checkout_names_longest_holder(self, mock_logger):
+        with self.app.test_request_context("/api/trees"):
+            held = self.engine.connect()
+        with self.engine.connect():
+            pass
+        held.close()
+
+        kwargs = mock_logger.warning.call_args.kwargs
+        self.assertEqual(kwargs["engine"], "primary")
+        self.assertEqual(kwargs["longest_holder"], "trees_api.list_trees")
+
+    def test_invalidation_is_counted(self):
+        conn = self.engine.connect()
+        conn.invalidate()
+        conn.close()
+        self.assertEqual(self.monitor.status(self.engine.pool)["invalidations"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+import query_tracker
+from query_tracker import QueryBudgetExceeded, fingerprint
+
+
+class TestQueryTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        query_tracker.attach(self.engine)
+        self.app = Flask(__name__)
+        self.app.after_request(query_tracker.finish_request)
+
+        @self.app.route("/people/<int:n>")
+        def list_people(n):
+            with self.engine.connect() as conn:
+                for i in range(n):
+                    conn.execute(text("SELECT :i"), {"i": i})
+            return "ok"
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_server_timing_reports_statement_count(self):
+        response = self.client.get("/people/3")
+        self.assertIn('desc="3 queries"', response.headers["Server-Timing"])
+
+    @patch('query_tracker.logger')
+    def test_repeated_statement_is_flagged(self, mock_logger):
+        with patch.object(query_tracker.app_config_module.config, "QUERY_REPEAT_THRESHOLD", 3):
+            self.client.get("/people/4")
+        kwargs = mock_logger.warning.call_args.kwargs
+        self.assertEqual(kwargs["repeated_statements"], [{"statement": "SELECT ?", "count": 4}])
+
+    def test_budget_enforced_in_test_mode(self):
+        self.app.testing = True
+        with patch.object(query_tracker.app_config_module.config, "QUERY_BUDGET", 2):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/people/3")
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(fingerprint("SELECT * FROM people WHERE id IN (%(id_1_1)s, %(id_1_2)s)"),
+                         fingerprint("SELECT * FROM people\n WHERE id IN (%(id_1_1)s)"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch, ANY
 import uuid
-from datetime import date
+from datetime import date, datetime
 
 from sqlalchemy.orm import Session as DBSession
 from werkzeug.exceptions import HTTPException, NotFound, BadRequest
@@ -12,8 +12,13 @@ from services.relationship_service import (
     create_relationship_db,
     update_relationship_db,
     # get_relationship_db, # Add if testing get
-    # get_all_relationships_db, # Add if testing get_all
+    get_all_relationships_db,
+    inverse_rows,
+    materialize_inverse_relationships_db,
 )
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import Conflict
+from utils import _decode_keyset_cursor
 # from utils import _get_or_404 # Mocked directly in tests
 
 class TestRelationshipService(unittest.TestCase):
@@ -116,5 +121,125 @@ class TestRelationshipService(unittest.TestCase):
         self.mock_db_session.refresh.assert_called_once_with(mock_existing_relationship)
         self.assertEqual(updated_relationship_dict, mock_existing_relationship.to_dict.return_value)
 
+class TestTreeRelationshipListing(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db_session = MagicMock(spec=DBSession)
+        self.tree_id = uuid.uuid4()
+        self.rows = [MagicMock(spec=Relationship, id=uuid.uuid4(), created_at=datetime(2026, 1, 3 - i)) for i in range(3)]
+        for row in self.rows:
+            row.to_dict.return_value = {"id": str(row.id)}
+        self.version_query = MagicMock()
+        self.version_query.filter.return_value.scalar.return_value = 7
+        self.rel_query = MagicMock()
+        self.rel_query.filter.return_value = self.rel_query
+        self.rel_query.options.return_value = self.rel_query
+        self.rel_query.order_by.return_value.limit.return_value.all.return_value = self.rows
+        self.mock_db_session.query.side_effect = lambda entity: self.rel_query if entity is Relationship else self.version_query
+        self.mock_db_session.execute.return_value.scalar.return_value = 42
+
+    def test_keyset_page_returns_cursor_of_last_row(self):
+        result = get_all_relationships_db(self.mock_db_session, self.tree_id, per_page=2, after="")
+
+        self.assertEqual([item["id"] for item in result["items"]], [str(r.id) for r in self.rows[:2]])
+        self.assertTrue(result["has_next"])
+        self.assertEqual(_decode_keyset_cursor(result["next_cursor"]), (self.rows[1].created_at, self.rows[1].id))
+        self.assertEqual(result["total_items"], 42)
+        self.rel_query.order_by.return_value.limit.assert_called_once_with(3) # One extra row detects the next page
+
+    def test_tree_filter_semi_joins_both_endpoints(self):
+        get_all_relationships_db(self.mock_db_session, uuid.uuid4(), per_page=2, after="")
+        criterion = str(self.rel_query.filter.call_args_list[0].args[0])
+        self.assertEqual(criterion.count("EXISTS"), 2)
+        self.assertIn("relationships.person1_id", criterion)
+        self.assertIn("relationships.person2_id", criterion)
+
+    def test_count_is_cached_per_tree_version(self):
+        get_all_relationships_db(self.mock_db_session, self.tree_id, per_page=2, after="")
+        get_all_relationships_db(self.mock_db_session, self.tree_id, per_page=2, after="")
+        self.assertEqual(self.mock_db_session.execute.call_count, 1)
+
+        self.version_query.filter.return_value.scalar.return_value = 8 # A write bumped the tree version
+        get_all_relationships_db(self.mock_db_session, self.tree_id, per_page=2, after="")
+        self.assertEqual(self.mock_db_session.execute.call_count, 2)
+
+    def test_invalid_cursor_aborts(self):
+        with self.assertRaises(BadRequest):
+            get_all_relationships_db(self.mock_db_session, self.tree_id, per_page=2, after="not-a-cursor")
+
+
+
+class TestInverseRelationships(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db_session = MagicMock(spec=DBSession)
+        self.user_id, self.parent_id, self.child_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        patch('services.relationship_service.bump_tree_versions').start()
+        patch('services.relationship_service.ensure_exist', side_effect=lambda db, model, ids: set(ids)).start()
+        patch.object(__import__('config').config, 'RELATIONSHIP_MATERIALIZE_INVERSE', True).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _sql(self, call_index=0):
+        statement = self.mock_db_session.execute.call_args_list[call_index].args[0]
+        return str(statement.compile(dialect=postgresql.dialect()))
+
+    def test_inverse_rows_swap_people_and_map_types(self):
+        rows = inverse_rows([
+            {"person1_id": self.parent_id, "person2_id": self.child_id, "relationship_type": "biological_parent",
+             "created_by": self.user_id, "start_date": date(2000, 1, 1)},
+            {"person1_id": self.parent_id, "person2_id": self.child_id, "relationship_type": "guardian",
+             "created_by": self.user_id},
+        ])
+        self.assertEqual(len(rows), 1) # guardian has no inverse
+        self.assertEqual((rows[0]["person1_id"], rows[0]["person2_id"], rows[0]["relationship_type"]),
+                         (self.child_id, self.parent_id, RelationshipTypeEnum.biological_child))
+        self.assertEqual(rows[0]["start_date"], date(2000, 1, 1))
+
+    def test_create_inserts_edge_and_inverse_in_one_upsert(self):
+        created = MagicMock(spec=Relationship)
+        created.to_dict.return_value = {"id": "created"}
+        self.mock_db_session.get.return_value = created
+        with patch('services.relationship_service.upsert_relationship_rows',
+                   side_effect=lambda db, rows: [row["id"] for row in rows]) as mock_upsert:
+            result = create_relationship_db(self.mock_db_session, self.user_id, {
+                "person1_id": str(self.parent_id), "person2_id": str(self.child_id), "relationship_type": "biological_parent"})
+
+        self.assertEqual(result, {"id": "created"})
+        edge, inverse = mock_upsert.call_args.args[1]
+        self.assertEqual((edge["person1_id"], edge["relationship_type"]), (self.parent_id, RelationshipTypeEnum.biological_parent))
+        self.assertEqual((inverse["person1_id"], inverse["relationship_type"]), (self.child_id, RelationshipTypeEnum.biological_child))
+        self.mock_db_session.get.assert_called_once_with(Relationship, edge["id"])
+        self.mock_db_session.commit.assert_called_once()
+
+    def test_upsert_statement_ignores_key_conflicts(self):
+        self.mock_db_session.execute.return_value.scalars.return_value = []
+        with self.assertRaises(Conflict):
+            create_relationship_db(self.mock_db_session, self.user_id, {
+                "person1_id": str(self.parent_id), "person2_id": str(self.child_id), "relationship_type": "spouse_current"})
+        self.assertIn("ON CONFLICT ON CONSTRAINT uq_relationship_key_fields DO NOTHING", self._sql())
+        self.mock_db_session.execute.assert_called_once() # Edge and inverse in a single statement
+        self.mock_db_session.commit.assert_not_called()
+
+    def test_backfill_inserts_inverses_set_based_per_keyset_batch(self):
+        source_id = uuid.uuid4()
+        inserted = MagicMock(id=uuid.uuid4(), person1_id=self.child_id, person2_id=self.parent_id)
+        self.mock_db_session.execute.side_effect = [
+            MagicMock(scalars=MagicMock(return_value=[source_id])),
+            MagicMock(all=MagicMock(return_value=[inserted])),
+            MagicMock(scalars=MagicMock(return_value=[])),
+        ]
+
+        self.assertEqual(materialize_inverse_relationships_db(self.mock_db_session, batch_size=10), 1)
+
+        sql = self._sql(1)
+        self.assertIn("INSERT INTO relationships", sql)
+        self.assertIn("SELECT gen_random_uuid()", sql)
+        self.assertIn("ON CONFLICT ON CONSTRAINT uq_relationship_key_fields DO NOTHING", sql)
+        self.assertIn("relationships.id > ", self._sql(2)) # Second batch resumes after the last source id
+        self.assertEqual(self.mock_db_session.commit.call_count, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import uuid
+from unittest.mock import MagicMock
+
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import NotFound
+
+from services.sibling_service import affected_children, get_inferred_siblings_db, refresh_inferred_siblings
+
+
+class TestInferredSiblings(unittest.TestCase):
+
+    def setUp(self):
+        self.parent, self.child, self.other_child = (uuid.uuid4() for _ in range(3))
+        self.db = MagicMock()
+
+    def _sql(self, call_index):
+        statement = self.db.execute.call_args_list[call_index].args[0]
+        return str(statement.compile(dialect=postgresql.dialect()))
+
+    def test_affected_children_follow_edge_direction(self):
+        self.assertEqual(affected_children([
+            (self.parent, self.child, "biological_parent"),
+            (self.other_child, self.parent, "step_child"),
+            (self.parent, self.child, "spouse_current"), # Not a parent edge
+        ]), {self.child, self.other_child})
+
+    def test_refresh_rederives_pairs_with_one_grouped_insert(self):
+        self.db.execute.return_value.scalars.return_value = [self.parent]
+        refresh_inferred_siblings(self.db, [self.child])
+
+        self.assertEqual(self.db.execute.call_count, 3) # Parent lookup, delete, insert
+        self.assertIn("DELETE FROM inferred_siblings", self._sql(1))
+        insert_sql = self._sql(2)
+        self.assertIn("INSERT INTO inferred_siblings", insert_sql)
+        self.assertIn("GROUP BY a.child_id, b.child_id", insert_sql)
+        self.assertIn("FILTER (WHERE a.biological AND b.biological)", insert_sql)
+        self.assertIn("ON CONFLICT (person_id, sibling_id) DO UPDATE", insert_sql)
+        self.db.commit.assert_not_called() # Runs inside the caller's transaction
+
+    def test_refresh_of_child_without_parents_only_clears_its_rows(self):
+        self.db.execute.return_value.scalars.return_value = []
+        self.assertEqual(refresh_inferred_siblings(self.db, [self.child]), 0)
+        self.assertEqual(self.db.execute.call_count, 2)
+        self.assertIn("DELETE FROM inferred_siblings", self._sql(1))
+
+    def test_refresh_without_children_is_a_no_op(self):
+        self.assertEqual(refresh_inferred_siblings(self.db, []), 0)
+        self.db.execute.assert_not_called()
+
+    def test_siblings_require_membership_of_the_active_tree(self):
+        self.db.query.return_value.filter_by.return_value.one_or_none.return_value = None
+        with self.assertRaises(NotFound):
+            get_inferred_siblings_db(self.db, self.child, uuid.uuid4())
+
+    def test_siblings_are_filtered_to_members_of_the_active_tree(self):
+        tree_id = uuid.uuid4()
+        query = self.db.query.return_value
+        query.join.return_value.filter.return_value.order_by.return_value.all.return_value = []
+
+        self.assertEqual(get_inferred_siblings_db(self.db, self.child, tree_id)["items"], [])
+        self.db.query.return_value.filter_by.assert_called_once_with(person_id=self.child, tree_id=tree_id)
+        join_condition = str(query.join.call_args.args[1].compile(dialect=postgresql.dialect()))
+        self.assertIn("person_tree_association.person_id = inferred_siblings.sibling_id", join_condition)
+        self.assertIn("person_tree_association.tree_id =", join_condition)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine, text
+
+from slow_query_log import SlowQueryLog
+
+
+class TestSlowQueryLog(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    @patch('slow_query_log.logger')
+    def test_records_statement_shape_without_values(self, mock_logger):
+        log = SlowQueryLog(threshold_ms=0, max_entries=2, explain=False)
+        log.attach(self.engine)
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT :name, :age"), {"name": "Tendai", "age": 42})
+
+        entry = log.entries()[0]
+        self.assertEqual(entry["statement"], "SELECT ?, ?")
+        self.assertEqual(entry["parameters"], ["str", "int"])
+        self.assertNotIn("Tendai", str(entry))
+        self.assertIsNone(entry["endpoint"])
+
+    @patch('slow_query_log.logger')
+    def test_ring_buffer_is_bounded_and_newest_first(self, mock_logger):
+        log = SlowQueryLog(threshold_ms=0, max_entries=2, explain=False)
+        log.attach(self.engine)
+        with self.engine.connect() as conn:
+            for statement in ("SELECT 1", "SELECT 2", "SELECT 3"):
+                conn.execute(text(statement))
+
+        self.assertEqual([e["statement"] for e in log.entries()], ["SELECT 3", "SELECT 2"])
+
+    def test_fast_statements_are_ignored(self):
+        log = SlowQueryLog(threshold_ms=60_000, max_entries=2, explain=False)
+        log.attach(self.engine)
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual(log.entries(), [])
+
+    def _explained(self, log, statement):
+        engine = MagicMock()
+        conn = engine.connect.return_value.__enter__.return_value
+        conn.exec_driver_sql.return_value.all.return_value = [("Seq Scan on people",)]
+        log._explain_engines[self.engine.url.render_as_string(hide_password=False)] = engine
+        plan = log._explain(self.engine.url, statement, {})
+        return plan, [call.args[0] for call in conn.exec_driver_sql.call_args_list], conn
+
+    def test_explain_is_plain_by_default_and_time_limited(self):
+        log = SlowQueryLog(threshold_ms=0, max_entries=2, explain_timeout_ms=1500)
+        plan, statements, conn = self._explained(log, "SELECT * FROM people")
+        self.assertEqual(plan, ["Seq Scan on people"])
+        self.assertEqual(statements, ["SET LOCAL statement_timeout = 1500", "EXPLAIN (FORMAT TEXT) SELECT * FROM people"])
+        conn.begin.return_value.rollback.assert_called_once()
+
+    def test_analyze_is_opt_in_and_only_for_selects(self):
+        log = SlowQueryLog(threshold_ms=0, max_entries=2, analyze=True)
+        self.assertIn("EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) SELECT 1", self._explained(log, "SELECT 1")[1])
+        self.assertIn("EXPLAIN (FORMAT TEXT) DELETE FROM people", self._explained(log, "DELETE FROM people")[1])
+
+    @patch('slow_query_log.logger')
+    def test_locking_and_volatile_statements_are_not_explained(self, mock_logger):
+        log = SlowQueryLog(threshold_ms=0, max_entries=4)
+        log.attach(self.engine)
+        with patch.object(log, '_schedule_explain') as mock_schedule, self.engine.connect() as conn:
+            conn.execute(text("SELECT 1 /* FOR UPDATE */")) # SQLite has no row locks; the comment carries the clause
+            conn.execute(text("SELECT 2 /* nextval('people_seq') */"))
+            conn.execute(text("SELECT 3"))
+        self.assertEqual(mock_schedule.call_count, 1)
+        self.assertEqual([e["plan"] is None for e in log.entries()], [True, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
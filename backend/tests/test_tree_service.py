@@ -2,7 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch, ANY
 import uuid
 import io
+import json
 
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session as DBSession
 from werkzeug.exceptions import HTTPException, Forbidden, BadRequest
 
@@ -10,8 +12,12 @@ from models import Tree, TreePrivacySettingEnum, PrivacyLevelEnum, TreeAccess #
 from services.tree_service import (
     upload_tree_cover_image_db, 
     create_tree_db, # Added for testing
-    update_tree_db  # Added for testing
+    update_tree_db,  # Added for testing
+    export_tree_ndjson_db,
+    _tree_events_query,
+    _tree_relationships_query
 )
+from services.tree_version_service import bump_tree_versions, get_tree_changes_db, prune_tree_changes_db, TreeVersionCache
 from config import config # For S3 bucket name etc.
 
 class TestTreeService(unittest.TestCase):
@@ -222,5 +228,126 @@ class TestTreeService(unittest.TestCase):
         self.assertNotEqual(mock_tree.cover_image_url, old_key) 
         self.mock_db_session.commit.assert_called_once() 
 
+    # --- Tests for export_tree_ndjson_db ---
+    @patch('services.tree_service._tree_events_query')
+    @patch('services.tree_service._tree_relationships_query')
+    @patch('services.tree_service._tree_people_query')
+    def test_export_tree_ndjson_db_streams_in_batches(self, mock_people_q, mock_rels_q, mock_events_q):
+        self.mock_get_or_404.return_value.to_dict.return_value = {"id": str(self.test_tree_id)}
+        people = [MagicMock(**{"to_dict.return_value": {"id": f"p{i}"}}) for i in range(3)]
+        mock_people_q.return_value.order_by.return_value.yield_per.return_value = iter(people)
+        mock_rels_q.return_value.order_by.return_value.yield_per.return_value = iter([])
+        mock_events_q.return_value.order_by.return_value.yield_per.return_value = iter([])
+
+        chunks = list(export_tree_ndjson_db(self.mock_db_session, self.test_tree_id, batch_size=2))
+
+        mock_people_q.return_value.order_by.return_value.yield_per.assert_called_once_with(2)
+        self.assertEqual(len(chunks), 4) # tree line, two person batches, end line
+        lines = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertEqual([l["type"] for l in lines], ["tree", "person", "person", "person", "end"])
+        self.assertEqual(lines[-1]["data"]["counts"], {"person": 3, "relationship": 0, "event": 0})
+
+    def test_tree_events_query_semi_joins_event_participants(self):
+        query = _tree_events_query(DBSession(), self.test_tree_id)
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("EXISTS (SELECT", sql)
+        self.assertIn("event_participants.event_id = events.id", sql)
+        self.assertNotIn("jsonb_array_elements_text", sql)
+
+    def test_tree_relationships_query_uses_the_shared_two_endpoint_filter(self):
+        query = _tree_relationships_query(DBSession(), self.test_tree_id)
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("person_tree_association.person_id = relationships.person1_id", sql)
+        self.assertIn("person_tree_association.person_id = relationships.person2_id", sql)
+
+    # --- Tests for TreeVersionCache ---
+    def test_tree_version_cache_builds_once_per_version_and_evicts_lru(self):
+        cache = TreeVersionCache(max_entries=2)
+        build = MagicMock(side_effect=["v1", "v2", "other"])
+        self.assertEqual(cache.get_or_build(self.test_tree_id, 1, build), "v1")
+        self.assertEqual(cache.get_or_build(self.test_tree_id, 1, build), "v1")
+        self.assertEqual(cache.get_or_build(self.test_tree_id, 2, build), "v2") # A write bumped the version
+        cache.get_or_build(uuid.uuid4(), 1, build) # Evicts the oldest entry, (tree, 1)
+        self.assertEqual(build.call_count, 3)
+        self.assertEqual(cache.get_or_build(self.test_tree_id, 2, build), "v2")
+
+    # --- Tests for bump_tree_versions ---
+    def test_bump_tree_versions_journals_a_moved_edge_as_delete_in_the_tree_it_left(self):
+        old_tree, new_tree, rel_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        bumped, membership, journal = MagicMock(), MagicMock(), MagicMock()
+        bumped.all.return_value = [(old_tree, 4), (new_tree, 9)]
+        membership.all.return_value = [(rel_id, new_tree)] # Both endpoints are now only in new_tree
+        self.mock_db_session.execute.side_effect = [bumped, membership, journal]
+
+        versions = bump_tree_versions(self.mock_db_session, person_ids=[uuid.uuid4(), uuid.uuid4()],
+                                      changes=[("relationship", rel_id, "upsert")])
+
+        self.assertEqual(versions, {old_tree: 4, new_tree: 9})
+        rows = self.mock_db_session.execute.call_args_list[2].args[1]
+        self.assertEqual({(row["tree_id"], row["operation"]) for row in rows},
+                         {(old_tree, "delete"), (new_tree, "upsert")})
+
+    # --- Tests for get_tree_changes_db ---
+    @patch('services.tree_version_service._get_or_404')
+    def test_get_tree_changes_db_up_to_date_skips_journal(self, mock_get_or_404):
+        mock_get_or_404.return_value = MagicMock(version=7)
+
+        result = get_tree_changes_db(self.mock_db_session, self.test_tree_id, since=7)
+
+        self.assertEqual(result["version"], 7)
+        self.assertEqual(result["changes"], {})
+        self.mock_db_session.execute.assert_not_called()
+
+    @patch('services.tree_version_service._get_or_404')
+    def test_get_tree_changes_db_groups_latest_operations(self, mock_get_or_404):
+        mock_get_or_404.return_value = MagicMock(version=5, journal_min_version=0)
+        person_id, deleted_rel_id = uuid.uuid4(), uuid.uuid4()
+        self.mock_db_session.execute.return_value.all.return_value = [
+            ("person", person_id, "upsert"), ("relationship", deleted_rel_id, "delete"),
+        ]
+        mock_person = MagicMock(**{"to_dict.return_value": {"id": str(person_id)}})
+        self.mock_db_session.query.return_value.filter.return_value.all.return_value = [mock_person]
+
+        result = get_tree_changes_db(self.mock_db_session, self.test_tree_id, since=2)
+
+        self.assertFalse(result["reset_required"])
+        self.assertEqual(result["changes"]["person"], {"upserted": [{"id": str(person_id)}], "deleted": []})
+        self.assertEqual(result["changes"]["relationship"], {"upserted": [], "deleted": [str(deleted_rel_id)]})
+        self.mock_db_session.query.assert_called_once() # Only upserted types are loaded
+
+    @patch('services.tree_version_service._get_or_404')
+    def test_get_tree_changes_db_before_pruned_journal_requires_reset(self, mock_get_or_404):
+        mock_get_or_404.return_value = MagicMock(version=50, journal_min_version=20)
+
+        result = get_tree_changes_db(self.mock_db_session, self.test_tree_id, since=19)
+
+        self.assertTrue(result["reset_required"])
+        self.mock_db_session.execute.assert_not_called()
+
+    def test_prune_tree_changes_db_raises_low_water_marks_per_batch(self):
+        other_tree = uuid.uuid4()
+        first_batch = MagicMock(**{"all.return_value": [(self.test_tree_id, 3), (self.test_tree_id, 5), (other_tree, 2)]})
+        empty_batch = MagicMock(**{"all.return_value": []})
+        self.mock_db_session.execute.side_effect = [first_batch, MagicMock(), empty_batch]
+
+        self.assertEqual(prune_tree_changes_db(self.mock_db_session, retention_days=30, batch_size=3), 3)
+
+        self.assertEqual(sorted(self.mock_db_session.execute.call_args_list[1].args[1], key=lambda p: p["pruned_version"]),
+                         [{"pruned_tree_id": other_tree, "pruned_version": 2},
+                          {"pruned_tree_id": self.test_tree_id, "pruned_version": 5}])
+        self.mock_db_session.commit.assert_called_once()
+
+    @patch('services.tree_version_service._get_or_404')
+    def test_get_tree_changes_db_over_cap_requires_reset(self, mock_get_or_404):
+        mock_get_or_404.return_value = MagicMock(version=50, journal_min_version=0)
+        self.mock_db_session.execute.return_value.all.return_value = [
+            ("person", uuid.uuid4(), "upsert") for _ in range(3)
+        ]
+        with patch.object(config, 'DELTA_SYNC_MAX_CHANGES', 2):
+            result = get_tree_changes_db(self.mock_db_session, self.test_tree_id, since=0)
+
+        self.assertTrue(result["reset_required"])
+        self.assertEqual(result["changes"], {})
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,16 +1,17 @@
 # backend/utils.py
 import re
-import bcrypt
 import time
 import uuid
 import os
 import json
+import base64
+from datetime import datetime
 import structlog
-from typing import Optional, Dict, Any, Tuple, TypeVar, Type, List # Ensure List is imported
-from sqlalchemy.orm import Query, Session as DBSession
-from sqlalchemy import desc, asc, func
+from typing import Optional, Dict, Any, Tuple, TypeVar, Type, List, Iterable, Set # Ensure List is imported
+from sqlalchemy.orm import Query, Session as DBSession, load_only
+from sqlalchemy import desc, asc, event, func, select
 from werkzeug.exceptions import HTTPException
-from flask import abort, request
+from flask import abort, request, g, has_request_context
 from cryptography.fernet import Fernet, InvalidToken 
 from sqlalchemy.exc import IntegrityError, NoResultFound, SQLAlchemyError
 
@@ -57,6 +58,8 @@ def load_encryption_key(env_var_name: str, file_path: str) -> Optional[bytes]:
 # Now import local project modules AFTER load_encryption_key is defined.
 import config as app_config_module
 import extensions # For db_operation_duration_histogram
+import password_hasher
+from password_hasher import PasswordHasherBusy
 
 # Initialize logger for the rest of the module.
 logger = structlog.get_logger(__name__)
@@ -71,15 +74,25 @@ def _validate_password_complexity(password: str) -> None:
     if not re.search(r'[!@#$%^&*()_+=\-[\]{};\':"\\|,.<>/?`~]', password): raise ValueError("Password must contain at least one special character.")
 
 def _hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12)).decode('utf-8')
+    try:
+        return password_hasher.hash_password(password)
+    except PasswordHasherBusy:
+        abort(503, description="Server is busy, please retry shortly.")
+    return "" # Should be unreachable
 
 def _verify_password(plain_password: str, hashed_password: str) -> bool:
     if not plain_password or not hashed_password: return False
     try:
-        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return password_hasher.verify_password(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        abort(503, description="Server is busy, please retry shortly.")
     except Exception as e:
         logger.error("Error during password verification (checkpw)", exc_info=True, error=str(e))
         return False
+    return False # Should be unreachable
+
+def _password_needs_rehash(hashed_password: str) -> bool:
+    return password_hasher.needs_rehash(hashed_password)
 
 # --- Pagination and Sorting Utilities ---
 def apply_sorting(query: Query, model_cls: Type[Any], sort_by: Optional[str], sort_order: Optional[str]) -> Query:
@@ -95,8 +108,11 @@ def apply_sorting(query: Query, model_cls: Type[Any], sort_by: Optional[str], so
 def paginate_query(
     query: Query, model_cls: Type[Any], page: int, per_page: int,
     max_per_page: int = -1, 
-    sort_by: Optional[str] = None, sort_order: Optional[str] = "asc"
+    sort_by: Optional[str] = None, sort_order: Optional[str] = "asc",
+    fields: Optional[List[str]] = None,
+    total_items: Optional[int] = None
 ) -> Dict[str, Any]:
+    """Offset pagination. Pass `total_items` when the caller already knows the count (e.g. cached) to skip COUNT(*)."""
     if max_per_page == -1: # Use config if not overridden
         max_per_page = app_config_module.config.MAX_PAGE_SIZE
 
@@ -105,19 +121,20 @@ def paginate_query(
 
     query_for_sort_count = apply_sorting(query, model_cls, sort_by, sort_order)
     
-    total_items = 0
-    try:
-        # Detach order_by for counting, as it can be slow and is not needed for the count itself.
-        count_query = query_for_sort_count.order_by(None) # type: ignore
-        total_items = count_query.count()
-    except Exception as e:
-        logger.warning(f"Efficient count failed for {model_cls.__name__}, trying with entities: {e}", exc_info=False)
+    if total_items is None:
+        total_items = 0
         try:
-            # Fallback count method for more complex queries
-            total_items = query_for_sort_count.with_entities(func.count()).scalar() # type: ignore
-        except Exception as count_err:
-            logger.error(f"Count query failed for pagination of {model_cls.__name__}: {count_err}", exc_info=True)
-            abort(500, "Error counting items for pagination.")
+            # Detach order_by for counting, as it can be slow and is not needed for the count itself.
+            count_query = query_for_sort_count.order_by(None) # type: ignore
+            total_items = count_query.count()
+        except Exception as e:
+            logger.warning(f"Efficient count failed for {model_cls.__name__}, trying with entities: {e}", exc_info=False)
+            try:
+                # Fallback count method for more complex queries
+                total_items = query_for_sort_count.with_entities(func.count()).scalar() # type: ignore
+            except Exception as count_err:
+                logger.error(f"Count query failed for pagination of {model_cls.__name__}: {count_err}", exc_info=True)
+                abort(500, "Error counting items for pagination.")
 
     offset = (page - 1) * per_page
     items_raw = query_for_sort_count.limit(per_page).offset(offset).all()
@@ -125,7 +142,10 @@ def paginate_query(
     items_list: List[Dict[Any, Any]] = [] # Ensure items_list is always a list of dicts
     if items_raw:
         if hasattr(items_raw[0], 'to_dict') and callable(getattr(items_raw[0], 'to_dict')):
-            items_list = [item.to_dict() for item in items_raw] # type: ignore
+            if fields:
+                items_list = [item.to_dict(fields=fields) for item in items_raw] # type: ignore
+            else:
+                items_list = [item.to_dict() for item in items_raw] # type: ignore
         else:
             logger.warning(f"Model {model_cls.__name__} instances do not have a to_dict method. Pagination items may be incomplete or incorrect.")
             # Attempting a generic conversion; this might not be suitable for all models.
@@ -147,6 +167,18 @@ def paginate_query(
         "sort_by": sort_by, "sort_order": sort_order
     }
 
+def _encode_keyset_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    """Opaque `after` cursor for keyset pagination ordered by (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_keyset_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        created_at_str, item_id_str = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at_str), uuid.UUID(item_id_str)
+    except (ValueError, UnicodeError):
+        abort(400, description={"message": "Validation failed", "details": {"after": "Invalid pagination cursor."}})
+
 def get_pagination_params() -> Tuple[int, int, Optional[str], Optional[str]]:
     # Access pagination defaults from the imported config module
     pagination_defaults = app_config_module.config.PAGINATION_DEFAULTS
@@ -172,6 +204,38 @@ def get_pagination_params() -> Tuple[int, int, Optional[str], Optional[str]]:
     if sort_order not in ["asc", "desc"]: sort_order = "asc"
     return page, per_page, sort_by, sort_order
 
+def get_fields_param() -> Optional[List[str]]:
+    """Parses the sparse fieldset parameter (``?fields=id,first_name,last_name``)."""
+    fields_str = request.args.get('fields', default=None, type=str)
+    if not fields_str:
+        return None
+    fields = [f.strip() for f in fields_str.split(',') if f.strip()]
+    return list(dict.fromkeys(fields)) or None
+
+def get_include_param() -> Optional[List[str]]:
+    """Parses the related-resource include parameter (``?include=relationships,events``)."""
+    include_str = request.args.get('include', default=None, type=str)
+    if not include_str:
+        return None
+    include = [i.strip() for i in include_str.split(',') if i.strip()]
+    return list(dict.fromkeys(include)) or None
+
+def sparse_load_options(model_cls: Type[Any], fields: Optional[List[str]]) -> List[Any]:
+    """
+    Validates a sparse fieldset against the model's columns and returns the loader
+    options that restrict the SELECT list to those columns (plus the primary key).
+    Aborts with 400 if an unknown field is requested.
+    """
+    if not fields:
+        return []
+    allowed = model_cls.sparse_field_names()
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        abort(400, description={"message": "Validation failed",
+                                "details": {"fields": f"Unknown field(s) for {model_cls.__name__}: {', '.join(unknown)}."}})
+    columns = [getattr(model_cls, f) for f in dict.fromkeys(['id'] + list(fields))]
+    return [load_only(*columns)]
+
 # --- Database Utilities ---
 def _handle_sqlalchemy_error(e: SQLAlchemyError, context: str, db: DBSession):
     db.rollback() # Ensure rollback happens first
@@ -203,11 +267,14 @@ def _handle_sqlalchemy_error(e: SQLAlchemyError, context: str, db: DBSession):
         abort(500, description=f"A database error occurred while {context}. Please try again later.")
 
 
-def _get_or_404(db: DBSession, model_cls: Type[Any], model_id: uuid.UUID, tree_id: Optional[uuid.UUID] = None) -> Any:
+def _get_or_404(db: DBSession, model_cls: Type[Any], model_id: uuid.UUID, tree_id: Optional[uuid.UUID] = None,
+                options: Optional[List[Any]] = None) -> Any:
     start_time = time.monotonic()
     obj = None
     try:
         query = db.query(model_cls)
+        if options:
+            query = query.options(*options)
         if tree_id and hasattr(model_cls, 'tree_id'):
              query = query.filter(getattr(model_cls, 'tree_id') == tree_id)
         
@@ -241,3 +308,43 @@ def _get_or_404(db: DBSession, model_cls: Type[Any], model_id: uuid.UUID, tree_i
     # This line should ideally not be reached if aborts are raised correctly.
     # Adding a type hint that matches the expected return type if obj is found.
     return None # Should be unreachable if aborts occur
+
+
+def _existence_cache(model_cls: Type[Any]) -> Set[uuid.UUID]:
+    if not has_request_context():
+        return set() # Celery tasks and scripts get no memo
+    cache = g.setdefault('existence_cache', {})
+    return cache.setdefault(model_cls.__name__, set())
+
+def forget_existence(model_cls: Type[Any], ids: Iterable[uuid.UUID]) -> None:
+    """Drops deleted ids from this request's ensure_exist memo."""
+    _existence_cache(model_cls).difference_update(ids)
+
+@event.listens_for(DBSession, "after_rollback")
+def _clear_existence_cache(session: DBSession) -> None:
+    # Ids confirmed inside a rolled-back transaction (rows it created) may no longer exist
+    if has_request_context():
+        g.pop('existence_cache', None)
+
+def ensure_exist(db: DBSession, model_cls: Type[Any], ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+    """
+    Returns the subset of `ids` that exist as `model_cls` rows. Ids not yet confirmed in
+    this request are checked with a single SELECT id ... WHERE id IN (...), without loading
+    (or decrypting) the rows. Confirmed ids are memoized on `g`; misses are not, so a row
+    created later in the same request is still found.
+    """
+    wanted = {model_id for model_id in ids if model_id}
+    known = _existence_cache(model_cls)
+    unknown = wanted - known
+    if unknown:
+        try:
+            known |= set(db.execute(select(model_cls.id).where(model_cls.id.in_(unknown))).scalars())
+        except SQLAlchemyError as e:
+            _handle_sqlalchemy_error(e, f"checking {model_cls.__name__} existence", db) # This will abort
+    return wanted & known
+
+def ensure_exists_or_404(db: DBSession, model_cls: Type[Any], model_id: uuid.UUID) -> None:
+    """Existence-only counterpart of _get_or_404, for callers that never use the loaded row."""
+    if model_id not in ensure_exist(db, model_cls, [model_id]):
+        logger.warning("Resource not found by ensure_exists_or_404", model_name=model_cls.__name__, model_id=model_id)
+        abort(404, description=f"{model_cls.__name__} with ID {model_id} not found")